@@ -11,6 +11,11 @@ import cv2
 from PIL import Image, ImageTk, ImageDraw, ImageFont
 import math
 
+from Utils.thumbnail_store import ThumbnailStore, fit_image, strip_path, split_preview_strip
+from Utils.file_registry import FileRegistry, canonical_path
+from Utils.jsonio import read_json
+from Utils.snapshot import load_json_or_snapshot
+
 # Import CustomTkinter for modern UI
 try:
     import customtkinter as ctk
@@ -48,6 +53,7 @@ class ThumbnailGridGUI:
         # Paths
         results_dir = config_data['paths']['resultsDirectory']
         self.results_dir = results_dir
+        self.thumbnail_store = ThumbnailStore(os.path.join(results_dir, '.thumbnails'))
 
         # GUI state
         self.hover_popup = None
@@ -64,6 +70,8 @@ class ThumbnailGridGUI:
         self.hover_delay_ms = grid_config.get('hoverDelayMs', 500)
         self.card_padding = grid_config.get('cardPadding', 40)
         self.card_border_padding = grid_config.get('cardBorderPadding', 2)
+        strip_config = config_data.get('settings', {}).get('gui', {}).get('style', {}).get('thumbnail', {}).get('previewStrip', {})
+        self.preview_strip_frame_ms = strip_config.get('frameDelayMs', 250)
 
         # Calculate maximum block width based on screen
         screen_w = master.winfo_screenwidth()
@@ -194,6 +202,10 @@ class ThumbnailGridGUI:
             self.hover_popup.destroy()
             self.hover_popup = None
 
+    def _get_thumbnail_path(self, file_path: str):
+        """Thumbnail path for a file, or None; grids with a thumbnail map override this."""
+        return None
+
     def show_popup(self, file_path, parent_widget):
         """Show popup with preview (video or image)"""
         ext = os.path.splitext(file_path)[1].lower()
@@ -211,25 +223,17 @@ class ThumbnailGridGUI:
             popup.overrideredirect(True)
             popup.attributes('-topmost', True)
 
-            actual_path = image_path
-            if not os.path.exists(image_path):
-                if hasattr(self, '_get_thumbnail_path'):
-                    thumb_path = self._get_thumbnail_path(image_path)
-                    if thumb_path:
-                        actual_path = thumb_path
-                    else:
-                        raise FileNotFoundError(f"File not found: {image_path}")
-                elif hasattr(self, 'thumbnail_map'):
-                    norm_path = os.path.normpath(os.path.abspath(image_path))
-                    thumb_path = self.thumbnail_map.get(norm_path)
-                    if thumb_path and os.path.exists(thumb_path):
-                        actual_path = thumb_path
-                    else:
-                        raise FileNotFoundError(f"File not found: {image_path}")
-                else:
-                    raise FileNotFoundError(f"File not found: {image_path}")
+            max_popup_size = int(max(self.master.winfo_screenwidth(), self.master.winfo_screenheight()) * self.popup_max_screen_fraction)
 
-            img = Image.open(actual_path)
+            # Prefer the large pyramid level over decoding the full original
+            thumb_path = self._get_thumbnail_path(image_path)
+
+            if thumb_path:
+                img = self.thumbnail_store.open_image(thumb_path, max_popup_size)
+            elif os.path.exists(image_path):
+                img = Image.open(image_path)
+            else:
+                raise FileNotFoundError(f"File not found: {image_path}")
 
             try:
                 from PIL import ImageOps
@@ -237,8 +241,6 @@ class ThumbnailGridGUI:
             except Exception:
                 pass
 
-            max_popup_size = int(max(self.master.winfo_screenwidth(), self.master.winfo_screenheight()) * self.popup_max_screen_fraction)
-
             orig_w, orig_h = img.size
             # Scale based on longest side to fill the max popup size
             longest_side = max(orig_w, orig_h)
@@ -265,11 +267,65 @@ class ThumbnailGridGUI:
 
     def show_video_popup(self, video_path, parent_widget):
         """Show popup with video playback"""
+        if self.show_video_popup_strip(video_path, parent_widget):
+            return
         if FFPYPLAYER_AVAILABLE:
             self.show_video_popup_ffpyplayer(video_path, parent_widget)
         else:
             self.show_video_popup_opencv(video_path, parent_widget)
 
+    def show_video_popup_strip(self, video_path, parent_widget) -> bool:
+        """
+        Animate the pre-rendered preview strip for a video, if one exists.
+
+        Frames are decoded and scaled once; the animation only swaps images.
+        Returns False when no strip is available so the caller can fall back
+        to live playback.
+        """
+        thumb_path = self._get_thumbnail_path(video_path)
+        if not thumb_path or not self.thumbnail_store.exists(strip_path(thumb_path)):
+            return False
+
+        try:
+            frames = split_preview_strip(self.thumbnail_store.open_image(strip_path(thumb_path)).convert('RGB'))
+            if not frames:
+                return False
+
+            max_popup_size = int(max(self.master.winfo_screenwidth(), self.master.winfo_screenheight()) * self.popup_max_screen_fraction)
+            orig_w, orig_h = frames[0].size
+            scale = max_popup_size / max(orig_w, orig_h)
+            popup_w = int(orig_w * scale)
+            popup_h = int(orig_h * scale)
+            photos = [ImageTk.PhotoImage(frame.resize((popup_w, popup_h), Image.Resampling.BILINEAR))
+                      for frame in frames]
+
+            popup = tk.Toplevel(self.master)
+            self.hover_popup = popup
+            popup.overrideredirect(True)
+
+            x, y = self.calculate_popup_position(parent_widget, popup_w, popup_h)
+            popup.geometry(f"{popup_w}x{popup_h}+{x}+{y}")
+
+            video_label = tk.Label(popup, bg="black")
+            video_label.pack(fill="both", expand=True)
+            video_label.frames = photos
+
+            def show_frame(index=0):
+                if not (self.hover_popup is popup and popup.winfo_exists()):
+                    return
+                video_label.config(image=photos[index])
+                popup.after(self.preview_strip_frame_ms, show_frame, (index + 1) % len(photos))
+
+            show_frame()
+            return True
+
+        except Exception as e:
+            self.logger.debug(f"Preview strip unavailable for {video_path}: {e}")
+            if self.hover_popup:
+                self.hover_popup.destroy()
+                self.hover_popup = None
+            return False
+
     def show_video_popup_ffpyplayer(self, video_path, parent_widget):
         """Show video popup with audio using ffpyplayer"""
         try:
@@ -437,7 +493,6 @@ class SelectableThumbnailGrid(ThumbnailGridGUI):
         title: str = "Thumbnail Grid"
     ):
         from pathlib import Path
-        import json
 
         # Use CTk window if available
         if CTK_AVAILABLE and not isinstance(master, ctk.CTk):
@@ -454,8 +509,9 @@ class SelectableThumbnailGrid(ThumbnailGridGUI):
         self.thumbnail_map_file = results_dir / 'thumbnail_map.json'
 
         # Store input/processed directories for path translation
-        self.raw_dir = os.path.normpath(os.path.abspath(config_data['paths'].get('rawDirectory', '')))
-        self.processed_dir = os.path.normpath(os.path.abspath(config_data['paths'].get('processedDirectory', '')))
+        self.raw_dir = canonical_path(config_data['paths'].get('rawDirectory', ''))
+        self.processed_dir = canonical_path(config_data['paths'].get('processedDirectory', ''))
+        self.file_registry = FileRegistry.open(results_dir, logger)
 
         self.file_index = self._load_file_index()
         self.thumbnail_map = self._load_thumbnail_map()
@@ -538,26 +594,22 @@ class SelectableThumbnailGrid(ThumbnailGridGUI):
         self._resize_after_id = self.master.after(300, self._render_grid)
 
     def _load_file_index(self) -> dict:
-        import json
         if not self.relationship_file.exists():
             self.logger.warning(f"Relationship file not found: {self.relationship_file}")
             return {}
         try:
-            with open(self.relationship_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
+            data = load_json_or_snapshot(self.relationship_file, self.logger)
             return {int(k): v for k, v in data.get('file_index', {}).items()}
         except Exception as e:
             self.logger.error(f"Error loading file index: {e}")
             return {}
 
     def _load_thumbnail_map(self) -> dict:
-        import json
         if not self.thumbnail_map_file.exists():
             return {}
         try:
-            with open(self.thumbnail_map_file, 'r', encoding='utf-8') as f:
-                raw = json.load(f)
-            return {os.path.normpath(os.path.abspath(k)): v for k, v in raw.items()}
+            raw = read_json(self.thumbnail_map_file)
+            return self.file_registry.index(raw)
         except Exception as e:
             self.logger.error(f"Error loading thumbnail map: {e}")
             return {}
@@ -568,34 +620,27 @@ class SelectableThumbnailGrid(ThumbnailGridGUI):
 
         Handles cases where file_index points to input/ but thumbnail_map uses Processed/ paths.
         """
-        norm_path = os.path.normpath(os.path.abspath(file_path))
-
-        # Try direct lookup first
-        thumb_path = self.thumbnail_map.get(norm_path)
-        if thumb_path and os.path.exists(thumb_path):
+        # Direct lookup by stable file ID (follows renames recorded in the registry)
+        thumb_path = self.thumbnail_map.get(self.file_registry.id_of(file_path))
+        if thumb_path and self.thumbnail_store.exists(thumb_path):
             return thumb_path
 
+        norm_path = canonical_path(file_path)
+
         # Try translating input path to processed path
         if self.raw_dir and self.processed_dir and norm_path.startswith(self.raw_dir):
             translated = norm_path.replace(self.raw_dir, self.processed_dir, 1)
-            thumb_path = self.thumbnail_map.get(translated)
-            if thumb_path and os.path.exists(thumb_path):
+            thumb_path = self.thumbnail_map.get(self.file_registry.id_of(translated))
+            if thumb_path and self.thumbnail_store.exists(thumb_path):
                 return thumb_path
 
         # Try translating processed path to input path
         if self.raw_dir and self.processed_dir and norm_path.startswith(self.processed_dir):
             translated = norm_path.replace(self.processed_dir, self.raw_dir, 1)
-            thumb_path = self.thumbnail_map.get(translated)
-            if thumb_path and os.path.exists(thumb_path):
+            thumb_path = self.thumbnail_map.get(self.file_registry.id_of(translated))
+            if thumb_path and self.thumbnail_store.exists(thumb_path):
                 return thumb_path
 
-        # Try finding by filename only (last resort)
-        filename = os.path.basename(norm_path)
-        for map_path, thumb in self.thumbnail_map.items():
-            if os.path.basename(map_path) == filename:
-                if os.path.exists(thumb):
-                    return thumb
-
         return None
 
     def _build_ui(self):
@@ -1054,13 +1099,9 @@ class SelectableThumbnailGrid(ThumbnailGridGUI):
 
         if thumb_path:
             try:
-                img = Image.open(thumb_path)
+                img = self.thumbnail_store.open_image(thumb_path, size)
                 # Scale to fit inside box (maintain aspect ratio)
-                orig_w, orig_h = img.size
-                scale = min(size / orig_w, size / orig_h)
-                new_w = int(orig_w * scale)
-                new_h = int(orig_h * scale)
-                scaled_img = img.resize((new_w, new_h), Image.Resampling.LANCZOS)
+                scaled_img = fit_image(img, size)
 
                 # Cache the base (non-junk) scaled image
                 if cache_key not in self.image_cache:
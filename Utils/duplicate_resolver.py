@@ -0,0 +1,151 @@
+"""
+Hash-verified duplicate resolution for Media Organizer pipeline.
+
+Steps 13/15 group media files by name+size and by SHA256. Only the hash
+groups say that two files have the same content, so steps 17/19 mark
+duplicates from those. A name+size match alone never marks a file.
+
+A hash group whose recorded sizes disagree is an anomaly: usually a file
+changed after it was hashed. Only those groups are checked against the
+disk. Members whose current size differs from the keeper's are split off
+without reading them, and the rest are byte-compared with the keeper.
+Members that do not match are left alone, and their hash is cleared so
+the next run hashes them again.
+
+Keeper policies (settings.duplicates.keeperPolicy):
+    first          first member in work-list order
+    shortest_name  shortest file name, e.g. IMG_0001.jpg over IMG_0001(1).jpg
+    longest_name   longest file name
+    oldest         earliest modification time
+    most_metadata  most EXIF/filename/FFprobe/JSON entries
+A copy the library index already holds is always kept first.
+"""
+
+import os
+import filecmp
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple
+
+KEEPER_POLICIES = ("first", "shortest_name", "longest_name", "oldest", "most_metadata")
+DEFAULT_KEEPER_POLICY = "shortest_name"
+
+METADATA_LIST_KEYS = ('exif', 'filename', 'ffprobe', 'json')
+
+
+class MediaGrouping(NamedTuple):
+    """Name+size and hash groups of one media type (paths in work-list order)."""
+    by_name_size: Dict[str, List[str]]
+    by_hash: Dict[str, List[str]]
+
+
+class DuplicateGroup(NamedTuple):
+    """Resolution of one hash group."""
+    file_hash: str
+    keeper: str
+    duplicates: List[str]
+    mismatched: List[str]
+
+
+def group_media_files(paths: Iterable[str], metadata: Dict[str, Dict[str, Any]]) -> MediaGrouping:
+    """
+    Group hashed files by name+size and by hash.
+
+    paths must be files that exist; the caller has just stat'ed or hashed
+    them, so they are not checked again.
+    """
+    by_name_size: Dict[str, List[str]] = {}
+    by_hash: Dict[str, List[str]] = {}
+    for path in paths:
+        record = metadata.get(path)
+        if record is None:
+            continue
+        name, size, file_hash = record.get('name'), record.get('size'), record.get('hash')
+        if name and size:
+            by_name_size.setdefault(f"{name}_{size}", []).append(path)
+        if file_hash:
+            by_hash.setdefault(file_hash, []).append(path)
+    return MediaGrouping(by_name_size, by_hash)
+
+
+class DuplicateResolver:
+    """
+    Pick a keeper in each hash group and verify suspicious groups.
+
+    resolve() only yields groups; marking is left to the caller.
+    """
+
+    def __init__(self, metadata: Dict[str, Dict[str, Any]], policy: str = DEFAULT_KEEPER_POLICY,
+                 library_index=None, logger=None):
+        if policy not in KEEPER_POLICIES:
+            if logger:
+                logger.warning(f"Unknown keeper policy '{policy}', using '{DEFAULT_KEEPER_POLICY}'")
+            policy = DEFAULT_KEEPER_POLICY
+        self.metadata = metadata
+        self.policy = policy
+        self.library_index = library_index
+        self.logger = logger
+        self.stats = {"groups": 0, "duplicates": 0, "size_anomalies": 0,
+                      "byte_compared": 0, "mismatched": 0}
+
+    def _keeper_rank(self, path: str):
+        record = self.metadata.get(path) or {}
+        name = record.get('name') or os.path.basename(path)
+        if self.policy == "shortest_name":
+            return len(name)
+        if self.policy == "longest_name":
+            return -len(name)
+        if self.policy == "oldest":
+            try:
+                return os.path.getmtime(path)
+            except OSError:
+                return float('inf')
+        if self.policy == "most_metadata":
+            return -sum(len(record.get(key) or ()) for key in METADATA_LIST_KEYS)
+        return 0
+
+    def select_keeper(self, paths: List[str]) -> str:
+        """Keeper of a group: the library's copy if there is one, otherwise by policy."""
+        if self.library_index is not None:
+            for path in paths:
+                if self.library_index.is_canonical(path):
+                    return path
+        # min() is stable, so ties keep work-list order
+        return min(paths, key=self._keeper_rank)
+
+    def _same_content(self, keeper: str, path: str) -> bool:
+        try:
+            if os.path.getsize(path) != os.path.getsize(keeper):
+                return False
+            self.stats["byte_compared"] += 1
+            return filecmp.cmp(keeper, path, shallow=False)
+        except OSError:
+            return False
+
+    def resolve(self, by_hash: Dict[str, List[str]]) -> Iterator[DuplicateGroup]:
+        """Yield a DuplicateGroup for every hash group with two or more unmarked files."""
+        for file_hash, paths in by_hash.items():
+            members = [p for p in paths
+                       if p in self.metadata and not self.metadata[p].get('marked_for_deletion')]
+            if len(members) < 2:
+                continue
+
+            keeper = self.select_keeper(members)
+            others = [p for p in members if p != keeper]
+            mismatched = []
+            if len({self.metadata[p].get('size') for p in members}) > 1:
+                self.stats["size_anomalies"] += 1
+                verified = []
+                for path in others:
+                    (verified if self._same_content(keeper, path) else mismatched).append(path)
+                others = verified
+                # Stale hashes: let the next run hash these files again
+                for path in mismatched + ([keeper] if mismatched and not others else []):
+                    self.metadata[path]['hash'] = None
+                if mismatched and self.logger:
+                    self.logger.warning(f"Hash {file_hash[:12]}: {len(mismatched)} file(s) differ from "
+                                        f"{os.path.basename(keeper)} despite the same hash, not marked")
+
+            self.stats["mismatched"] += len(mismatched)
+            if others:
+                self.stats["groups"] += 1
+                self.stats["duplicates"] += len(others)
+            yield DuplicateGroup(file_hash, keeper, others, mismatched)
@@ -0,0 +1,155 @@
+"""
+Append-only processing event log for Media Organizer pipeline.
+
+Per-file processing history used to live inside every metadata record, so
+Consolidate_Meta_Results.json grew with each rerun and every stage had to
+parse it. Events now go to processing_history.jsonl in the results
+directory, one JSON object per line, keyed by the stable file ID from
+file_registry.json:
+
+    {"file_id": 42, "step": "convert_media", "status": "success",
+     "message": "Converted from .heic", "timestamp": "2024-01-15T14:30:45"}
+
+Metadata records keep only the latest event in 'processing_status'.
+
+preparation.py registers its log with set_active_event_log() so
+add_processing_history() can reach it without threading a handle through
+every step.
+"""
+
+import json
+import threading
+from collections.abc import Mapping
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Union
+
+EVENT_LOG_FILENAME = "processing_history.jsonl"
+
+_active_log: Optional['EventLog'] = None
+
+
+def set_active_event_log(event_log: Optional['EventLog']) -> None:
+    """Set (or clear, with None) the log used by add_processing_history()."""
+    global _active_log
+    _active_log = event_log
+
+
+def get_active_event_log() -> Optional['EventLog']:
+    return _active_log
+
+
+class EventLog:
+    """Line-delimited JSON event log, opened for append."""
+
+    def __init__(self, log_path: Union[str, Path], logger=None):
+        self.log_path = Path(log_path)
+        self.logger = logger
+        self.log_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._drop_partial_line()
+        self._file = open(self.log_path, 'a', encoding='utf-8')
+        self.events_written = 0
+
+    def _drop_partial_line(self) -> None:
+        """Cut off a partial last line left by a crash so the next event starts on its own line."""
+        try:
+            with open(self.log_path, 'r+b') as f:
+                end = f.seek(0, 2)
+                if end == 0:
+                    return
+                f.seek(end - 1)
+                if f.read(1) == b'\n':
+                    return
+                # Walk back to the last complete line
+                pos = end
+                while pos > 0:
+                    step = min(64 * 1024, pos)
+                    f.seek(pos - step)
+                    newline = f.read(step).rfind(b'\n')
+                    if newline >= 0:
+                        pos = pos - step + newline + 1
+                        break
+                    pos -= step
+                f.truncate(pos)
+            if self.logger:
+                self.logger.warning(f"Dropped {end - pos} bytes of an interrupted event in {self.log_path}")
+        except FileNotFoundError:
+            pass
+
+    @classmethod
+    def open(cls, results_dir: Union[str, Path], logger=None) -> 'EventLog':
+        return cls(Path(results_dir) / EVENT_LOG_FILENAME, logger)
+
+    def append(self, file_id: int, event: Dict[str, Any]) -> None:
+        line = json.dumps({"file_id": file_id, **event}, ensure_ascii=False)
+        with self._lock:
+            self._file.write(line + '\n')
+            self.events_written += 1
+
+    def absorb(self, metadata: Dict[str, Mapping]) -> int:
+        """
+        Move in-record processing_history lists into the log.
+
+        Covers metadata written before the log existed and entries added
+        while a record had no file ID yet. Returns the number of events moved.
+        """
+        moved = 0
+        for record in metadata.values():
+            if not isinstance(record, Mapping) or 'processing_history' not in record:
+                continue
+            file_id = record.get('file_id')
+            if file_id is None:
+                continue
+            history = record['processing_history']
+            if isinstance(history, list):
+                for event in history:
+                    if isinstance(event, Mapping):
+                        self.append(file_id, dict(event))
+                        moved += 1
+                if history and isinstance(history[-1], Mapping) and not record.get('processing_status'):
+                    record['processing_status'] = dict(history[-1])
+            del record['processing_history']
+        return moved
+
+    def flush(self) -> None:
+        with self._lock:
+            try:
+                self._file.flush()
+            except (OSError, ValueError) as e:
+                if self.logger:
+                    self.logger.error(f"Failed to flush event log {self.log_path}: {e}")
+
+    def close(self) -> None:
+        with self._lock:
+            try:
+                self._file.close()
+            except OSError:
+                pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def iter_events(log_path: Union[str, Path], file_id: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+    """Read events from a log, optionally only those of one file."""
+    log_path = Path(log_path)
+    if not log_path.exists():
+        return
+    with open(log_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.endswith('\n'):
+                break  # Partial trailing line from an interrupted write
+            try:
+                event = json.loads(line)
+            except ValueError:
+                continue
+            if file_id is None or event.get('file_id') == file_id:
+                yield event
+
+
+def history_for(results_dir: Union[str, Path], file_id: int) -> List[Dict[str, Any]]:
+    """Full processing history of one file, oldest first."""
+    return list(iter_events(Path(results_dir) / EVENT_LOG_FILENAME, file_id))
@@ -0,0 +1,201 @@
+"""
+Persistent file registry for Media Organizer pipeline.
+
+Every media file gets a stable integer ID the first time a stage sees it.
+IDs are stored in file_registry.json in the results directory and never
+reused, so relationship sets, review results and other outputs that refer to
+files by ID stay valid across runs.
+
+Paths are canonicalised once (absolute, normalised, forward slashes) so the
+same file always maps to the same ID no matter how a stage spelled its path.
+When a file is renamed or converted the ID moves to the new path and the old
+path is kept as an alias, so stale references still resolve.
+
+File format:
+    {
+      "version": 1,
+      "next_id": 3,
+      "files": {"0": "C:/media/a.jpg", "1": "C:/media/b.mp4", ...},
+      "aliases": {"C:/media/a.heic": 0, ...}
+    }
+"""
+
+import os
+import threading
+from collections.abc import Mapping
+from pathlib import Path
+from typing import Any, Dict, Optional, Union
+
+from Utils.utils import FileUtils, PathRenameTrie
+from Utils.jsonio import read_json
+
+REGISTRY_FILENAME = "file_registry.json"
+REGISTRY_VERSION = 1
+
+
+def canonical_path(path: Union[str, Path]) -> str:
+    """Return the canonical spelling of a path (absolute, normalised, forward slashes)."""
+    return os.path.normpath(os.path.abspath(str(path))).replace('\\', '/')
+
+
+class FileRegistry:
+    """
+    Canonical path <-> stable integer ID mapping.
+
+    intern() is the only way IDs are created. Lookups follow rename aliases;
+    interning a path that is only an alias (a new file now lives there) can
+    be told to start a fresh identity instead.
+    """
+
+    def __init__(self, registry_path: Optional[Union[str, Path]] = None, logger=None):
+        self.registry_path = Path(registry_path) if registry_path else None
+        self.logger = logger
+        self._ids: Dict[str, int] = {}
+        self._paths: Dict[int, str] = {}
+        self._aliases: Dict[str, int] = {}
+        self.next_id = 0
+        self._dirty = False
+        self._lock = threading.RLock()
+
+    @classmethod
+    def open(cls, results_dir: Union[str, Path], logger=None) -> 'FileRegistry':
+        """Load the registry from a results directory (empty if not there yet)."""
+        registry = cls(Path(results_dir) / REGISTRY_FILENAME, logger)
+        registry.load()
+        return registry
+
+    def load(self) -> None:
+        if self.registry_path is None or not self.registry_path.exists():
+            return
+        try:
+            data = read_json(self.registry_path)
+            with self._lock:
+                self._paths = {int(k): v for k, v in data.get('files', {}).items()}
+                self._ids = {v: k for k, v in self._paths.items()}
+                self._aliases = {k: int(v) for k, v in data.get('aliases', {}).items()}
+                self.next_id = max(int(data.get('next_id', 0)),
+                                   max(self._paths, default=-1) + 1)
+                self._dirty = False
+        except Exception as e:
+            if self.logger:
+                self.logger.error(f"Failed to load file registry {self.registry_path}: {e}")
+
+    def save(self) -> bool:
+        """Write the registry if it changed since the last load/save."""
+        if self.registry_path is None:
+            return False
+        with self._lock:
+            if not self._dirty and self.registry_path.exists():
+                return True
+            data = {
+                "version": REGISTRY_VERSION,
+                "next_id": self.next_id,
+                "files": {str(k): v for k, v in sorted(self._paths.items())},
+                "aliases": dict(self._aliases),
+            }
+            self._dirty = False
+        ok = FileUtils.atomic_write_json(data, self.registry_path)
+        if not ok and self.logger:
+            self.logger.error(f"Failed to save file registry {self.registry_path}")
+        return ok
+
+    def __len__(self) -> int:
+        return len(self._paths)
+
+    def __contains__(self, path: Union[str, Path]) -> bool:
+        return self.id_of(path) is not None
+
+    def id_of(self, path: Union[str, Path]) -> Optional[int]:
+        """Return the ID for a path (following rename aliases), or None."""
+        key = canonical_path(path)
+        with self._lock:
+            file_id = self._ids.get(key)
+            return file_id if file_id is not None else self._aliases.get(key)
+
+    def path_of(self, file_id: int) -> Optional[str]:
+        """Return the current canonical path for an ID."""
+        return self._paths.get(int(file_id))
+
+    def intern(self, path: Union[str, Path], follow_aliases: bool = True) -> int:
+        """
+        Return the ID for a path, assigning a new one if it is unknown.
+
+        Args:
+            path: File path in any spelling
+            follow_aliases: Resolve a renamed-away path to its old ID. Pass
+                False when a new file was created at the path.
+        """
+        key = canonical_path(path)
+        with self._lock:
+            file_id = self._ids.get(key)
+            if file_id is not None:
+                return file_id
+            if follow_aliases and key in self._aliases:
+                return self._aliases[key]
+            self._aliases.pop(key, None)
+            file_id = self.next_id
+            self.next_id += 1
+            self._ids[key] = file_id
+            self._paths[file_id] = key
+            self._dirty = True
+            return file_id
+
+    def bind(self, file_id: int, new_path: Union[str, Path]) -> None:
+        """Point an existing ID at a new path; the old path becomes an alias."""
+        key = canonical_path(new_path)
+        file_id = int(file_id)
+        with self._lock:
+            old = self._paths.get(file_id)
+            if old == key:
+                return
+            if old is not None:
+                if self._ids.get(old) == file_id:
+                    del self._ids[old]
+                self._aliases[old] = file_id
+            self._aliases.pop(key, None)
+            self._ids[key] = file_id
+            self._paths[file_id] = key
+            self.next_id = max(self.next_id, file_id + 1)
+            self._dirty = True
+
+    def rename(self, old_path: Union[str, Path], new_path: Union[str, Path]) -> int:
+        """Record that a file moved; returns its (unchanged) ID."""
+        file_id = self.intern(old_path)
+        self.bind(file_id, new_path)
+        return file_id
+
+    def apply_renames(self, trie: PathRenameTrie) -> int:
+        """Rewrite every registered path through a rename trie. Returns paths changed."""
+        changed = 0
+        with self._lock:
+            for file_id, path in list(self._paths.items()):
+                new_path = trie.rewrite(path)
+                if new_path != path:
+                    self.bind(file_id, new_path)
+                    changed += 1
+        return changed
+
+    def sync_metadata(self, metadata: Dict[str, Dict[str, Any]]) -> int:
+        """
+        Bring the registry and metadata records in line.
+
+        Records carry their ID in 'file_id', so a record that moved to a new
+        key (rename, conversion) moves its ID with it. Records without an ID
+        get one. Returns the number of records whose ID was assigned.
+        """
+        assigned = 0
+        with self._lock:
+            for path, record in metadata.items():
+                if not isinstance(record, Mapping):
+                    continue
+                file_id = record.get('file_id')
+                if file_id is None:
+                    record['file_id'] = self.intern(path, follow_aliases=False)
+                    assigned += 1
+                elif self._paths.get(int(file_id)) != canonical_path(path):
+                    self.bind(file_id, path)
+        return assigned
+
+    def index(self, mapping: Dict[Union[str, Path], Any]) -> Dict[int, Any]:
+        """Re-key a path-keyed mapping by ID (unknown paths get transient IDs)."""
+        return {self.intern(path): value for path, value in mapping.items()}
@@ -0,0 +1,440 @@
+"""
+Low-level file I/O helpers for Media Organizer pipeline.
+
+Copy helpers that hash data on its way to disk, so files written by the
+pipeline never have to be read back just to compute their digests.
+
+import_file() brings a source file into the output tree as cheaply as the
+filesystem allows: a reflink clone, then a hardlink, then a kernel-side
+copy (copy_file_range/sendfile), and only then a user-space copy. The
+source file is never modified.
+
+sort_for_io() orders a work list by where the files live on disk (inode
+number or first physical extent via FIEMAP), so a pass over a spinning
+disk reads front to back instead of seeking between directories.
+
+The page-cache mode (set_cache_mode) keeps bulk passes from evicting
+everything else on a shared server: "fadvise" marks reads as sequential
+and drops consumed pages (POSIX_FADV_DONTNEED) as the pass moves on,
+"direct" reads with O_DIRECT into an aligned buffer and bypasses the
+cache entirely. read_file_chunks() and the copy helpers honour the mode.
+"""
+
+import os
+import sys
+import mmap
+import errno
+import struct
+import shutil
+import hashlib
+from pathlib import Path
+from typing import BinaryIO, Dict, Iterable, List, Optional, Tuple, Union
+
+DEFAULT_BUFFER_SIZE = 1024 * 1024  # 1 MB
+PARTIAL_HASH_BYTES = 64 * 1024     # Prefix covered by the partial hash
+
+FICLONE = 0x40049409               # Linux ioctl: share extents with another file (btrfs, XFS, ...)
+
+# Import modes, in the order "auto" tries them
+IMPORT_REFLINK = "reflink"
+IMPORT_HARDLINK = "hardlink"
+IMPORT_KERNEL_COPY = "kernel_copy"
+IMPORT_COPY = "copy"
+IMPORT_MODES = (IMPORT_REFLINK, IMPORT_HARDLINK, IMPORT_KERNEL_COPY, IMPORT_COPY)
+
+# Page-cache modes for bulk passes
+CACHE_MODE_NORMAL = "normal"    # Let the kernel cache everything
+CACHE_MODE_FADVISE = "fadvise"  # SEQUENTIAL on open, DONTNEED behind the reader/writer
+CACHE_MODE_DIRECT = "direct"    # O_DIRECT reads (falls back to fadvise where unsupported)
+CACHE_MODES = (CACHE_MODE_NORMAL, CACHE_MODE_FADVISE, CACHE_MODE_DIRECT)
+
+DROP_WINDOW_BYTES = 64 * 1024 * 1024  # Drop cached pages every 64 MB consumed
+DIRECT_IO_ALIGNMENT = 4096
+
+_cache_mode = CACHE_MODE_NORMAL
+
+# Work-list orderings for sort_for_io()
+IO_ORDER_NONE = "none"      # Keep the caller's (directory walk) order
+IO_ORDER_INODE = "inode"    # Sort by inode number (cheap, one stat per file)
+IO_ORDER_EXTENT = "extent"  # Sort by first physical extent (FIEMAP, Linux), inode fallback
+IO_ORDERS = (IO_ORDER_NONE, IO_ORDER_INODE, IO_ORDER_EXTENT)
+
+FS_IOC_FIEMAP = 0xC020660B
+_FIEMAP_HEADER = struct.Struct('=QQIIII')  # start, length, flags, mapped_extents, extent_count, reserved
+_FIEMAP_EXTENT_SIZE = 56                   # logical, physical, length, reserved64[2], flags, reserved[3]
+
+# errno values meaning "this filesystem/kernel can't do that", i.e. try the next mode
+_UNSUPPORTED_ERRNOS = {
+    errno.EXDEV, errno.EOPNOTSUPP, errno.ENOTSUP, errno.ENOSYS, errno.EINVAL,
+    errno.ENOTTY, errno.EPERM, errno.EMLINK, errno.EBADF
+}
+
+
+def set_cache_mode(mode: str) -> str:
+    """
+    Select how bulk reads and copies treat the page cache.
+
+    Returns the effective mode, which degrades to what the platform
+    supports (no posix_fadvise -> normal, no O_DIRECT -> fadvise).
+    """
+    global _cache_mode
+    if mode not in CACHE_MODES:
+        raise ValueError(f"Unknown cache mode: {mode}")
+    if mode == CACHE_MODE_DIRECT and not hasattr(os, 'O_DIRECT'):
+        mode = CACHE_MODE_FADVISE
+    if mode != CACHE_MODE_NORMAL and not hasattr(os, 'posix_fadvise'):
+        mode = CACHE_MODE_NORMAL
+    _cache_mode = mode
+    return mode
+
+
+def get_cache_mode() -> str:
+    """Return the active page-cache mode."""
+    return _cache_mode
+
+
+def _advise(fd: Optional[int], offset: int, length: int, advice_name: str) -> None:
+    if fd is None:
+        return
+    try:
+        os.posix_fadvise(fd, offset, length, getattr(os, advice_name))
+    except (AttributeError, OSError):
+        pass
+
+
+def _fileno(f) -> Optional[int]:
+    try:
+        return f.fileno()
+    except (AttributeError, OSError, ValueError):
+        return None
+
+
+class HashingWriter:
+    """
+    Write-through wrapper that hashes everything written to a file.
+
+    Computes the full digest and, optionally, a partial digest of the first
+    PARTIAL_HASH_BYTES bytes (a cheap prefilter for duplicate detection).
+    With algorithm None it only counts bytes. Outside the normal cache mode
+    the written pages are dropped from the cache every DROP_WINDOW_BYTES.
+    """
+
+    def __init__(self, target: BinaryIO, algorithm: Optional[str] = "sha256", partial: bool = False):
+        self.target = target
+        self.size = 0
+        self._full = hashlib.new(algorithm) if algorithm else None
+        self._partial = hashlib.new(algorithm) if algorithm and partial else None
+        self._fd = _fileno(target) if _cache_mode != CACHE_MODE_NORMAL else None
+        self._dropped = 0
+
+    def write(self, data) -> int:
+        if self._partial is not None and self.size < PARTIAL_HASH_BYTES:
+            self._partial.update(data[:PARTIAL_HASH_BYTES - self.size])
+        if self._full is not None:
+            self._full.update(data)
+        self.size += len(data)
+        written = self.target.write(data)
+        if self._fd is not None and self.size - self._dropped >= DROP_WINDOW_BYTES:
+            self.drop_cache()
+        return written
+
+    def drop_cache(self) -> None:
+        """Drop the written pages that have been written back (dirty pages stay until flushed)."""
+        if self._fd is None:
+            return
+        self.target.flush()
+        _advise(self._fd, 0, 0, 'POSIX_FADV_DONTNEED')
+        self._dropped = self.size
+
+    def digests(self) -> Dict[str, Optional[str]]:
+        """Return {'hash', 'partial_hash', 'size'} for the data written so far."""
+        return {
+            "hash": self._full.hexdigest() if self._full is not None else None,
+            "partial_hash": self._partial.hexdigest() if self._partial is not None else None,
+            "size": self.size
+        }
+
+
+def _read_direct(fd: int, chunk_size: int):
+    """Yield a file's contents read with O_DIRECT into a page-aligned buffer."""
+    size = -(-chunk_size // DIRECT_IO_ALIGNMENT) * DIRECT_IO_ALIGNMENT
+    buffer = mmap.mmap(-1, size)  # Anonymous maps are page aligned
+    try:
+        while True:
+            count = os.readv(fd, [buffer])
+            if count <= 0:
+                break
+            yield buffer[:count]
+            if count < size:
+                break
+    finally:
+        buffer.close()
+
+
+def read_file_chunks(file_path: Union[str, Path], chunk_size: int = DEFAULT_BUFFER_SIZE):
+    """
+    Yield a file's contents in chunks, honouring the page-cache mode.
+
+    In direct mode, files the filesystem cannot open or read with O_DIRECT
+    (tmpfs, some network shares) are read in fadvise mode instead.
+    """
+    mode = _cache_mode
+    if mode == CACHE_MODE_DIRECT:
+        try:
+            fd = os.open(file_path, os.O_RDONLY | os.O_DIRECT)
+        except OSError:
+            mode = CACHE_MODE_FADVISE
+        else:
+            started = False
+            try:
+                for chunk in _read_direct(fd, chunk_size):
+                    started = True
+                    yield chunk
+                return
+            except OSError as e:
+                if started or e.errno != errno.EINVAL:
+                    raise
+                mode = CACHE_MODE_FADVISE
+            finally:
+                os.close(fd)
+
+    with open(file_path, 'rb', buffering=0) as f:
+        fd = f.fileno() if mode != CACHE_MODE_NORMAL else None
+        _advise(fd, 0, 0, 'POSIX_FADV_SEQUENTIAL')
+        offset = dropped = 0
+        try:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    break
+                offset += len(chunk)
+                yield chunk
+                if fd is not None and offset - dropped >= DROP_WINDOW_BYTES:
+                    _advise(fd, dropped, offset - dropped, 'POSIX_FADV_DONTNEED')
+                    dropped = offset
+        finally:
+            _advise(fd, 0, 0, 'POSIX_FADV_DONTNEED')
+
+
+def copy_with_hash(source: BinaryIO, target: BinaryIO, buffer_size: int = DEFAULT_BUFFER_SIZE,
+                   algorithm: str = "sha256", partial: bool = False) -> Dict[str, Optional[str]]:
+    """
+    Copy a stream to a file while hashing it.
+
+    Args:
+        source: Readable binary stream
+        target: Writable binary file
+        buffer_size: Read size in bytes
+        algorithm: hashlib algorithm name
+        partial: Also compute the partial (prefix) hash
+
+    Returns:
+        Dict with 'hash', 'partial_hash' (None unless requested) and 'size'
+    """
+    writer = HashingWriter(target, algorithm, partial)
+    while True:
+        chunk = source.read(buffer_size)
+        if not chunk:
+            break
+        writer.write(chunk)
+    writer.drop_cache()
+    return writer.digests()
+
+
+def compute_partial_hash(file_path, algorithm: str = "sha256") -> Optional[str]:
+    """Hash the first PARTIAL_HASH_BYTES bytes of a file."""
+    try:
+        with open(file_path, 'rb') as f:
+            return hashlib.new(algorithm, f.read(PARTIAL_HASH_BYTES)).hexdigest()
+    except OSError:
+        return None
+
+
+def _reflink(source: Path, dest: Path) -> None:
+    """Clone source into dest sharing the same extents (copy-on-write)."""
+    if sys.platform == 'darwin':
+        import ctypes
+        libc = ctypes.CDLL(None, use_errno=True)
+        if libc.clonefile(os.fsencode(source), os.fsencode(dest), 0) != 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        return
+
+    import fcntl
+    with open(source, 'rb') as src, open(dest, 'wb') as dst:
+        try:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+        except OSError:
+            dst.close()
+            dest.unlink(missing_ok=True)
+            raise
+
+
+def _kernel_copy(source: Path, dest: Path, buffer_size: int) -> None:
+    """Copy inside the kernel with copy_file_range, or sendfile where that is missing."""
+    copy_range = getattr(os, 'copy_file_range', None)
+    sendfile = getattr(os, 'sendfile', None)
+    if copy_range is None and sendfile is None:
+        raise OSError(errno.ENOSYS, "No kernel-side copy available")
+
+    with open(source, 'rb') as src, open(dest, 'wb') as dst:
+        remaining = os.fstat(src.fileno()).st_size
+        chunk = max(buffer_size, 64 * 1024 * 1024)
+        offset = 0
+        try:
+            while remaining > 0:
+                if copy_range is not None:
+                    copied = copy_range(src.fileno(), dst.fileno(), min(chunk, remaining))
+                else:
+                    copied = sendfile(dst.fileno(), src.fileno(), offset, min(chunk, remaining))
+                if copied == 0:
+                    break
+                offset += copied
+                remaining -= copied
+        except OSError:
+            dst.close()
+            dest.unlink(missing_ok=True)
+            raise
+        if remaining > 0:
+            dst.close()
+            dest.unlink(missing_ok=True)
+            raise OSError(errno.EIO, f"Short kernel copy of {source}")
+        if _cache_mode != CACHE_MODE_NORMAL:
+            dst.flush()
+            _advise(src.fileno(), 0, 0, 'POSIX_FADV_DONTNEED')
+            _advise(dst.fileno(), 0, 0, 'POSIX_FADV_DONTNEED')
+
+
+def import_file(source: Union[str, Path], dest: Union[str, Path], mode: str = "auto",
+                buffer_size: int = DEFAULT_BUFFER_SIZE, algorithm: Optional[str] = None,
+                partial: bool = False) -> Tuple[str, Optional[Dict[str, Optional[str]]]]:
+    """
+    Bring source into the output tree at dest without modifying source.
+
+    With mode "auto" the cheapest available method wins: reflink, hardlink,
+    kernel copy, user-space copy. When an algorithm is given, auto skips the
+    kernel copy: it reads every byte anyway, and the user-space copy hashes
+    them on the way, which saves steps 13/15 a second read. Any other
+    IMPORT_MODES value forces that method, falling back to a user-space copy
+    if it is unsupported.
+
+    Args:
+        source: File to import
+        dest: Destination path (replaced if it exists)
+        mode: "auto" or one of IMPORT_MODES
+        buffer_size: Buffer size for the user-space copy
+        algorithm: Hash algorithm for the user-space copy (None = no hashing)
+        partial: Also compute the partial (prefix) hash
+
+    Returns:
+        Tuple of (mode_used, digests). Digests are only available for the
+        user-space copy, since the other methods never read the data.
+    """
+    source, dest = Path(source), Path(dest)
+    if mode == "auto":
+        attempts = (IMPORT_REFLINK, IMPORT_HARDLINK) if algorithm else IMPORT_MODES[:-1]
+    elif mode in IMPORT_MODES:
+        attempts = (mode,) if mode != IMPORT_COPY else ()
+    else:
+        raise ValueError(f"Unknown import mode: {mode}")
+
+    if dest.exists() or dest.is_symlink():
+        dest.unlink()
+
+    for attempt in attempts:
+        try:
+            if attempt == IMPORT_REFLINK:
+                _reflink(source, dest)
+            elif attempt == IMPORT_HARDLINK:
+                os.link(source, dest)
+                return attempt, None  # Same inode: timestamps are already the source's
+            else:
+                _kernel_copy(source, dest, buffer_size)
+            shutil.copystat(source, dest)
+            return attempt, None
+        except OSError as e:
+            if e.errno not in _UNSUPPORTED_ERRNOS:
+                raise
+
+    with open(dest, 'wb') as dst:
+        writer = HashingWriter(dst, algorithm, partial)
+        for chunk in read_file_chunks(source, buffer_size):
+            writer.write(chunk)
+        writer.drop_cache()
+    shutil.copystat(source, dest)
+    return IMPORT_COPY, writer.digests() if algorithm else None
+
+
+def first_extent_offset(file_path: Union[str, Path]) -> Optional[int]:
+    """
+    Return the physical byte offset of a file's first extent (Linux FIEMAP).
+
+    Returns None where FIEMAP is unsupported or the file has no extents
+    (empty or inline data).
+    """
+    try:
+        import fcntl
+    except ImportError:
+        return None
+    request = bytearray(_FIEMAP_HEADER.size + _FIEMAP_EXTENT_SIZE)
+    _FIEMAP_HEADER.pack_into(request, 0, 0, 0xFFFFFFFFFFFFFFFF, 0, 0, 1, 0)
+    try:
+        fd = os.open(file_path, os.O_RDONLY)
+        try:
+            fcntl.ioctl(fd, FS_IOC_FIEMAP, request, True)
+        finally:
+            os.close(fd)
+    except OSError:
+        return None
+    mapped = _FIEMAP_HEADER.unpack_from(request, 0)[3]
+    if not mapped:
+        return None
+    return struct.unpack_from('=Q', request, _FIEMAP_HEADER.size + 8)[0]
+
+
+def sort_for_io(paths: Iterable, mode: str = IO_ORDER_NONE) -> List:
+    """
+    Order paths for a sequential pass over spinning disks.
+
+    Files are grouped by device, then sorted by first physical extent
+    (IO_ORDER_EXTENT) or inode number (IO_ORDER_INODE). Files whose extent
+    cannot be read follow the mapped ones in inode order; files that cannot
+    be stat'ed keep their relative order at the end. Items are returned
+    unchanged (str or Path).
+    """
+    paths = list(paths)
+    if mode == IO_ORDER_NONE or len(paths) < 2:
+        return paths
+    if mode not in IO_ORDERS:
+        raise ValueError(f"Unknown I/O order: {mode}")
+
+    keyed = []
+    for index, path in enumerate(paths):
+        try:
+            st = os.stat(path)
+        except OSError:
+            keyed.append(((1, 0, 0, 0, index), path))
+            continue
+        offset = first_extent_offset(path) if mode == IO_ORDER_EXTENT else None
+        if offset is not None:
+            keyed.append(((0, st.st_dev, 0, offset, index), path))
+        else:
+            keyed.append(((0, st.st_dev, 1, st.st_ino, index), path))
+    keyed.sort(key=lambda item: item[0])
+    return [path for _, path in keyed]
+
+
+def evict_from_cache(file_path: Union[str, Path]) -> bool:
+    """Ask the kernel to drop a file's cached pages (posix_fadvise DONTNEED)."""
+    fadvise = getattr(os, 'posix_fadvise', None)
+    if fadvise is None:
+        return False
+    try:
+        fd = os.open(file_path, os.O_RDONLY)
+        try:
+            fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        finally:
+            os.close(fd)
+        return True
+    except OSError:
+        return False
@@ -0,0 +1,182 @@
+"""
+Streaming JSON output for Media Organizer pipeline result files.
+
+json.dump(obj, indent=2) pads large outputs with whitespace. It also needs
+the whole object, including MediaRecord-to-dict conversions, in memory
+first. stream_json_atomic() instead writes a top-level object or array one
+member at a time. Each member is encoded on its own, and the result goes
+to a temp file that replaces the target only once complete.
+
+Output settings come from settings.io in the config (configure_json_output):
+    jsonIndent   null for compact output, or the indent width
+    compression  "none", "gzip" or "zstd" (zstd needs the zstandard package,
+                 otherwise gzip is used)
+
+Compressed files keep their .json name. read_json() and open_json() detect
+gzip/zstd from the file's magic bytes, so every reader handles both.
+"""
+
+import io
+import os
+import gzip
+import json
+import tempfile
+from collections.abc import Mapping
+from pathlib import Path
+from typing import Any, Iterable, Optional, Tuple, Union
+
+from Utils.media_record import json_default
+
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    zstandard = None
+    ZSTD_AVAILABLE = False
+
+COMPRESSION_NONE = "none"
+COMPRESSION_GZIP = "gzip"
+COMPRESSION_ZSTD = "zstd"
+COMPRESSIONS = (COMPRESSION_NONE, COMPRESSION_GZIP, COMPRESSION_ZSTD)
+
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+_UNSET = object()
+_output = {"indent": None, "compression": COMPRESSION_NONE}
+
+
+def set_json_output(indent: Optional[int] = None, compression: str = COMPRESSION_NONE) -> str:
+    """Set the default indent/compression for stream_json_atomic(). Returns the effective compression."""
+    if compression not in COMPRESSIONS:
+        compression = COMPRESSION_NONE
+    if compression == COMPRESSION_ZSTD and not ZSTD_AVAILABLE:
+        compression = COMPRESSION_GZIP
+    _output["indent"] = indent if indent else None
+    _output["compression"] = compression
+    return compression
+
+
+def configure_json_output(config_data: dict, logger=None) -> str:
+    """Apply settings.io.jsonIndent / settings.io.compression from the config."""
+    io_config = config_data.get('settings', {}).get('io', {})
+    requested = io_config.get('compression', COMPRESSION_NONE)
+    effective = set_json_output(io_config.get('jsonIndent'), requested)
+    if logger and effective != requested:
+        logger.warning(f"io.compression '{requested}' not available, using '{effective}'")
+    return effective
+
+
+def _open_for_write(path: Path, compression: str):
+    if compression == COMPRESSION_GZIP:
+        return gzip.open(path, 'wt', encoding='utf-8', compresslevel=6)
+    if compression == COMPRESSION_ZSTD:
+        raw = open(path, 'wb')
+        writer = zstandard.ZstdCompressor(level=3).stream_writer(raw, closefd=True)
+        return io.TextIOWrapper(writer, encoding='utf-8')
+    return open(path, 'w', encoding='utf-8')
+
+
+def _write_value(f, encoder: json.JSONEncoder, value, pad: str) -> None:
+    for chunk in encoder.iterencode(value):
+        # Raw newlines only occur between tokens; strings have them escaped
+        f.write(chunk.replace('\n', '\n' + pad) if pad else chunk)
+
+
+def _write_members(f, members: Iterable, is_object: bool, indent: Optional[int], default) -> None:
+    if indent:
+        encoder = json.JSONEncoder(ensure_ascii=False, indent=indent, default=default)
+        pad = ' ' * indent
+        first_sep, sep, end = '\n' + pad, ',\n' + pad, '\n'
+        key_sep = ': '
+    else:
+        encoder = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'), default=default)
+        pad = ''
+        first_sep, sep, end = '', ',', ''
+        key_sep = ':'
+
+    f.write('{' if is_object else '[')
+    empty = True
+    for member in members:
+        f.write(first_sep if empty else sep)
+        empty = False
+        if is_object:
+            key, value = member
+            f.write(json.dumps(str(key), ensure_ascii=False) + key_sep)
+        else:
+            value = member
+        _write_value(f, encoder, value, pad)
+    f.write(('' if empty else end) + ('}' if is_object else ']'))
+
+
+def stream_json_atomic(data: Union[Mapping, list, tuple, Iterable[Tuple[str, Any]]],
+                       output_path: Union[str, Path], logger=None,
+                       indent=_UNSET, compression=_UNSET, default=json_default,
+                       items: bool = False, raise_errors: bool = False) -> bool:
+    """
+    Atomically write JSON, streaming the top level member by member.
+
+    Args:
+        data: Mapping (written as an object), list/tuple (array), or with
+            items=True an iterable of (key, value) pairs written as an object
+        output_path: Target file; replaced only after a complete write
+        indent / compression: Override the configured output settings
+        default: json default= hook (MediaRecord by default)
+        raise_errors: Re-raise failures instead of logging and returning False
+    """
+    output_path = Path(output_path)
+    indent = _output["indent"] if indent is _UNSET else indent
+    compression = _output["compression"] if compression is _UNSET else compression
+    if compression == COMPRESSION_ZSTD and not ZSTD_AVAILABLE:
+        compression = COMPRESSION_GZIP
+
+    temp_path = None
+    try:
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        fd, temp_name = tempfile.mkstemp(dir=output_path.parent, prefix=output_path.name + '.', suffix='.tmp')
+        os.close(fd)
+        temp_path = Path(temp_name)
+
+        with _open_for_write(temp_path, compression) as f:
+            if items:
+                _write_members(f, data, True, indent, default)
+            elif isinstance(data, Mapping):
+                _write_members(f, data.items(), True, indent, default)
+            elif isinstance(data, (list, tuple)):
+                _write_members(f, data, False, indent, default)
+            else:
+                _write_value(f, json.JSONEncoder(ensure_ascii=False, indent=indent, default=default), data, '')
+        temp_path.replace(output_path)
+        return True
+    except Exception as e:
+        if temp_path is not None:
+            try:
+                temp_path.unlink()
+            except OSError:
+                pass
+        if raise_errors:
+            raise
+        if logger:
+            logger.error(f"Failed to write {output_path}: {e}")
+        return False
+
+
+def open_json(path: Union[str, Path]):
+    """Open a JSON file for text reading, decompressing gzip/zstd by magic bytes."""
+    path = Path(path)
+    with open(path, 'rb') as f:
+        magic = f.read(4)
+    if magic.startswith(GZIP_MAGIC):
+        return gzip.open(path, 'rt', encoding='utf-8')
+    if magic.startswith(ZSTD_MAGIC):
+        if not ZSTD_AVAILABLE:
+            raise RuntimeError(f"{path} is zstd-compressed; install the zstandard package to read it")
+        raw = open(path, 'rb')
+        return io.TextIOWrapper(zstandard.ZstdDecompressor().stream_reader(raw, closefd=True), encoding='utf-8')
+    return open(path, 'r', encoding='utf-8')
+
+
+def read_json(path: Union[str, Path]):
+    """json.load() a possibly compressed JSON file."""
+    with open_json(path) as f:
+        return json.load(f)
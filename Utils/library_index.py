@@ -0,0 +1,386 @@
+"""
+Persistent library-wide content index for Media Organizer pipeline.
+
+Steps 17/19 only compare files within one run's grouping JSON, so a new
+import is never checked against what earlier imports already organised.
+The library index remembers every kept file across runs:
+
+    library_index.sqlite   content(hash PRIMARY KEY -> canonical file ID,
+                           path, size, partial_hash, mtime_ns, media_type)
+    library_index.bloom    Bloom filter over the sizes and hashes in the
+                           table, so most new files are ruled out without
+                           touching the database
+
+Lookups go size -> hash through the Bloom filter, then one indexed query.
+Deduplicating an import therefore costs time proportional to the new files,
+not to the library. The index also remembers (path, size, mtime) for each
+canonical file, so a file that was hashed in an earlier run is not hashed
+again.
+
+The Bloom file records the database generation it was built from and is
+rebuilt from the table whenever it is missing, stale or over capacity.
+
+One connection is shared by all threads; every method that touches it
+holds the index's lock, so steps running concurrently can share an index.
+"""
+
+import os
+import math
+import struct
+import sqlite3
+import hashlib
+import threading
+from datetime import datetime
+from functools import wraps
+from pathlib import Path
+from typing import Any, Dict, NamedTuple, Optional, Tuple, Union
+
+from Utils.file_registry import canonical_path
+
+INDEX_FILENAME = "library_index.sqlite"
+BLOOM_FILENAME = "library_index.bloom"
+INDEX_VERSION = 1
+
+DEFAULT_EXPECTED_FILES = 1_000_000
+DEFAULT_FALSE_POSITIVE_RATE = 0.01
+
+_SCHEMA = (
+    """CREATE TABLE IF NOT EXISTS content (
+        hash TEXT PRIMARY KEY,
+        file_id INTEGER,
+        path TEXT NOT NULL,
+        size INTEGER NOT NULL,
+        partial_hash TEXT,
+        mtime_ns INTEGER,
+        media_type TEXT,
+        added_at TEXT
+    )""",
+    "CREATE INDEX IF NOT EXISTS content_path ON content(path)",
+    "CREATE INDEX IF NOT EXISTS content_size ON content(size, partial_hash)",
+    "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)",
+)
+
+
+def _locked(method):
+    """Run a LibraryIndex method under the index lock."""
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+class LibraryEntry(NamedTuple):
+    """Canonical copy of a piece of content in the library."""
+    hash: str
+    file_id: Optional[int]
+    path: str
+    size: int
+    partial_hash: Optional[str]
+    media_type: Optional[str]
+
+
+# =============================================================================
+# BLOOM FILTER
+# =============================================================================
+
+class BloomFilter:
+    """
+    Fixed-size Bloom filter stored as a flat bit array.
+
+    Positions come from double hashing a 128-bit BLAKE2b digest of the key.
+    """
+
+    MAGIC = b"MOBLOOM\x01"
+    _HEADER = struct.Struct('<8sIIQQQQ')  # magic, version, hashes, bits, capacity, items, generation
+
+    def __init__(self, capacity: int, false_positive_rate: float = DEFAULT_FALSE_POSITIVE_RATE):
+        capacity = max(int(capacity), 1)
+        self.capacity = capacity
+        self.num_bits = max(64, int(-capacity * math.log(false_positive_rate) / (math.log(2) ** 2)))
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+        self.items = 0
+        self.generation = 0
+
+    def _positions(self, key: str):
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        for i in range(self.num_hashes):
+            yield (h1 + i * h2) % self.num_bits
+
+    def add(self, key: str) -> None:
+        for pos in self._positions(key):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+        self.items += 1
+
+    def __contains__(self, key: str) -> bool:
+        bits = self.bits
+        return all(bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+    def save(self, path: Union[str, Path]) -> None:
+        path = Path(path)
+        temp_path = path.with_suffix(path.suffix + '.tmp')
+        with open(temp_path, 'wb') as f:
+            f.write(self._HEADER.pack(self.MAGIC, INDEX_VERSION, self.num_hashes, self.num_bits,
+                                      self.capacity, self.items, self.generation))
+            f.write(self.bits)
+        temp_path.replace(path)
+
+    @classmethod
+    def load(cls, path: Union[str, Path]) -> Optional['BloomFilter']:
+        """Load a saved filter, or None if it is missing or unreadable."""
+        try:
+            with open(path, 'rb') as f:
+                header = f.read(cls._HEADER.size)
+                (magic, version, num_hashes, num_bits,
+                 capacity, items, generation) = cls._HEADER.unpack(header)
+                if magic != cls.MAGIC or version != INDEX_VERSION:
+                    return None
+                bits = bytearray(f.read())
+        except (OSError, struct.error):
+            return None
+        if len(bits) != (num_bits + 7) // 8:
+            return None
+        bloom = cls.__new__(cls)
+        bloom.capacity = capacity
+        bloom.num_bits = num_bits
+        bloom.num_hashes = num_hashes
+        bloom.bits = bits
+        bloom.items = items
+        bloom.generation = generation
+        return bloom
+
+
+def _size_key(size: int) -> str:
+    return f"s:{size}"
+
+
+def _hash_key(file_hash: str) -> str:
+    return f"h:{file_hash}"
+
+
+# =============================================================================
+# LIBRARY INDEX
+# =============================================================================
+
+class LibraryIndex:
+    """
+    hash -> canonical file index shared by every import into a library.
+
+    add() registers a kept file; lookup() finds the canonical copy of new
+    content. Changes are written with commit(), which also saves the Bloom
+    filter.
+    """
+
+    def __init__(self, directory: Union[str, Path], logger=None, file_registry=None,
+                 expected_files: int = DEFAULT_EXPECTED_FILES,
+                 false_positive_rate: float = DEFAULT_FALSE_POSITIVE_RATE):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.db_path = self.directory / INDEX_FILENAME
+        self.bloom_path = self.directory / BLOOM_FILENAME
+        self.logger = logger
+        self.file_registry = file_registry
+        self.expected_files = expected_files
+        self.false_positive_rate = false_positive_rate
+
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        for statement in _SCHEMA:
+            self._conn.execute(statement)
+        self._conn.execute("INSERT OR IGNORE INTO meta VALUES ('version', ?)", (str(INDEX_VERSION),))
+        self._conn.commit()
+
+        self._dirty = False
+        self.stats = {"lookups": 0, "bloom_negatives": 0, "hits": 0, "stale": 0,
+                      "added": 0, "hashes_reused": 0}
+        self._bloom = self._load_or_rebuild_bloom()
+
+    @classmethod
+    def open(cls, results_dir: Union[str, Path], logger=None, file_registry=None,
+             config_data: Optional[dict] = None) -> 'LibraryIndex':
+        """Open the index named by settings.libraryIndex (default: the results directory)."""
+        library_config = (config_data or {}).get('settings', {}).get('libraryIndex', {})
+        directory = library_config.get('directory') or results_dir
+        if canonical_path(directory) != canonical_path(results_dir):
+            # File IDs are per results directory; a shared index can't resolve them
+            file_registry = None
+        return cls(directory, logger, file_registry,
+                   library_config.get('expectedFiles', DEFAULT_EXPECTED_FILES),
+                   library_config.get('falsePositiveRate', DEFAULT_FALSE_POSITIVE_RATE))
+
+    # -- Bloom filter --------------------------------------------------------
+
+    def _generation(self) -> int:
+        row = self._conn.execute("SELECT value FROM meta WHERE key = 'generation'").fetchone()
+        return int(row[0]) if row else 0
+
+    @_locked
+    def __len__(self) -> int:
+        return self._conn.execute("SELECT COUNT(*) FROM content").fetchone()[0]
+
+    def _load_or_rebuild_bloom(self) -> BloomFilter:
+        bloom = BloomFilter.load(self.bloom_path)
+        if bloom is not None and bloom.generation == self._generation() and bloom.items <= bloom.capacity:
+            return bloom
+        return self._rebuild_bloom()
+
+    @_locked
+    def _rebuild_bloom(self) -> BloomFilter:
+        count = len(self)
+        # Two keys (size, hash) per file, with room to double before the next rebuild
+        bloom = BloomFilter(2 * max(self.expected_files, 2 * count), self.false_positive_rate)
+        for file_hash, size in self._conn.execute("SELECT hash, size FROM content"):
+            bloom.add(_hash_key(file_hash))
+            bloom.add(_size_key(size))
+        bloom.generation = self._generation()
+        try:
+            bloom.save(self.bloom_path)
+        except OSError as e:
+            if self.logger:
+                self.logger.warning(f"Could not save library Bloom filter {self.bloom_path}: {e}")
+        if self.logger:
+            self.logger.info(f"Built library Bloom filter for {count} files "
+                             f"({len(bloom.bits) / (1024 * 1024):.1f} MB)")
+        return bloom
+
+    @_locked
+    def might_contain(self, size: int, file_hash: Optional[str] = None) -> bool:
+        """False means no library file has this size (and hash); True may be a false positive."""
+        if _size_key(size) not in self._bloom:
+            return False
+        return file_hash is None or _hash_key(file_hash) in self._bloom
+
+    # -- Queries -------------------------------------------------------------
+
+    def _entry(self, row) -> LibraryEntry:
+        file_hash, file_id, path, size, partial_hash, media_type = row
+        if file_id is not None and self.file_registry is not None:
+            # The registry follows renames made since the entry was written
+            path = self.file_registry.path_of(file_id) or path
+        return LibraryEntry(file_hash, file_id, path, size, partial_hash, media_type)
+
+    @_locked
+    def get(self, file_hash: str) -> Optional[LibraryEntry]:
+        row = self._conn.execute(
+            "SELECT hash, file_id, path, size, partial_hash, media_type FROM content WHERE hash = ?",
+            (file_hash,)).fetchone()
+        return self._entry(row) if row else None
+
+    @_locked
+    def lookup(self, size: int, file_hash: str, partial_hash: Optional[str] = None) -> Optional[LibraryEntry]:
+        """
+        Return the canonical library copy of some content, or None.
+
+        The size and hash go through the Bloom filter first; most new files
+        stop there. Entries whose file no longer exists are dropped.
+        """
+        self.stats["lookups"] += 1
+        if not self.might_contain(size, file_hash):
+            self.stats["bloom_negatives"] += 1
+            return None
+        entry = self.get(file_hash)
+        if entry is None or entry.size != size:
+            return None
+        if partial_hash and entry.partial_hash and partial_hash != entry.partial_hash:
+            return None
+        if not os.path.exists(entry.path):
+            self.remove(file_hash)
+            self.stats["stale"] += 1
+            return None
+        self.stats["hits"] += 1
+        return entry
+
+    @_locked
+    def cached_hash(self, path: Union[str, Path], size: int, mtime_ns: int) -> Optional[Tuple[str, Optional[str]]]:
+        """(hash, partial_hash) recorded for a canonical file that has not changed since, else None."""
+        if not self.might_contain(size):
+            return None
+        row = self._conn.execute(
+            "SELECT hash, partial_hash FROM content WHERE path = ? AND size = ? AND mtime_ns = ?",
+            (canonical_path(path), size, mtime_ns)).fetchone()
+        if row:
+            self.stats["hashes_reused"] += 1
+        return tuple(row) if row else None
+
+    @_locked
+    def is_canonical(self, path: Union[str, Path]) -> bool:
+        """Whether path is the kept copy of some content in the library."""
+        return self._conn.execute("SELECT 1 FROM content WHERE path = ? LIMIT 1",
+                                  (canonical_path(path),)).fetchone() is not None
+
+    # -- Updates -------------------------------------------------------------
+
+    @_locked
+    def add(self, path: Union[str, Path], file_hash: str, size: int, file_id: Optional[int] = None,
+            partial_hash: Optional[str] = None, media_type: Optional[str] = None) -> LibraryEntry:
+        """
+        Register path as the canonical copy of its content.
+
+        If the content is already in the library under another existing
+        path, nothing changes and that entry is returned.
+        """
+        key = canonical_path(path)
+        existing = self.get(file_hash)
+        if existing is not None and existing.path != key and os.path.exists(existing.path):
+            return existing
+
+        try:
+            mtime_ns = os.stat(key).st_mtime_ns
+        except OSError:
+            mtime_ns = None
+        self._conn.execute(
+            "INSERT OR REPLACE INTO content VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (file_hash, file_id, key, size, partial_hash, mtime_ns, media_type,
+             datetime.now().isoformat()))
+        if existing is None:
+            self._bloom.add(_hash_key(file_hash))
+            self._bloom.add(_size_key(size))
+            self.stats["added"] += 1
+        self._dirty = True
+        return LibraryEntry(file_hash, file_id, key, size, partial_hash, media_type)
+
+    @_locked
+    def remove(self, file_hash: str) -> None:
+        """Forget some content (its Bloom bits stay set until the next rebuild)."""
+        self._conn.execute("DELETE FROM content WHERE hash = ?", (file_hash,))
+        self._dirty = True
+
+    @_locked
+    def commit(self) -> bool:
+        """Write pending changes and the matching Bloom filter."""
+        if not self._dirty:
+            return True
+        try:
+            generation = self._generation() + 1
+            self._conn.execute("INSERT OR REPLACE INTO meta VALUES ('generation', ?)", (str(generation),))
+            self._conn.commit()
+            self._dirty = False
+            if self._bloom.items > self._bloom.capacity:
+                self._bloom = self._rebuild_bloom()
+            else:
+                self._bloom.generation = generation
+                self._bloom.save(self.bloom_path)
+            return True
+        except Exception as e:
+            if self.logger:
+                self.logger.error(f"Failed to commit library index {self.db_path}: {e}")
+            return False
+
+    @_locked
+    def close(self) -> None:
+        self.commit()
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def summary(self) -> Dict[str, Any]:
+        return {"files": len(self), **self.stats}
@@ -0,0 +1,291 @@
+"""
+Compact in-memory metadata records for Media Organizer pipeline.
+
+A metadata entry in Consolidate_Meta_Results.json is a dict with ~20 keys.
+Held as plain dicts, every record carries its own hash table, four mostly
+empty lists and one dict per processing_history entry. MediaRecord stores the
+same fields in __slots__ instead:
+
+- Absent keys are unset slots, so to_dict() gives back exactly the keys that
+  were loaded (keys outside the schema go to a small overflow dict).
+- Empty exif/filename/ffprobe/json/processing_history lists are stored as the
+  shared empty tuple, which reads return as-is. Only writers turn them into
+  real lists: extend_list_field() and add_history().
+- processing_status and legacy processing_history entries are
+  (step, status, message, timestamp) tuples. Step and status names, and
+  enum-like values such as deletion_reason and import_mode, are interned so
+  a million records share one copy.
+
+MediaRecord is a MutableMapping, so existing code keeps using
+record['hash'] = ..., record.get('exif') and 'x' in record. Reading
+record['processing_status'] or record['processing_history'] returns a copy;
+add_processing_history() in preparation.py writes both. Append to the list
+fields with extend_list_field(), not in place: an empty one reads as ().
+"""
+
+import sys
+import gc
+import json
+import time
+import tracemalloc
+from collections.abc import MutableMapping
+from typing import Any, Dict, Iterator, Optional
+
+FIELDS = (
+    "file_id", "name", "hash", "partial_hash", "size", "duration",
+    "original_source_path", "import_mode", "output_drive", "output_path",
+    "is_converted", "original_format", "marked_for_deletion", "deletion_reason",
+    "duplicate_of", "is_corrupt", "is_repaired", "thumbnail_path", "preview_strip", "dhash", "phash",
+    "video_fingerprint", "exif", "filename", "ffprobe", "json", "processing_status", "processing_history",
+)
+LIST_FIELDS = frozenset({"exif", "filename", "ffprobe", "json"})
+INTERNED_FIELDS = frozenset({"import_mode", "output_drive", "original_format", "deletion_reason"})
+HISTORY_KEYS = ("step", "status", "message", "timestamp")
+
+_EMPTY = ()
+_FIELD_SET = frozenset(FIELDS)
+
+
+def _intern(value):
+    return sys.intern(value) if type(value) is str else value
+
+
+def _pack_history_entry(entry):
+    """Tuple form of a history dict with exactly the standard keys; anything else is kept as-is."""
+    if type(entry) is dict and len(entry) == len(HISTORY_KEYS) and all(k in entry for k in HISTORY_KEYS):
+        return (_intern(entry["step"]), _intern(entry["status"]), entry["message"], entry["timestamp"])
+    return entry
+
+
+def _unpack_history_entry(entry):
+    if type(entry) is tuple:
+        return dict(zip(HISTORY_KEYS, entry))
+    return entry
+
+
+class MediaRecord(MutableMapping):
+    """Slot-based metadata record with the same keys and values as the JSON schema."""
+
+    __slots__ = FIELDS + ("_extra",)
+
+    def __init__(self, data: Optional[Dict[str, Any]] = None):
+        self._extra = None
+        if data:
+            for key, value in data.items():
+                self[key] = value
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'MediaRecord':
+        return cls(data)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Return the record in JSON schema form (schema keys first, then extras)."""
+        result = {}
+        for key in FIELDS:
+            try:
+                value = object.__getattribute__(self, key)
+            except AttributeError:
+                continue
+            result[key] = self._export(key, value)
+        if self._extra:
+            result.update(self._extra)
+        return result
+
+    @staticmethod
+    def _export(key: str, value):
+        if key == "processing_status":
+            return _unpack_history_entry(value)
+        if key == "processing_history":
+            return [_unpack_history_entry(e) for e in value] if isinstance(value, (list, tuple)) else value
+        if value is _EMPTY:
+            return []
+        return value
+
+    def extend_list(self, key: str, items) -> None:
+        """Append to a list field, materialising it only when there is something to add."""
+        items = list(items)
+        if not items:
+            return
+        current = getattr(self, key, _EMPTY)
+        if isinstance(current, list):
+            current.extend(items)
+        else:
+            self[key] = [*current, *items]
+
+    def add_history(self, step: str, status: str, message: str, timestamp: str) -> None:
+        """Append a processing_history entry without materialising the list."""
+        history = getattr(self, "processing_history", _EMPTY)
+        entry = (sys.intern(step), sys.intern(status), message, timestamp)
+        if isinstance(history, list):
+            history.append(entry)
+        else:
+            self.processing_history = [entry]
+
+    # -- Mapping protocol ----------------------------------------------------
+
+    def __getitem__(self, key: str):
+        if key in _FIELD_SET:
+            try:
+                value = object.__getattribute__(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+            if key in ("processing_status", "processing_history"):
+                value = self._export(key, value)
+            return value
+        if self._extra and key in self._extra:
+            return self._extra[key]
+        raise KeyError(key)
+
+    def __setitem__(self, key: str, value) -> None:
+        if key in _FIELD_SET:
+            if key in LIST_FIELDS and type(value) is list and not value:
+                value = _EMPTY
+            elif key == "processing_history" and type(value) is list:
+                value = [_pack_history_entry(e) for e in value] if value else _EMPTY
+            elif key == "processing_status":
+                value = _pack_history_entry(value)
+            elif key in INTERNED_FIELDS:
+                value = _intern(value)
+            object.__setattr__(self, key, value)
+        else:
+            if self._extra is None:
+                self._extra = {}
+            self._extra[key] = value
+
+    def __delitem__(self, key: str) -> None:
+        if key in _FIELD_SET:
+            try:
+                object.__delattr__(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+        elif self._extra and key in self._extra:
+            del self._extra[key]
+        else:
+            raise KeyError(key)
+
+    def __contains__(self, key) -> bool:
+        if key in _FIELD_SET:
+            return hasattr(self, key)
+        return bool(self._extra) and key in self._extra
+
+    def __iter__(self) -> Iterator[str]:
+        for key in FIELDS:
+            if hasattr(self, key):
+                yield key
+        if self._extra:
+            yield from self._extra
+
+    def __len__(self) -> int:
+        return sum(1 for key in FIELDS if hasattr(self, key)) + len(self._extra or ())
+
+    def __repr__(self) -> str:
+        return f"MediaRecord({self.to_dict()!r})"
+
+    def __reduce__(self):
+        return (MediaRecord, (self.to_dict(),))
+
+
+def extend_list_field(record, key: str, items) -> None:
+    """Append items to a list field of a MediaRecord or a plain metadata dict."""
+    if isinstance(record, MediaRecord):
+        record.extend_list(key, items)
+    else:
+        record.setdefault(key, []).extend(items)
+
+
+def json_default(obj):
+    """json.dump default= hook that writes MediaRecord as its schema dict."""
+    if isinstance(obj, MediaRecord):
+        return obj.to_dict()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def records_from_json(raw: Dict[str, Any]) -> Dict[str, MediaRecord]:
+    """Convert a loaded metadata dict to MediaRecords in place (frees each dict as it goes)."""
+    for path in list(raw):
+        value = raw[path]
+        if type(value) is dict:
+            raw[path] = MediaRecord.from_dict(value)
+    return raw
+
+
+# =============================================================================
+# MEMORY BENCHMARK
+# =============================================================================
+
+def _sample_metadata(count: int) -> Dict[str, Any]:
+    """Synthetic metadata shaped like a prepared library (EXIF on most files)."""
+    metadata = {}
+    for i in range(count):
+        path = f"D:/media/{i // 1000:04d}/IMG_{i:07d}.jpg"
+        metadata[path] = {
+            "file_id": i,
+            "name": f"IMG_{i:07d}.jpg",
+            "hash": f"{i:064x}",
+            "partial_hash": None,
+            "size": 2_000_000 + i,
+            "duration": None,
+            "original_source_path": f"E:/takeout/{i // 1000:04d}/IMG_{i:07d}.JPG",
+            "import_mode": "reflink",
+            "output_drive": "D:/media",
+            "output_path": path,
+            "is_converted": False,
+            "original_format": None,
+            "marked_for_deletion": i % 10 == 0,
+            "deletion_reason": "exact_duplicate" if i % 10 == 0 else None,
+            "duplicate_of": None,
+            "is_corrupt": False,
+            "is_repaired": False,
+            "thumbnail_path": f"Results/.thumbnails/{i:032x}.jpg",
+            "exif": [{"timestamp": "2024-01-15T14:30:45"}] if i % 4 else [],
+            "filename": [],
+            "ffprobe": [],
+            "json": [],
+            "processing_status": {"step": "expand_metadata", "status": "success", "message": "",
+                                  "timestamp": "2024-01-15T14:31:02.654321"},
+        }
+    return metadata
+
+
+def _traced_bytes(build) -> int:
+    gc.collect()
+    tracemalloc.start()
+    try:
+        baseline = tracemalloc.get_traced_memory()[0]
+        result = build()
+        gc.collect()
+        used = tracemalloc.get_traced_memory()[0] - baseline
+    finally:
+        tracemalloc.stop()
+    del result
+    return used
+
+
+def benchmark_memory(count: int = 100_000) -> Dict[str, Any]:
+    """
+    Compare the memory of count records held as dicts vs MediaRecords.
+
+    Both variants are decoded from the same JSON text, the way
+    load_metadata() reads Consolidate_Meta_Results.json.
+    """
+    text = json.dumps(_sample_metadata(count))
+
+    dict_bytes = _traced_bytes(lambda: json.loads(text))
+    record_bytes = _traced_bytes(lambda: records_from_json(json.loads(text)))
+
+    started = time.monotonic()
+    original = json.loads(text)
+    records = records_from_json(json.loads(text))
+    lossless = all(records[k].to_dict() == v for k, v in original.items())
+    roundtrip_seconds = time.monotonic() - started
+
+    return {
+        "records": count,
+        "dict_bytes": dict_bytes,
+        "record_bytes": record_bytes,
+        "dict_bytes_per_record": round(dict_bytes / count, 1) if count else None,
+        "record_bytes_per_record": round(record_bytes / count, 1) if count else None,
+        "reduction_percent": round(100 * (1 - record_bytes / dict_bytes), 1) if dict_bytes else None,
+        "lossless": lossless,
+        "roundtrip_seconds": round(roundtrip_seconds, 2),
+    }
@@ -0,0 +1,351 @@
+"""
+Perceptual hashes and Hamming-distance search for Media Organizer pipeline.
+
+SHA256 only matches byte-identical files. Resized WhatsApp copies,
+re-encoded Takeout exports and converted JPEGs look the same but hash
+differently. This module gives each image two 64-bit perceptual hashes,
+computed from its existing thumbnail:
+
+    dHash  sign of the horizontal gradient of a 9x8 grayscale copy
+    pHash  low-frequency 8x8 block of the 32x32 DCT, thresholded at its median
+
+The per-image work is one small resize. The gradient, DCT and bit packing
+run with NumPy on the whole batch at once.
+
+Near duplicates are found with multi-index hashing over pHash. Each chunk
+of the hash is indexed in its own sorted table and probed within a small
+sub-radius. The work therefore grows with the number of hashes and
+matches, not with n^2. BK-trees are not used: distances between 64-bit
+hashes cluster around 32, so BK-tree searches visit most of the tree.
+
+Videos are fingerprinted by the pHashes of K evenly spaced frames plus
+their duration. Candidates come from a duration index, and each candidate
+pair is scored by aligning the two frame sequences.
+"""
+
+import math
+from bisect import bisect_right
+from functools import lru_cache
+from itertools import combinations
+from typing import Dict, List, Optional, Sequence, Tuple
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    np = None
+    NUMPY_AVAILABLE = False
+
+HASH_SIZE = 8                 # 8x8 bits = 64-bit hashes
+HASH_BITS = HASH_SIZE * HASH_SIZE
+PHASH_SIZE = HASH_SIZE * 4    # DCT input size
+
+try:
+    _popcount = int.bit_count          # Python 3.10+
+except AttributeError:
+    def _popcount(value: int) -> int:
+        return bin(value).count('1')
+
+
+def hamming(a: int, b: int) -> int:
+    """Number of differing bits between two hashes."""
+    return _popcount(a ^ b)
+
+
+def hash_to_hex(value: int) -> str:
+    return f"{value:016x}"
+
+
+def hex_to_hash(value: str) -> int:
+    return int(value, 16)
+
+
+# =============================================================================
+# HASHING
+# =============================================================================
+
+@lru_cache(maxsize=None)
+def _dct_matrix(n: int):
+    """Orthonormal DCT-II matrix, so DCT(X) = D @ X @ D.T."""
+    k = np.arange(n)[:, None]
+    i = np.arange(n)[None, :]
+    d = np.cos(np.pi * (2 * i + 1) * k / (2 * n)) * np.sqrt(2.0 / n)
+    d[0] /= np.sqrt(2.0)
+    return d.astype(np.float32)
+
+
+def _pack_bits(bits) -> List[int]:
+    """(N, 64) booleans -> N ints, first bit most significant."""
+    packed = np.packbits(bits.reshape(len(bits), -1), axis=1)
+    return [int(v) for v in packed.view('>u8')[:, 0]]
+
+
+def _grayscale(img, size: Tuple[int, int]):
+    from PIL import Image
+
+    if img.mode != 'L':
+        img = img.convert('L')
+    return np.asarray(img.resize(size, Image.Resampling.BILINEAR), dtype=np.float32)
+
+
+def compute_hashes(images: Sequence) -> List[Tuple[int, int]]:
+    """
+    Return (dhash, phash) for each PIL image in a batch.
+
+    Requires NumPy; resizing is done by Pillow.
+    """
+    if not images:
+        return []
+    if not NUMPY_AVAILABLE:
+        raise RuntimeError("Perceptual hashing requires numpy")
+
+    small = np.stack([_grayscale(img, (HASH_SIZE + 1, HASH_SIZE)) for img in images])
+    dhashes = _pack_bits(small[:, :, 1:] > small[:, :, :-1])
+
+    large = np.stack([_grayscale(img, (PHASH_SIZE, PHASH_SIZE)) for img in images])
+    d = _dct_matrix(PHASH_SIZE)
+    low = (d @ large @ d.T)[:, :HASH_SIZE, :HASH_SIZE].reshape(len(images), -1)
+    # The DC term only encodes brightness; leave it out of the median
+    medians = np.median(low[:, 1:], axis=1, keepdims=True)
+    phashes = _pack_bits(low > medians)
+
+    return list(zip(dhashes, phashes))
+
+
+# =============================================================================
+# MULTI-INDEX HASHING
+# =============================================================================
+
+_POPCOUNT_TABLE = None
+
+
+def _popcount64(values):
+    """Per-element popcount of a uint64 array."""
+    global _POPCOUNT_TABLE
+    if hasattr(np, 'bitwise_count'):  # NumPy 2.0+
+        return np.bitwise_count(values)
+    if _POPCOUNT_TABLE is None:
+        _POPCOUNT_TABLE = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+    return _POPCOUNT_TABLE[values.view(np.uint8)].reshape(-1, 8).sum(axis=1)
+
+
+def _flip_masks(width: int, radius: int):
+    """Every width-bit mask with at most radius bits set."""
+    masks = [0]
+    for r in range(1, radius + 1):
+        masks.extend(sum(1 << b for b in bits) for bits in combinations(range(width), r))
+    return np.array(masks, dtype=np.uint64)
+
+
+def _chunk_widths(count: int) -> List[int]:
+    """Split 64 bits into chunks of about log2(count) bits, so buckets hold ~1 hash each."""
+    chunk_bits = min(24, max(8, math.ceil(math.log2(max(count, 2)))))
+    chunks = max(1, HASH_BITS // chunk_bits)
+    return [HASH_BITS // chunks + (1 if k < HASH_BITS % chunks else 0) for k in range(chunks)]
+
+
+def hamming_pairs(hashes, radius: int, block_size: int = 1 << 20):
+    """
+    All pairs of distinct hashes within a Hamming radius (multi-index hashing).
+
+    The 64 bits are split into m chunks, each indexed in its own sorted table.
+    Two hashes within radius agree to within radius // m bits on at least one
+    chunk (pigeonhole), so probing each table with every mask of that many
+    bits finds all candidates. The candidates are then checked on the full hash.
+
+    Args:
+        hashes: uint64 array of distinct hashes
+        radius: Maximum Hamming distance
+
+    Returns:
+        (i, j, distance) arrays with i < j indexing into hashes
+    """
+    hashes = np.asarray(hashes, dtype=np.uint64)
+    count = len(hashes)
+    found_i, found_j, found_d = [], [], []
+    widths = _chunk_widths(count)
+    sub_radius = radius // len(widths)
+
+    shift = 0
+    for width in widths:
+        chunk = (hashes >> np.uint64(shift)) & np.uint64((1 << width) - 1)
+        shift += width
+        order = np.argsort(chunk, kind='stable')
+        # Direct-address bucket table: chunks are at most ~log2(count) bits wide
+        sizes = np.bincount(chunk.astype(np.int64), minlength=1 << width)
+        starts = np.cumsum(sizes) - sizes
+
+        for mask in _flip_masks(width, sub_radius):
+            for block in range(0, count, block_size):
+                queries = np.arange(block, min(block + block_size, count))
+                slot = (chunk[queries] ^ mask).astype(np.int64)
+                counts = sizes[slot]
+                hit = counts > 0
+                queries, slot, counts = queries[hit], slot[hit], counts[hit]
+                total = int(counts.sum())
+                if total == 0:
+                    continue
+                # Expand each query against every member of its bucket
+                first = np.repeat(starts[slot] - (np.cumsum(counts) - counts), counts)
+                members = order[first + np.arange(total)]
+                queries = np.repeat(queries, counts)
+                keep = queries < members
+                queries, members = queries[keep], members[keep]
+                distance = _popcount64(hashes[queries] ^ hashes[members])
+                close = distance <= radius
+                found_i.append(queries[close])
+                found_j.append(members[close])
+                found_d.append(distance[close])
+
+    if not found_i:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty, empty
+    i, j, d = np.concatenate(found_i), np.concatenate(found_j), np.concatenate(found_d)
+    # A pair close on several chunks is found once per chunk
+    _, first = np.unique(i * count + j, return_index=True)
+    return i[first], j[first], d[first].astype(np.int64)
+
+
+def find_near_duplicates(hashes: Dict[int, Tuple[int, int]], phash_radius: int,
+                         dhash_radius: Optional[int] = None) -> Tuple[List[List[int]], List[Tuple[int, int, int]]]:
+    """
+    Group keys whose images are near duplicates.
+
+    Keys with identical pHashes are grouped directly. Distinct pHashes within
+    phash_radius are matched with hamming_pairs(). A match must also have
+    dHashes within dhash_radius (when given), compared between the first key
+    of each pHash. Matches are merged transitively.
+
+    Args:
+        hashes: key -> (dhash, phash)
+
+    Returns:
+        (groups, pairs): groups of two or more keys (sorted), and the matched
+        (key_a, key_b, phash_distance) pairs between distinct pHashes
+    """
+    if not NUMPY_AVAILABLE:
+        raise RuntimeError("Near-duplicate search requires numpy")
+
+    by_phash: Dict[int, List[int]] = {}
+    for key, (_, phash) in hashes.items():
+        by_phash.setdefault(phash, []).append(key)
+    unique = list(by_phash)
+    representatives = [by_phash[phash][0] for phash in unique]
+
+    sets = _DisjointSet()
+    grouped = set()
+    for keys in by_phash.values():
+        if len(keys) > 1:
+            grouped.update(keys)
+            for key in keys[1:]:
+                sets.union(keys[0], key)
+
+    pairs = []
+    ii, jj, dd = hamming_pairs(np.array(unique, dtype=np.uint64), phash_radius)
+    for i, j, distance in zip(ii.tolist(), jj.tolist(), dd.tolist()):
+        a, b = representatives[i], representatives[j]
+        if dhash_radius is not None and hamming(hashes[a][0], hashes[b][0]) > dhash_radius:
+            continue
+        pairs.append((a, b, distance))
+        grouped.update(by_phash[unique[i]])
+        grouped.update(by_phash[unique[j]])
+        sets.union(a, b)
+
+    return sets.groups(grouped), pairs
+
+
+class _DisjointSet:
+    """Union-find over integer keys; the smallest key is the root."""
+
+    def __init__(self):
+        self.parent: Dict[int, int] = {}
+
+    def find(self, x):
+        parent = self.parent
+        root = x
+        while parent.get(root, root) != root:
+            root = parent[root]
+        while parent.get(x, x) != root:
+            parent[x], x = root, parent[x]
+        return root
+
+    def union(self, a, b) -> None:
+        root_a, root_b = self.find(a), self.find(b)
+        if root_a != root_b:
+            self.parent[max(root_a, root_b)] = min(root_a, root_b)
+
+    def groups(self, keys) -> List[List[int]]:
+        groups: Dict[int, List[int]] = {}
+        for key in keys:
+            groups.setdefault(self.find(key), []).append(key)
+        return sorted(sorted(g) for g in groups.values())
+
+
+# =============================================================================
+# VIDEO FINGERPRINTS
+# =============================================================================
+
+def sequence_score(a: Sequence[int], b: Sequence[int], frame_radius: int) -> float:
+    """
+    Alignment score of two frame-hash sequences, from 0.0 to 1.0.
+
+    The longest order-preserving run of frame pairs within frame_radius
+    (LCS with a Hamming tolerance), divided by the shorter length. Skipped
+    frames cost nothing, so a trimmed copy whose frames land between the
+    original's samples still scores on the frames it shares.
+    """
+    if not a or not b:
+        return 0.0
+    previous = [0] * (len(b) + 1)
+    for x in a:
+        current = [0]
+        for j, y in enumerate(b):
+            if _popcount(x ^ y) <= frame_radius:
+                current.append(previous[j] + 1)
+            else:
+                current.append(max(previous[j + 1], current[j]))
+        previous = current
+    return previous[-1] / min(len(a), len(b))
+
+
+def find_similar_videos(fingerprints: Dict[int, Tuple[float, Sequence[int]]], frame_radius: int,
+                        min_score: float, duration_tolerance: float = 2.0,
+                        duration_ratio: float = 0.05) -> Tuple[List[List[int]], List[Tuple[int, int, float]]]:
+    """
+    Group keys whose videos are near duplicates.
+
+    Two videos are candidates when their durations differ by at most
+    max(duration_tolerance seconds, duration_ratio of the longer one). The
+    durations are sorted once, so each video's candidates are a bisected
+    window instead of every other video. Candidates scoring at least
+    min_score with sequence_score() are matched and merged transitively.
+
+    Args:
+        fingerprints: key -> (duration in seconds, frame pHashes)
+
+    Returns:
+        (groups, pairs): groups of two or more keys (sorted), and the matched
+        (key_a, key_b, score) pairs
+    """
+    entries = sorted((float(duration), key, list(frames))
+                     for key, (duration, frames) in fingerprints.items()
+                     if duration is not None and duration > 0 and frames)
+    durations = [entry[0] for entry in entries]
+    keep = max(0.0, 1.0 - duration_ratio)
+
+    sets = _DisjointSet()
+    grouped = set()
+    pairs = []
+    for i, (duration, key, frames) in enumerate(entries):
+        # d_j - d <= max(tolerance, ratio * d_j)  <=>  d_j <= max(d + tolerance, d / (1 - ratio))
+        upper = max(duration + duration_tolerance, duration / keep if keep else math.inf)
+        for j in range(i + 1, bisect_right(durations, upper)):
+            other_key, other_frames = entries[j][1], entries[j][2]
+            score = sequence_score(frames, other_frames, frame_radius)
+            if score >= min_score:
+                a, b = min(key, other_key), max(key, other_key)
+                pairs.append((a, b, round(score, 3)))
+                grouped.update((a, b))
+                sets.union(a, b)
+
+    return sets.groups(grouped), pairs
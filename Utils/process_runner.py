@@ -0,0 +1,308 @@
+"""
+Shared external-process runner for Media Organizer pipeline.
+
+ffprobe, ffmpeg and 7-Zip used to be started with blocking subprocess.run()
+calls, each with its own fixed timeout and its whole stdout buffered. They
+now all go through one ProcessRunner:
+
+- An asyncio event loop on a background thread schedules every job. A
+  semaphore caps how many processes run at once (settings.processes.
+  maxConcurrent), no matter which step or worker thread started them.
+- Every job has its own timeout. A job that times out, or whose future is
+  cancelled, has its process killed and reaped.
+- stdout can be handed to an on_line callback line by line while the
+  process runs instead of being buffered whole.
+- Every process records its wall time and CPU time (user + system, from
+  wait4() on POSIX and GetProcessTimes() on Windows); stats() sums them
+  per tool.
+
+Processes are started with subprocess.Popen and their pipes are read on the
+runner's thread pool: asyncio's own subprocess support reaps children
+itself, which loses their resource usage, and cannot read plain pipes on
+Windows.
+
+open_stream() is for callers that read a process's binary stdout
+themselves (the '7z x -so' extraction stream). Those processes are recorded
+in the stats but take no concurrency slot, since one archive stream may
+open another for a duplicate check.
+"""
+
+import io
+import os
+import sys
+import time
+import asyncio
+import threading
+import contextlib
+import subprocess
+import concurrent.futures
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, NamedTuple, Optional, Sequence, Tuple
+
+if sys.platform == 'win32':
+    import ctypes
+    from ctypes import wintypes
+
+DEFAULT_MAX_CONCURRENT = 4
+
+
+class ProcessResult(NamedTuple):
+    """Outcome of one job."""
+    tool: str
+    returncode: int
+    stdout: str                     # '' when stdout went to on_line
+    stderr: str
+    wall_seconds: float
+    cpu_seconds: Optional[float]    # None where the platform cannot tell
+    timed_out: bool = False
+
+    @property
+    def ok(self) -> bool:
+        return self.returncode == 0 and not self.timed_out
+
+
+def tool_name(executable: Any) -> str:
+    """Stats key for an executable path, e.g. 'C:/ffmpeg/bin/ffmpeg.exe' -> 'ffmpeg'."""
+    return Path(str(executable)).stem.lower()
+
+
+def _kill(proc: subprocess.Popen) -> None:
+    try:
+        proc.kill()
+    except OSError:
+        pass
+
+
+def _windows_cpu_seconds(proc: subprocess.Popen) -> Optional[float]:
+    try:
+        creation, exited, kernel, user = (wintypes.FILETIME() for _ in range(4))
+        if not ctypes.windll.kernel32.GetProcessTimes(
+                wintypes.HANDLE(int(proc._handle)), ctypes.byref(creation), ctypes.byref(exited),
+                ctypes.byref(kernel), ctypes.byref(user)):
+            return None
+        # FILETIME counts 100 ns ticks
+        return sum((t.dwHighDateTime << 32) | t.dwLowDateTime for t in (kernel, user)) / 1e7
+    except Exception:
+        return None
+
+
+def _reap(proc: subprocess.Popen) -> Tuple[int, Optional[float]]:
+    """Wait for a process to exit. Returns (returncode, CPU seconds or None)."""
+    if hasattr(os, 'wait4'):
+        try:
+            _, status, usage = os.wait4(proc.pid, 0)
+        except ChildProcessError:
+            # Already reaped through the Popen object
+            return proc.wait(), None
+        proc.returncode = -os.WTERMSIG(status) if os.WIFSIGNALED(status) else os.WEXITSTATUS(status)
+        return proc.returncode, usage.ru_utime + usage.ru_stime
+    returncode = proc.wait()
+    return returncode, _windows_cpu_seconds(proc) if sys.platform == 'win32' else None
+
+
+def _read_text(pipe, on_line: Optional[Callable[[str], None]]) -> str:
+    """Read a text pipe to EOF, buffered or line by line."""
+    with io.TextIOWrapper(pipe, encoding='utf-8', errors='replace') as text:
+        if on_line is None:
+            return text.read()
+        error = None
+        for line in text:
+            if error is None:
+                try:
+                    on_line(line.rstrip('\n'))
+                except Exception as e:
+                    # Keep draining so the process never blocks on a full pipe
+                    error = e
+        if error is not None:
+            raise error
+        return ''
+
+
+class ProcessStream:
+    """A running process whose stdout the caller reads (see ProcessRunner.open_stream)."""
+
+    def __init__(self, proc: subprocess.Popen):
+        self._proc = proc
+        self.stdout = proc.stdout
+        self.returncode: Optional[int] = None
+        self.cpu_seconds: Optional[float] = None
+
+    def wait(self) -> int:
+        if self.returncode is None:
+            self.returncode, self.cpu_seconds = _reap(self._proc)
+        return self.returncode
+
+
+class ProcessRunner:
+    """
+    Run external tools with a shared concurrency limit, timeouts and statistics.
+
+    run() blocks the calling thread until the job is done; submit() returns a
+    concurrent.futures.Future whose cancel() kills the process. Both are safe
+    to call from any thread except the runner's own loop thread. on_line
+    callbacks run on the runner's thread pool.
+
+    Args:
+        max_concurrent: Processes allowed to run at once
+        logger: Optional logger for timeouts
+    """
+
+    def __init__(self, max_concurrent: int = DEFAULT_MAX_CONCURRENT, logger=None):
+        self.max_concurrent = max(1, int(max_concurrent))
+        self.logger = logger
+        # stdout reader, stderr reader and reaper for every running job
+        self._pool = concurrent.futures.ThreadPoolExecutor(max_workers=3 * self.max_concurrent,
+                                                           thread_name_prefix="process-io")
+        self._loop = asyncio.new_event_loop()
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._thread = threading.Thread(target=self._loop.run_forever, name="process-runner", daemon=True)
+        self._thread.start()
+        self._stats_lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, Any]] = {}
+
+    def submit(self, cmd: Sequence[Any], timeout: Optional[float] = None,
+               on_line: Optional[Callable[[str], None]] = None,
+               tool: Optional[str] = None) -> concurrent.futures.Future:
+        """Queue a job; it starts once a concurrency slot is free."""
+        return asyncio.run_coroutine_threadsafe(self.run_async(cmd, timeout, on_line, tool), self._loop)
+
+    def run(self, cmd: Sequence[Any], timeout: Optional[float] = None,
+            on_line: Optional[Callable[[str], None]] = None, tool: Optional[str] = None) -> ProcessResult:
+        """
+        Run a command to completion.
+
+        Args:
+            cmd: Executable and arguments
+            timeout: Seconds before the process is killed (None = no limit);
+                a killed job returns with timed_out set
+            on_line: Called with each stdout line (without the newline)
+                instead of buffering stdout
+            tool: Stats key (default: executable name)
+
+        Raises:
+            OSError: The executable could not be started
+        """
+        return self.submit(cmd, timeout, on_line, tool).result()
+
+    async def run_async(self, cmd: Sequence[Any], timeout: Optional[float] = None,
+                        on_line: Optional[Callable[[str], None]] = None,
+                        tool: Optional[str] = None) -> ProcessResult:
+        """Coroutine form of run(); must be awaited on the runner's loop."""
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_concurrent)
+        async with self._slots:
+            return await self._run_job([str(c) for c in cmd], timeout, on_line, tool or tool_name(cmd[0]))
+
+    async def _run_job(self, cmd, timeout, on_line, tool) -> ProcessResult:
+        loop = asyncio.get_running_loop()
+        started = time.monotonic()
+        proc = subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        out_task = loop.run_in_executor(self._pool, _read_text, proc.stdout, on_line)
+        err_task = loop.run_in_executor(self._pool, _read_text, proc.stderr, None)
+        reap_task = loop.run_in_executor(self._pool, _reap, proc)
+
+        timed_out = cancelled = False
+        try:
+            await asyncio.wait_for(asyncio.shield(reap_task), timeout)
+        except asyncio.TimeoutError:
+            timed_out = True
+        except asyncio.CancelledError:
+            cancelled = True
+        if not reap_task.done():
+            _kill(proc)
+        returncode, cpu_seconds = await reap_task
+        stdout, stderr = await asyncio.gather(out_task, err_task, return_exceptions=True)
+        wall_seconds = time.monotonic() - started
+
+        self._record(tool, returncode, wall_seconds, cpu_seconds, timed_out, cancelled)
+        if timed_out and self.logger:
+            self.logger.warning(f"{tool} killed after {timeout}s: {' '.join(cmd[1:])}")
+        if cancelled:
+            raise asyncio.CancelledError()
+        for output in (stdout, stderr):
+            if isinstance(output, BaseException):
+                raise output
+        return ProcessResult(tool, returncode, stdout, stderr, wall_seconds, cpu_seconds, timed_out)
+
+    @contextlib.contextmanager
+    def open_stream(self, cmd: Sequence[Any], tool: Optional[str] = None) -> Iterator[ProcessStream]:
+        """
+        Start a process whose binary stdout the caller reads itself.
+
+        On exit the process is killed if the caller did not wait() for it,
+        then reaped and recorded like any other job.
+        """
+        cmd = [str(c) for c in cmd]
+        started = time.monotonic()
+        proc = subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                                stderr=subprocess.DEVNULL)
+        stream = ProcessStream(proc)
+        try:
+            yield stream
+        finally:
+            proc.stdout.close()
+            killed = stream.returncode is None
+            if killed:
+                _kill(proc)
+            stream.wait()
+            self._record(tool or tool_name(cmd[0]), stream.returncode, time.monotonic() - started,
+                         stream.cpu_seconds, cancelled=killed)
+
+    def _record(self, tool: str, returncode: int, wall_seconds: float, cpu_seconds: Optional[float],
+                timed_out: bool = False, cancelled: bool = False) -> None:
+        with self._stats_lock:
+            entry = self._stats.setdefault(tool, {
+                "runs": 0, "failed": 0, "timed_out": 0, "cancelled": 0,
+                "wall_seconds": 0.0, "cpu_seconds": 0.0, "max_wall_seconds": 0.0
+            })
+            entry["runs"] += 1
+            if timed_out:
+                entry["timed_out"] += 1
+            elif cancelled:
+                entry["cancelled"] += 1
+            elif returncode != 0:
+                entry["failed"] += 1
+            entry["wall_seconds"] += wall_seconds
+            entry["cpu_seconds"] += cpu_seconds or 0.0
+            entry["max_wall_seconds"] = max(entry["max_wall_seconds"], wall_seconds)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Per-tool run counts and summed wall/CPU seconds.
+
+        'cancelled' counts processes killed before they finished: cancelled
+        jobs and streams closed without waiting for the process.
+        """
+        with self._stats_lock:
+            return {tool: {key: round(value, 3) if isinstance(value, float) else value
+                           for key, value in entry.items()}
+                    for tool, entry in sorted(self._stats.items())}
+
+    def close(self) -> None:
+        """Stop the loop thread. Jobs still running are abandoned."""
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=5)
+        self._pool.shutdown(wait=False)
+
+
+_runner: Optional[ProcessRunner] = None
+_runner_lock = threading.Lock()
+
+
+def configure_process_runner(max_concurrent: int = DEFAULT_MAX_CONCURRENT, logger=None) -> ProcessRunner:
+    """Replace the shared runner; call before the pipeline starts any job."""
+    global _runner
+    with _runner_lock:
+        if _runner is not None:
+            _runner.close()
+        _runner = ProcessRunner(max_concurrent, logger)
+        return _runner
+
+
+def get_process_runner() -> ProcessRunner:
+    """Return the shared runner, creating a default one on first use."""
+    global _runner
+    with _runner_lock:
+        if _runner is None:
+            _runner = ProcessRunner()
+        return _runner
@@ -0,0 +1,208 @@
+"""
+Binary snapshots of large result JSON files for Media Organizer pipeline.
+
+json.load() of Consolidate_Meta_Results.json has to parse every record
+before a stage can show anything. A snapshot (<name>.snap next to the JSON)
+holds the same top-level mapping as length-prefixed records with a sorted
+key index, so readers memory-map it, open it in constant time and decode
+only the records they touch. The JSON stays the interchange/export format;
+snapshots are a cache and are rebuilt whenever they fall out of date.
+
+Layout (little-endian):
+    header   MAGIC(8) version(u32) reserved(u32) source_mtime_ns(i64)
+             source_size(i64) count(u64) index_offset(u64)
+    records  compact UTF-8 JSON of each value, back to back
+    index    count x (key_offset u64, key_len u32, value_offset u64, value_len u32),
+             sorted by UTF-8 key bytes
+    keys     UTF-8 keys, back to back (key_offset is relative to here)
+
+A snapshot is fresh when the source JSON's mtime and size match the header.
+"""
+
+import os
+import json
+import mmap
+import struct
+from collections.abc import Mapping
+from pathlib import Path
+from typing import Any, Dict, Iterator, Optional, Union
+
+from Utils.media_record import json_default
+from Utils.jsonio import read_json
+
+MAGIC = b"MOSNAP\x00\x01"
+SNAPSHOT_VERSION = 1
+SNAPSHOT_SUFFIX = ".snap"
+
+_HEADER = struct.Struct('<8sIIqqQQ')
+_ENTRY = struct.Struct('<QIQI')
+
+
+def snapshot_path(json_path: Union[str, Path]) -> Path:
+    """Snapshot location for a JSON file (same name, .snap suffix)."""
+    return Path(json_path).with_suffix(SNAPSHOT_SUFFIX)
+
+
+def _source_signature(json_path: Union[str, Path]):
+    st = os.stat(json_path)
+    return st.st_mtime_ns, st.st_size
+
+
+def write_snapshot(data: Dict[str, Any], snap_path: Union[str, Path],
+                   source_path: Union[str, Path], logger=None, source_signature=None) -> bool:
+    """
+    Write a snapshot of a top-level JSON object.
+
+    Args:
+        data: Mapping that was (or is about to be) saved as source_path
+        snap_path: Snapshot file to write (replaced atomically)
+        source_path: The JSON file the snapshot mirrors
+        source_signature: (mtime_ns, size) of source_path as it was read;
+            taken now if not given
+    """
+    snap_path = Path(snap_path)
+    temp_path = snap_path.with_suffix(snap_path.suffix + '.tmp')
+    try:
+        mtime_ns, size = source_signature or _source_signature(source_path)
+        keys = sorted((str(k).encode('utf-8'), k) for k in data)
+
+        entries = []
+        key_blob = bytearray()
+        with open(temp_path, 'wb') as f:
+            f.write(b'\0' * _HEADER.size)
+            offset = _HEADER.size
+            for key_bytes, key in keys:
+                value = json.dumps(data[key], ensure_ascii=False, separators=(',', ':'),
+                                   default=json_default).encode('utf-8')
+                f.write(value)
+                entries.append((len(key_blob), len(key_bytes), offset, len(value)))
+                key_blob += key_bytes
+                offset += len(value)
+
+            index_offset = offset
+            f.write(b''.join(_ENTRY.pack(*entry) for entry in entries))
+            f.write(key_blob)
+            f.seek(0)
+            f.write(_HEADER.pack(MAGIC, SNAPSHOT_VERSION, 0, mtime_ns, size, len(entries), index_offset))
+        temp_path.replace(snap_path)
+        return True
+    except Exception as e:
+        if logger:
+            logger.error(f"Failed to write snapshot {snap_path}: {e}")
+        try:
+            temp_path.unlink()
+        except OSError:
+            pass
+        return False
+
+
+class SnapshotReader(Mapping):
+    """
+    Read-only, lazily decoded view of a snapshot.
+
+    Lookups binary-search the mapped index; each value is decoded from JSON
+    on first access and cached.
+    """
+
+    def __init__(self, snap_path: Union[str, Path]):
+        self.snap_path = Path(snap_path)
+        self._file = open(self.snap_path, 'rb')
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            (magic, version, _, self.source_mtime_ns, self.source_size,
+             self._count, index_offset) = _HEADER.unpack_from(self._map, 0)
+            if magic != MAGIC or version != SNAPSHOT_VERSION:
+                raise ValueError(f"Not a version {SNAPSHOT_VERSION} snapshot: {self.snap_path}")
+            self._index_offset = index_offset
+            self._keys_offset = index_offset + self._count * _ENTRY.size
+            if self._keys_offset > len(self._map):
+                raise ValueError(f"Truncated snapshot: {self.snap_path}")
+        except Exception:
+            self.close()
+            raise
+        self._cache: Dict[str, Any] = {}
+
+    @classmethod
+    def open_if_fresh(cls, snap_path: Union[str, Path],
+                      source_path: Union[str, Path]) -> Optional['SnapshotReader']:
+        """Open the snapshot if it exists and matches source_path, else None."""
+        try:
+            reader = cls(snap_path)
+        except (OSError, ValueError, struct.error):
+            return None
+        try:
+            if (reader.source_mtime_ns, reader.source_size) == _source_signature(source_path):
+                return reader
+        except OSError:
+            pass
+        reader.close()
+        return None
+
+    def _entry(self, i: int):
+        return _ENTRY.unpack_from(self._map, self._index_offset + i * _ENTRY.size)
+
+    def _key_bytes(self, entry) -> bytes:
+        start = self._keys_offset + entry[0]
+        return self._map[start:start + entry[1]]
+
+    def _find(self, key: str):
+        target = key.encode('utf-8')
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            entry = self._entry(mid)
+            current = self._key_bytes(entry)
+            if current < target:
+                lo = mid + 1
+            elif current > target:
+                hi = mid
+            else:
+                return entry
+        return None
+
+    def __getitem__(self, key: str):
+        if key in self._cache:
+            return self._cache[key]
+        entry = self._find(key) if isinstance(key, str) else None
+        if entry is None:
+            raise KeyError(key)
+        value = json.loads(self._map[entry[2]:entry[2] + entry[3]].decode('utf-8'))
+        self._cache[key] = value
+        return value
+
+    def __contains__(self, key) -> bool:
+        return key in self._cache or (isinstance(key, str) and self._find(key) is not None)
+
+    def __iter__(self) -> Iterator[str]:
+        for i in range(self._count):
+            yield self._key_bytes(self._entry(i)).decode('utf-8')
+
+    def __len__(self) -> int:
+        return self._count
+
+    def close(self) -> None:
+        if getattr(self, '_map', None) is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+
+def load_json_or_snapshot(json_path: Union[str, Path], logger=None, build: bool = True):
+    """
+    Load a result JSON, preferring its snapshot.
+
+    Returns a SnapshotReader when a fresh snapshot exists. Otherwise parses
+    the JSON and, when build is set and the top level is an object, writes a
+    snapshot so the next load is fast. Raises like json.load on bad JSON.
+    """
+    json_path = Path(json_path)
+    snap = snapshot_path(json_path)
+    reader = SnapshotReader.open_if_fresh(snap, json_path)
+    if reader is not None:
+        return reader
+
+    signature = _source_signature(json_path)
+    data = read_json(json_path)
+    if build and isinstance(data, dict):
+        write_snapshot(data, snap, json_path, logger, source_signature=signature)
+    return data
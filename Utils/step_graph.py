@@ -0,0 +1,196 @@
+"""
+Dependency-graph executor for the preparation pipeline.
+
+run_preparation() declares its steps with the steps they depend on. In
+sequential mode they run one after another in declaration order, exactly
+as before. In parallel mode every step whose dependencies have finished
+is started at once, so independent pairs such as video/image hashing
+(13/15), duplicate marking (17/19) and reconstruction (23/25) overlap.
+
+- Each step names a pool ("io" or "cpu"). The pools are separate thread
+  pools, so a CPU-heavy step never waits behind disk-heavy ones.
+- Steps that stream through the drives are io_bound. Every drive has an
+  I/O budget (steps at a time), and an io_bound step holds a slot on each
+  drive while it runs. Drives configured with an I/O order other than
+  "none" are treated as spinning disks and get one slot.
+- Each step runs with its own shallow copy of config_data whose
+  '_progress' names that step, so concurrent steps report their own
+  progress.
+
+After a run, timings() gives each step's start/end offsets, how long it
+waited for a pool or I/O slot after its dependencies finished, and
+whether it is on the critical path (the chain of dependencies whose
+durations add up to the longest time).
+"""
+
+import time
+import threading
+import concurrent.futures
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+EXECUTION_SEQUENTIAL = "sequential"
+EXECUTION_PARALLEL = "parallel"
+EXECUTION_MODES = (EXECUTION_SEQUENTIAL, EXECUTION_PARALLEL)
+
+POOL_IO = "io"
+POOL_CPU = "cpu"
+
+
+class PipelineStep(NamedTuple):
+    """One node of the step graph."""
+    key: str                            # e.g. "step13"
+    title: str                          # e.g. "Step 13: Hash and Group Videos"
+    run: Callable[[dict], bool]         # called with the step's own config_data copy
+    after: Tuple[str, ...] = ()         # keys of the steps this one depends on
+    pool: str = POOL_IO
+    io_bound: bool = False              # holds an I/O slot on every drive while running
+
+
+class StepGraph:
+    """
+    Run PipelineSteps in dependency order, sequentially or concurrently.
+
+    Args:
+        steps: Steps in a valid sequential order (dependencies first)
+        config_data: Base config; each step gets a shallow copy
+        mode: EXECUTION_SEQUENTIAL or EXECUTION_PARALLEL
+        pool_workers: {pool name: thread count}
+        drive_budgets: {drive: io_bound steps allowed at once on that drive}
+    """
+
+    def __init__(self, steps: Sequence[PipelineStep], config_data: dict, logger,
+                 mode: str = EXECUTION_PARALLEL,
+                 pool_workers: Optional[Dict[str, int]] = None,
+                 drive_budgets: Optional[Dict[Any, int]] = None):
+        if mode not in EXECUTION_MODES:
+            logger.warning(f"Unknown pipeline execution mode '{mode}', using '{EXECUTION_SEQUENTIAL}'")
+            mode = EXECUTION_SEQUENTIAL
+        self.steps = list(steps)
+        self.config_data = config_data
+        self.logger = logger
+        self.mode = mode
+        self.pool_workers = dict(pool_workers or {})
+        # Sorted so every step acquires drive slots in the same order (no deadlock)
+        self._drive_slots = [threading.BoundedSemaphore(max(1, budget))
+                             for _, budget in sorted((drive_budgets or {}).items(), key=lambda kv: str(kv[0]))]
+        self._by_key = {step.key: step for step in self.steps}
+        self._validate()
+        self._started_at = 0.0
+        self._times: Dict[str, Tuple[float, float]] = {}
+
+    def _validate(self) -> None:
+        """Declaration order must already be a topological order."""
+        seen = set()
+        for step in self.steps:
+            if step.key in seen:
+                raise ValueError(f"Duplicate pipeline step '{step.key}'")
+            for dep in step.after:
+                if dep not in self._by_key:
+                    raise ValueError(f"Step '{step.key}' depends on unknown step '{dep}'")
+                if dep not in seen:
+                    raise ValueError(f"Step '{step.key}' is declared before its dependency '{dep}'")
+            seen.add(step.key)
+
+    def _step_config(self, step: PipelineStep) -> dict:
+        step_config = dict(self.config_data)
+        step_config['_progress'] = {'number_of_enabled_real_steps': len(self.steps),
+                                    'current_enabled_real_step': self.steps.index(step) + 1}
+        return step_config
+
+    def _run_step(self, step: PipelineStep) -> bool:
+        acquired = []
+        try:
+            if step.io_bound:
+                for slot in self._drive_slots:
+                    slot.acquire()
+                    acquired.append(slot)
+            started = time.monotonic()
+            self.logger.info(f"\n{'='*60}")
+            self.logger.info(f"Running {step.title} ({self.steps.index(step) + 1}/{len(self.steps)})")
+            self.logger.info('='*60)
+            try:
+                return bool(step.run(self._step_config(step)))
+            finally:
+                self._times[step.key] = (started - self._started_at, time.monotonic() - self._started_at)
+        finally:
+            for slot in reversed(acquired):
+                slot.release()
+
+    def run(self) -> bool:
+        """Run every step; stops scheduling new steps after the first failure."""
+        self._started_at = time.monotonic()
+        self._times = {}
+        if self.mode == EXECUTION_SEQUENTIAL:
+            return all(self._run_step(step) for step in self.steps)
+        return self._run_parallel()
+
+    def _run_parallel(self) -> bool:
+        pools = {name: concurrent.futures.ThreadPoolExecutor(
+                     max_workers=max(1, self.pool_workers.get(name, 1)), thread_name_prefix=f"step-{name}")
+                 for name in {step.pool for step in self.steps}}
+        done = set()
+        running: Dict[concurrent.futures.Future, PipelineStep] = {}
+        pending = list(self.steps)
+        ok = True
+        try:
+            while pending or running:
+                if ok:
+                    for step in [s for s in pending if all(dep in done for dep in s.after)]:
+                        pending.remove(step)
+                        running[pools[step.pool].submit(self._run_step, step)] = step
+                if not running:
+                    break
+                finished, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in finished:
+                    step = running.pop(future)
+                    try:
+                        success = future.result()
+                    except Exception as e:
+                        self.logger.exception(f"{step.title} failed: {e}")
+                        success = False
+                    if success:
+                        done.add(step.key)
+                    else:
+                        ok = False
+        finally:
+            for pool in pools.values():
+                pool.shutdown(wait=True)
+        return ok and len(done) == len(self.steps)
+
+    def timings(self) -> Dict[str, Any]:
+        """Per-step timing and the critical path of the last run."""
+        # Longest dependency chain ending at each step, by step duration
+        chain: Dict[str, Tuple[float, List[str]]] = {}
+        for step in self.steps:
+            if step.key not in self._times:
+                continue
+            start, end = self._times[step.key]
+            best = max((chain[dep] for dep in step.after if dep in chain), key=lambda c: c[0],
+                       default=(0.0, []))
+            chain[step.key] = (best[0] + end - start, best[1] + [step.key])
+        critical_seconds, critical_path = max(chain.values(), key=lambda c: c[0], default=(0.0, []))
+
+        steps = {}
+        for step in self.steps:
+            if step.key not in self._times:
+                continue
+            start, end = self._times[step.key]
+            ready = max((self._times[dep][1] for dep in step.after if dep in self._times), default=0.0)
+            steps[step.key] = {
+                "title": step.title,
+                "pool": step.pool,
+                "io_bound": step.io_bound,
+                "start": round(start, 3),
+                "end": round(end, 3),
+                "seconds": round(end - start, 3),
+                "waited": round(max(0.0, start - ready), 3),
+                "critical": step.key in critical_path
+            }
+        return {
+            "mode": self.mode,
+            "wall_seconds": round(max((end for _, end in self._times.values()), default=0.0), 3),
+            "step_seconds": round(sum(end - start for start, end in self._times.values()), 3),
+            "critical_path_seconds": round(critical_seconds, 3),
+            "critical_path": critical_path,
+            "steps": steps
+        }
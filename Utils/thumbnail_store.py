@@ -0,0 +1,282 @@
+"""
+Packed thumbnail container for Media Organizer pipeline.
+
+Thumbnails are appended to one or more shard files (thumbnails_000.pack, ...)
+inside the .thumbnails directory, with a line-based offset index
+(thumbnails.idx). Readers memory-map the shards and slice thumbnails by key,
+so the review GUIs never open a file per thumbnail.
+
+Keys are the thumbnail file stem (MD5 of the media path), so the virtual
+thumbnail path written to thumbnail_map.json ('.thumbnails/<key>.jpg') keeps
+working for tools that only know about loose JPEG files.
+
+Besides the base thumbnail, step 27 writes a small pyramid of levels
+('<key>_128.jpg', '<key>_256.jpg', '<key>_768.jpg'). Readers ask for a
+display size and get the nearest level, so cards and hover popups never
+resample a thumbnail that is much smaller or larger than needed.
+
+Videos can also get a preview strip ('<key>_strip.jpg'): N evenly spaced
+frames letterboxed into square cells laid out left to right. Hover popups
+animate the strip's cells instead of running a live decoder.
+"""
+
+import io
+import os
+import mmap
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+PACK_PREFIX = "thumbnails_"
+PACK_SUFFIX = ".pack"
+INDEX_FILENAME = "thumbnails.idx"
+DEFAULT_SHARD_SIZE_BYTES = 512 * 1024 * 1024  # 512 MB
+
+
+def thumbnail_key(thumb_path: Union[str, Path]) -> str:
+    """Return the pack key for a (possibly virtual) thumbnail path."""
+    return Path(thumb_path).stem
+
+
+def level_path(thumb_path: Union[str, Path], level: int) -> str:
+    """Return the (possibly virtual) path of a pyramid level for a thumbnail."""
+    p = Path(thumb_path)
+    return str(p.with_name(f"{p.stem}_{level}{p.suffix}"))
+
+
+def strip_path(thumb_path: Union[str, Path]) -> str:
+    """Return the (possibly virtual) path of the preview strip for a thumbnail."""
+    p = Path(thumb_path)
+    return str(p.with_name(f"{p.stem}_strip{p.suffix}"))
+
+
+def split_preview_strip(strip) -> list:
+    """
+    Split a preview strip into its frames.
+
+    Cells are square (strip height x strip height). The letterbox bars are
+    cropped using the content box shared by all frames.
+    """
+    from PIL import ImageChops
+
+    cell = strip.height
+    count = strip.width // cell if cell else 0
+    frames = [strip.crop((i * cell, 0, (i + 1) * cell, cell)) for i in range(count)]
+    if not frames:
+        return []
+
+    combined = frames[0].convert('L')
+    for frame in frames[1:]:
+        combined = ImageChops.lighter(combined, frame.convert('L'))
+    # Threshold so JPEG noise in the bars does not count as content
+    bbox = combined.point(lambda v: 255 if v > 16 else 0).getbbox()
+    if bbox:
+        frames = [frame.crop(bbox) for frame in frames]
+    return frames
+
+
+def fit_image(img, size: int):
+    """
+    Scale an image to fit inside a size x size box, keeping aspect ratio.
+
+    Returns the image untouched when it already has the target dimensions.
+    """
+    from PIL import Image
+
+    orig_w, orig_h = img.size
+    scale = min(size / orig_w, size / orig_h)
+    new_w = max(1, int(orig_w * scale))
+    new_h = max(1, int(orig_h * scale))
+    if (new_w, new_h) == (orig_w, orig_h):
+        return img
+    return img.resize((new_w, new_h), Image.Resampling.LANCZOS)
+
+
+def _shard_name(shard: int) -> str:
+    return f"{PACK_PREFIX}{shard:03d}{PACK_SUFFIX}"
+
+
+def _read_index(index_path: Path) -> Dict[str, Tuple[int, int, int]]:
+    """Read the index file. Later entries for the same key win."""
+    entries = {}
+    if not index_path.exists():
+        return entries
+    with open(index_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.endswith('\n'):
+                break  # Partial trailing line from an interrupted write
+            parts = line.rstrip('\n').split('\t')
+            if len(parts) != 4:
+                continue
+            try:
+                entries[parts[0]] = (int(parts[1]), int(parts[2]), int(parts[3]))
+            except ValueError:
+                continue
+    return entries
+
+
+class ThumbnailPackWriter:
+    """
+    Append-only writer for packed thumbnails.
+
+    Data is written to the current shard before its index line, so an
+    interrupted run never leaves an index entry pointing at missing bytes.
+    """
+
+    def __init__(self, thumbnails_dir: Union[str, Path],
+                 shard_size_bytes: int = DEFAULT_SHARD_SIZE_BYTES):
+        self.thumbnails_dir = Path(thumbnails_dir)
+        self.thumbnails_dir.mkdir(parents=True, exist_ok=True)
+        self.shard_size_bytes = max(1, int(shard_size_bytes))
+        self.index_path = self.thumbnails_dir / INDEX_FILENAME
+        self.entries = _read_index(self.index_path)
+        self._lock = threading.Lock()
+
+        self.shard = max((s for s, _, _ in self.entries.values()), default=0)
+        self._data = open(self.thumbnails_dir / _shard_name(self.shard), 'ab')
+        self._index = open(self.index_path, 'a', encoding='utf-8')
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.entries
+
+    def add(self, key: str, data: bytes) -> None:
+        """Append a thumbnail under key (replaces any previous entry)."""
+        with self._lock:
+            offset = self._data.tell()
+            if offset > 0 and offset + len(data) > self.shard_size_bytes:
+                self._data.close()
+                self.shard += 1
+                self._data = open(self.thumbnails_dir / _shard_name(self.shard), 'ab')
+                offset = self._data.tell()
+
+            self._data.write(data)
+            self._data.flush()
+            self._index.write(f"{key}\t{self.shard}\t{offset}\t{len(data)}\n")
+            self.entries[key] = (self.shard, offset, len(data))
+
+    def close(self) -> None:
+        with self._lock:
+            for f in (self._data, self._index):
+                try:
+                    f.flush()
+                    os.fsync(f.fileno())
+                except (OSError, ValueError):
+                    pass
+                f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class ThumbnailStore:
+    """
+    Read-side access to thumbnails, packed or loose.
+
+    Packed thumbnails are served from memory-mapped shards; anything not in
+    the pack falls back to the file on disk.
+    """
+
+    def __init__(self, thumbnails_dir: Union[str, Path],
+                 levels: Optional[Iterable[int]] = None,
+                 base_size: Optional[int] = None):
+        from Utils.utils import GUIStyle
+
+        self.thumbnails_dir = Path(thumbnails_dir)
+        self.levels = sorted(levels if levels is not None else GUIStyle.THUMBNAIL_PYRAMID_LEVELS)
+        self.base_size = base_size or max(GUIStyle.THUMBNAIL_WIDTH, GUIStyle.THUMBNAIL_HEIGHT)
+        self.entries = _read_index(self.thumbnails_dir / INDEX_FILENAME)
+        self._maps: Dict[int, Optional[mmap.mmap]] = {}
+        self._files = []
+        self._lock = threading.Lock()
+        # Base thumbnail path -> [(level, path)] that exist, so grid redraws stat once per cell
+        self._available: Dict[str, List[Tuple[int, str]]] = {}
+
+    def _get_map(self, shard: int) -> Optional[mmap.mmap]:
+        mapped = self._maps.get(shard)
+        if mapped is not None:
+            return mapped
+        with self._lock:
+            return self._map_shard(shard)
+
+    def _map_shard(self, shard: int) -> Optional[mmap.mmap]:
+        if shard not in self._maps:
+            mapped = None
+            try:
+                f = open(self.thumbnails_dir / _shard_name(shard), 'rb')
+                if os.fstat(f.fileno()).st_size > 0:
+                    mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                    self._files.append(f)
+                else:
+                    f.close()
+            except OSError:
+                mapped = None
+            self._maps[shard] = mapped
+        return self._maps[shard]
+
+    def get_bytes(self, key: str) -> Optional[bytes]:
+        """Return the raw JPEG bytes for key, or None if not packed."""
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        shard, offset, length = entry
+        mapped = self._get_map(shard)
+        if mapped is None or offset + length > len(mapped):
+            return None
+        return mapped[offset:offset + length]
+
+    def exists(self, thumb_path: Optional[Union[str, Path]]) -> bool:
+        """True if the thumbnail is packed or exists as a file."""
+        if not thumb_path:
+            return False
+        return thumbnail_key(thumb_path) in self.entries or os.path.exists(thumb_path)
+
+    def select_level(self, thumb_path: Union[str, Path], size: int) -> str:
+        """
+        Pick the pyramid level to display at size.
+
+        Returns the smallest available level at least size pixels across,
+        or the largest available one if none is big enough. Falls back to
+        the base thumbnail when no levels were generated.
+        """
+        available = self._available.get(str(thumb_path))
+        if available is None:
+            candidates = sorted([(level, level_path(thumb_path, level)) for level in self.levels] +
+                                [(self.base_size, str(thumb_path))])
+            available = [(level, path) for level, path in candidates if self.exists(path)]
+            if not available:
+                # Not cached: the thumbnail may still be generated while the GUI is open
+                return str(thumb_path)
+            self._available[str(thumb_path)] = available
+        for level, path in available:
+            if level >= size:
+                return path
+        return available[-1][1]
+
+    def open_image(self, thumb_path: Union[str, Path], size: Optional[int] = None):
+        """
+        Open a thumbnail as a PIL image (pack first, then loose file).
+
+        Args:
+            thumb_path: Base thumbnail path from thumbnail_map.json
+            size: Display size in pixels; selects the nearest pyramid level
+        """
+        from PIL import Image
+
+        if size is not None:
+            thumb_path = self.select_level(thumb_path, size)
+        data = self.get_bytes(thumbnail_key(thumb_path))
+        if data is not None:
+            return Image.open(io.BytesIO(data))
+        return Image.open(thumb_path)
+
+    def close(self) -> None:
+        for mapped in self._maps.values():
+            if mapped is not None:
+                mapped.close()
+        for f in self._files:
+            f.close()
+        self._maps.clear()
+        self._files.clear()
@@ -0,0 +1,253 @@
+"""
+External tool capability probe and cache for Media Organizer pipeline.
+
+Each tool binary (ffmpeg, ffprobe, 7-Zip) is probed once for its version,
+and ffmpeg also for the encoders and decoders it was built with and which
+encoders run multi-threaded. Profiles are cached in tool_capabilities.json
+in the results directory. They are keyed by the resolved executable path
+and stamped with its mtime and size, so the next probe only happens after
+the binary is replaced.
+
+The engines pick their ffmpeg command lines from the profile:
+    conversion   fastest available H.264/MPEG-4 encoder with a software
+                 speed preset, AAC (or MP3) audio
+    repair       audio re-encode with the same audio choice
+    thumbnails   single-frame MJPEG grab when OpenCV is not installed
+Hardware acceleration is never used: whether it works depends on the GPU
+and driver, not on the binary, so a cached profile cannot vouch for it.
+
+File format:
+    {
+      "version": 1,
+      "tools": {"C:/tools/ffmpeg.exe": {"path": ..., "mtime": ..., "size": ...,
+                                         "version": "6.1", "encoders": {"libx264": "V....D"},
+                                         "decoders": [...], "probed_at": ...}}
+    }
+"""
+
+import os
+import re
+import shutil
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Tuple, Union
+
+from Utils.jsonio import read_json
+from Utils.utils import FileUtils
+from Utils.process_runner import get_process_runner, tool_name
+
+TOOL_CACHE_FILENAME = "tool_capabilities.json"
+TOOL_CACHE_VERSION = 1
+PROBE_TIMEOUT = 15
+
+# Config keys under paths.tools that are probed
+PROBED_TOOLS = ("ffmpeg", "ffprobe", "sevenZip")
+
+# (encoder, options), fastest first; all software-only
+VIDEO_ENCODER_PRESETS: Tuple[Tuple[str, Tuple[str, ...]], ...] = (
+    ("libx264", ("-preset", "veryfast", "-crf", "23", "-pix_fmt", "yuv420p")),
+    ("libopenh264", ("-b:v", "6M", "-pix_fmt", "yuv420p")),
+    ("mpeg4", ("-q:v", "4")),
+)
+AUDIO_ENCODER_PRESETS: Tuple[Tuple[str, Tuple[str, ...]], ...] = (
+    ("aac", ("-b:a", "128k")),
+    ("libfdk_aac", ("-b:a", "128k")),
+    ("libmp3lame", ("-b:a", "128k")),
+)
+
+
+class ToolProfile(NamedTuple):
+    """Capabilities of one tool binary."""
+    path: str                   # resolved executable
+    mtime: float
+    size: int
+    version: Optional[str]
+    encoders: Dict[str, str]    # ffmpeg encoder name -> capability flags, e.g. 'VFS..D'
+    decoders: List[str]
+    probed_at: str
+
+    def has_encoder(self, name: str) -> bool:
+        return name in self.encoders
+
+    def threaded(self, encoder: str) -> bool:
+        """Frame- or slice-level multithreading (the F/S flags of 'ffmpeg -encoders')."""
+        flags = self.encoders.get(encoder, '')
+        return flags[1:2] == 'F' or flags[2:3] == 'S'
+
+    def _pick(self, presets) -> Optional[List[str]]:
+        for encoder, options in presets:
+            if encoder in self.encoders:
+                return [encoder, *options]
+        return None
+
+    def video_encode_args(self) -> Optional[List[str]]:
+        """'-c:v' arguments for the fastest usable encoder, or None."""
+        picked = self._pick(VIDEO_ENCODER_PRESETS)
+        if picked is None:
+            return None
+        encoder, *options = picked
+        threads = ['-threads', '0'] if self.threaded(encoder) else []
+        return ['-c:v', encoder, *options, *threads]
+
+    def audio_encode_args(self) -> Optional[List[str]]:
+        """'-c:a' arguments for an MP4-compatible audio encoder, or None."""
+        picked = self._pick(AUDIO_ENCODER_PRESETS)
+        if picked is None:
+            return None
+        encoder, *options = picked
+        return ['-c:a', encoder, *options]
+
+
+def resolve_executable(executable: Union[str, Path]) -> Optional[str]:
+    """Absolute path of an executable given as a path or a name on PATH."""
+    found = shutil.which(str(executable))
+    if found is None and os.path.isfile(str(executable)):
+        found = str(executable)
+    return os.path.normpath(os.path.abspath(found)).replace('\\', '/') if found else None
+
+
+def _parse_codec_list(output: str) -> Dict[str, str]:
+    """Parse 'ffmpeg -encoders/-decoders' output into {name: flags}."""
+    codecs = {}
+    _, _, body = output.partition(' ------\n')
+    for line in body.splitlines():
+        parts = line.split(None, 2)
+        if len(parts) >= 2:
+            codecs[parts[1]] = parts[0]
+    return codecs
+
+
+def probe_tool(path: str, mtime: float, size: int) -> Optional[ToolProfile]:
+    """Run the binary to find its version and codecs. None if it does not run."""
+    runner = get_process_runner()
+    name = tool_name(path)
+    try:
+        if name.startswith('7z'):
+            # No arguments prints the banner, e.g. '7-Zip [64] 16.02 : Copyright ...'
+            result = runner.run([path], timeout=PROBE_TIMEOUT)
+            match = re.search(r'7-Zip(?: \(\w\))?(?: \[\d+\])?\s+([\d.]+\S*)', result.stdout)
+            if result.timed_out or not match:
+                return None
+            return ToolProfile(path, mtime, size, match.group(1), {}, [], datetime.now().isoformat())
+
+        result = runner.run([path, '-version'], timeout=PROBE_TIMEOUT)
+        if not result.ok:
+            return None
+        # 'ffmpeg version 6.1.1-3ubuntu5 Copyright ...'
+        match = re.search(r'version\s+(\S+)', result.stdout)
+        encoders: Dict[str, str] = {}
+        decoders: List[str] = []
+        if name == 'ffmpeg':
+            listed = runner.run([path, '-hide_banner', '-encoders'], timeout=PROBE_TIMEOUT)
+            if listed.ok:
+                encoders = _parse_codec_list(listed.stdout)
+            listed = runner.run([path, '-hide_banner', '-decoders'], timeout=PROBE_TIMEOUT)
+            if listed.ok:
+                decoders = sorted(_parse_codec_list(listed.stdout))
+        return ToolProfile(path, mtime, size, match.group(1) if match else None,
+                           encoders, decoders, datetime.now().isoformat())
+    except OSError:
+        return None
+
+
+class ToolProbeCache:
+    """
+    Tool profiles by resolved executable path, probed at most once per binary.
+
+    Without a cache path the profiles only live for this process.
+    """
+
+    def __init__(self, cache_path: Optional[Union[str, Path]] = None, logger=None):
+        self.cache_path = Path(cache_path) if cache_path else None
+        self.logger = logger
+        self._profiles: Dict[str, ToolProfile] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def open(cls, results_dir: Union[str, Path], logger=None) -> 'ToolProbeCache':
+        """Load the cache from a results directory (empty if not there yet)."""
+        cache = cls(Path(results_dir) / TOOL_CACHE_FILENAME, logger)
+        cache.load()
+        return cache
+
+    def load(self) -> None:
+        if self.cache_path is None or not self.cache_path.exists():
+            return
+        try:
+            data = read_json(self.cache_path)
+            if data.get('version') != TOOL_CACHE_VERSION:
+                return
+            with self._lock:
+                self._profiles = {path: ToolProfile(**entry) for path, entry in data.get('tools', {}).items()}
+        except Exception as e:
+            if self.logger:
+                self.logger.warning(f"Ignoring tool capability cache {self.cache_path}: {e}")
+
+    def save(self) -> bool:
+        if self.cache_path is None:
+            return False
+        with self._lock:
+            data = {
+                "version": TOOL_CACHE_VERSION,
+                "tools": {path: profile._asdict() for path, profile in sorted(self._profiles.items())}
+            }
+        self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+        ok = FileUtils.atomic_write_json(data, self.cache_path)
+        if not ok and self.logger:
+            self.logger.error(f"Failed to save tool capability cache {self.cache_path}")
+        return ok
+
+    def profile(self, executable: Union[str, Path]) -> Optional[ToolProfile]:
+        """
+        Profile of an executable, probing it only if it is new or was replaced.
+
+        Returns None if the executable is missing or does not run; failed
+        probes are not cached, so a fixed install is picked up next time.
+        """
+        path = resolve_executable(executable)
+        if path is None:
+            return None
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        # Held while probing so concurrent steps do not probe the same binary twice
+        with self._lock:
+            cached = self._profiles.get(path)
+            if cached is not None and cached.mtime == st.st_mtime and cached.size == st.st_size:
+                return cached
+            profile = probe_tool(path, st.st_mtime, st.st_size)
+            if profile is None:
+                if self.logger:
+                    self.logger.warning(f"{executable} did not run, not using it")
+                return None
+            self._profiles[path] = profile
+        if self.logger:
+            self.logger.info(f"Probed {path}: version {profile.version}, {len(profile.encoders)} encoders")
+        self.save()
+        return profile
+
+
+_cache: Optional[ToolProbeCache] = None
+_cache_lock = threading.Lock()
+
+
+def configure_tool_probe(results_dir: Union[str, Path], logger=None) -> ToolProbeCache:
+    """Back the shared profiles with tool_capabilities.json in a results directory."""
+    global _cache
+    with _cache_lock:
+        _cache = ToolProbeCache.open(results_dir, logger)
+        return _cache
+
+
+def get_tool_profile(executable: Union[str, Path, None]) -> Optional[ToolProfile]:
+    """Shared-cache profile of an executable (None if missing or not runnable)."""
+    global _cache
+    if not executable:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = ToolProbeCache()
+        cache = _cache
+    return cache.profile(executable)
@@ -4,10 +4,10 @@ All configuration values are loaded from config.json.
 """
 
 import os
+import re
 import sys
 import json
 import logging
-import tempfile
 import threading
 from pathlib import Path
 from typing import Dict, List, Any, Optional, Union
@@ -90,6 +90,7 @@ class GUIStyle:
     THUMBNAIL_WIDTH = _thumb.get('width', 200)
     THUMBNAIL_HEIGHT = _thumb.get('height', 200)
     THUMBNAIL_QUALITY = _thumb.get('quality', 85)
+    THUMBNAIL_PYRAMID_LEVELS = tuple(_thumb.get('pyramidLevels', [128, 256, 768]))
 
     # Window frame
     WINDOW_FRAME_CORNER_RADIUS = 0
@@ -172,13 +173,24 @@ class MediaOrganizerConfig:
                 if s.get('Enabled', False) and 'counter.py' not in s.get('Path', '')]
 
     def validate_tools(self) -> List[str]:
-        """Validate required tools are available. Returns list of missing tools."""
+        """
+        Validate required tools are available. Returns list of missing tools.
+
+        ffmpeg, ffprobe and 7-Zip are also probed, once per binary (cached in
+        the results directory), so a binary that exists but does not run is
+        reported as well.
+        """
         import shutil
+        from Utils.tool_probe import ToolProbeCache, PROBED_TOOLS
+        results_dir = self.resolved_paths.get('resultsDirectory')
+        probe_cache = ToolProbeCache.open(results_dir) if results_dir else ToolProbeCache()
         missing = []
         tools = self.config_data.get('paths', {}).get('tools', {})
         for name, cmd in tools.items():
             if not shutil.which(cmd):
                 missing.append(f"{name} ({cmd})")
+            elif name in PROBED_TOOLS and probe_cache.profile(cmd) is None:
+                missing.append(f"{name} ({cmd}, does not run)")
         return missing
 
     def ensure_directories(self) -> None:
@@ -224,17 +236,14 @@ class FileUtils:
     """File operation utilities."""
 
     @staticmethod
-    def atomic_write_json(data: Any, file_path: Union[str, Path], indent: int = 2) -> bool:
-        """Atomically write JSON to file."""
-        file_path = Path(file_path)
-        file_path.parent.mkdir(parents=True, exist_ok=True)
+    def atomic_write_json(data: Any, file_path: Union[str, Path], indent: Optional[int] = None) -> bool:
+        """Atomically write JSON to file (streamed; indent defaults to the configured io.jsonIndent)."""
+        from Utils.jsonio import stream_json_atomic
+
         try:
-            with tempfile.NamedTemporaryFile(mode='w', delete=False, dir=file_path.parent,
-                                              suffix='.tmp', encoding='utf-8') as tmp:
-                json.dump(data, tmp, indent=indent, ensure_ascii=False)
-                temp_path = tmp.name
-            Path(temp_path).replace(file_path)
-            return True
+            if indent is None:
+                return stream_json_atomic(data, file_path, raise_errors=True)
+            return stream_json_atomic(data, file_path, indent=indent, raise_errors=True)
         except Exception as e:
             logger.error(f"Atomic write failed for {file_path}: {e}")
             return False
@@ -262,6 +271,54 @@ class PathUtils:
             return False
 
 
+class PathRenameTrie:
+    """
+    Records renames of path components and rewrites paths through them.
+
+    Each entry renames the last component of an old path. Rewriting walks a
+    path's components down the trie and substitutes every renamed component
+    on the way, so renaming a directory and files beneath it compose, and a
+    rename that was never applied simply isn't recorded. Rewriting costs
+    O(depth) per path and keeps the path's own separator style.
+    """
+
+    _SEPARATORS = re.compile(r'([\\/]+)')
+
+    def __init__(self):
+        self._root: Dict[str, list] = {}  # component -> [children, new_name or None]
+        self.count = 0
+
+    def add(self, old_path: Union[str, Path], new_name: str) -> None:
+        """Record that the last component of old_path was renamed to new_name."""
+        parts = [p for p in self._SEPARATORS.split(str(old_path)) if p and not self._SEPARATORS.fullmatch(p)]
+        children = self._root
+        node = None
+        for part in parts:
+            node = children.setdefault(part, [{}, None])
+            children = node[0]
+        if node is not None:
+            node[1] = new_name
+            self.count += 1
+
+    def rewrite(self, path: Union[str, Path]) -> str:
+        """Return path with every recorded rename applied (unchanged if none apply)."""
+        tokens = self._SEPARATORS.split(str(path))
+        children = self._root
+        for i, token in enumerate(tokens):
+            if not token or self._SEPARATORS.fullmatch(token):
+                continue
+            node = children.get(token)
+            if node is None:
+                break
+            if node[1] is not None:
+                tokens[i] = node[1]
+            children = node[0]
+        return ''.join(tokens)
+
+    def __len__(self) -> int:
+        return self.count
+
+
 # =============================================================================
 # LOGGING
 # =============================================================================
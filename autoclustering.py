@@ -70,7 +70,8 @@ OUTPUTS
 
 1. relationship_sets.json:
    {
-     "file_index": {                 # Key-to-path mapping
+     "file_index": {                 # Key-to-path mapping (keys are stable
+                                     #  file IDs from file_registry.json)
        "0": "C:/path/to/file1.jpg",
        "1": "C:/path/to/file2.jpg",
        "2": "C:/path/to/file3.jpg"
@@ -118,6 +119,7 @@ if str(script_dir) not in sys.path:
     sys.path.insert(0, str(script_dir))
 
 from Utils.utils import get_script_logger_with_config, update_pipeline_progress
+from Utils.file_registry import FileRegistry
 
 
 # =============================================================================
@@ -315,11 +317,14 @@ class RelationshipExtractor:
     - L' (Location): Potential same-location
     - E' (Event): Potential same-event (T' AND L')
 
-    Uses integer keys for efficiency. Output includes file_index mapping.
+    Uses integer keys for efficiency. Keys are the stable file IDs from the
+    file registry, so saved review state keeps pointing at the same files
+    when clustering is re-run. Output includes file_index mapping.
     Uses Union-Find for efficient transitive closure computation.
     """
 
-    def __init__(self, config_data: Dict[str, Any], logger):
+    def __init__(self, config_data: Dict[str, Any], logger,
+                 file_registry: Optional[FileRegistry] = None):
         self.config = config_data
         self.logger = logger
 
@@ -333,9 +338,12 @@ class RelationshipExtractor:
         self.uf_l_prime = UnionFind()  # Same location (L')
 
         # File index: path -> key and key -> path mappings
+        if file_registry is None:
+            results_dir = config_data.get('paths', {}).get('resultsDirectory')
+            file_registry = FileRegistry.open(results_dir, logger) if results_dir else FileRegistry()
+        self.file_registry = file_registry
         self.path_to_key: Dict[str, int] = {}
         self.key_to_path: Dict[int, str] = {}
-        self.next_key: int = 0
 
         # Statistics
         self.stats = {
@@ -347,11 +355,11 @@ class RelationshipExtractor:
         }
 
     def _get_key(self, path: str) -> int:
-        """Get or create an integer key for a file path."""
+        """Get the stable file ID for a path (registering it if new)."""
         if path not in self.path_to_key:
-            self.path_to_key[path] = self.next_key
-            self.key_to_path[self.next_key] = path
-            self.next_key += 1
+            key = self.file_registry.intern(path)
+            self.path_to_key[path] = key
+            self.key_to_path[key] = path
         return self.path_to_key[path]
 
     def extract_relationships(self, metadata: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
@@ -360,6 +368,7 @@ class RelationshipExtractor:
 
         Args:
             metadata: Dictionary mapping file paths to their metadata
+                      (plain dicts or compact MediaRecords)
 
         Returns:
             Dictionary containing file_index, E', T', L' sets and statistics
@@ -416,6 +425,9 @@ class RelationshipExtractor:
         self.logger.info(f"L' sets (potential same-location): {len(l_prime_sets)}")
         self.logger.info(f"E' sets (potential same-event): {len(e_prime_sets)}")
 
+        # Persist IDs handed out to files the preparation stage never saw
+        self.file_registry.save()
+
         # Build result with file_index mapping
         result = {
             'file_index': {str(k): v for k, v in self.key_to_path.items()},
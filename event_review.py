@@ -32,6 +32,10 @@ INPUTS
 2. thumbnail_map.json (from preparation stage)
    - Maps original file paths to thumbnail paths
 
+With --sets-file, E' sets are read from another file in the same format,
+e.g. near_duplicate_images.json from preparation step 29. Results then go
+to <name>_review_results.json.
+
 ================================================================================
 OUTPUTS
 ================================================================================
@@ -67,6 +71,10 @@ if str(script_dir) not in sys.path:
     sys.path.insert(0, str(script_dir))
 
 from Utils.utils import get_script_logger_with_config, update_pipeline_progress
+from Utils.thumbnail_store import ThumbnailStore, fit_image
+from Utils.file_registry import FileRegistry, canonical_path
+from Utils.jsonio import read_json, stream_json_atomic, configure_json_output
+from Utils.snapshot import load_json_or_snapshot
 
 # Import ThumbnailGUI components
 try:
@@ -87,7 +95,7 @@ class EventReviewGUI:
     allowing the user to mark junk files and confirm event groupings.
     """
 
-    def __init__(self, master, config_data: dict, logger):
+    def __init__(self, master, config_data: dict, logger, sets_file: Optional[str] = None):
         self.master = master
         self.config_data = config_data
         self.logger = logger
@@ -96,14 +104,20 @@ class EventReviewGUI:
         # Paths
         results_dir = Path(config_data['paths']['resultsDirectory'])
         self.results_dir = results_dir
-        self.relationship_file = results_dir / 'relationship_sets.json'
+        self.relationship_file = results_dir / (sets_file or 'relationship_sets.json')
         self.thumbnail_map_file = results_dir / 'thumbnail_map.json'
+        self.thumbnail_store = ThumbnailStore(results_dir / '.thumbnails')
         self.metadata_file = results_dir / 'Consolidate_Meta_Results.json'
-        self.output_file = results_dir / 'event_review_results.json'
+        if sets_file:
+            self.output_file = results_dir / f"{Path(sets_file).stem}_review_results.json"
+        else:
+            self.output_file = results_dir / 'event_review_results.json'
 
         # Store input/processed directories for path translation
-        self.raw_dir = os.path.normpath(os.path.abspath(config_data['paths'].get('rawDirectory', '')))
-        self.processed_dir = os.path.normpath(os.path.abspath(config_data['paths'].get('processedDirectory', '')))
+        self.raw_dir = canonical_path(config_data['paths'].get('rawDirectory', ''))
+        self.processed_dir = canonical_path(config_data['paths'].get('processedDirectory', ''))
+        self.file_registry = FileRegistry.open(results_dir, logger)
+        configure_json_output(config_data, logger)
 
         # Load data
         self.relationship_data = self._load_relationships()
@@ -170,21 +184,19 @@ class EventReviewGUI:
             return {'file_index': {}, 'E_prime': []}
 
         try:
-            with open(self.relationship_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
+            return load_json_or_snapshot(self.relationship_file, self.logger)
         except Exception as e:
             self.logger.error(f"Error loading relationships: {e}")
             return {'file_index': {}, 'E_prime': []}
 
     def _load_thumbnail_map(self) -> dict:
-        """Load thumbnail map from JSON file."""
+        """Load thumbnail map from JSON file, keyed by file ID."""
         if not self.thumbnail_map_file.exists():
             return {}
 
         try:
-            with open(self.thumbnail_map_file, 'r', encoding='utf-8') as f:
-                raw = json.load(f)
-            return {os.path.normpath(os.path.abspath(k)): v for k, v in raw.items()}
+            raw = read_json(self.thumbnail_map_file)
+            return self.file_registry.index(raw)
         except Exception as e:
             self.logger.error(f"Error loading thumbnail map: {e}")
             return {}
@@ -194,8 +206,7 @@ class EventReviewGUI:
         if not self.metadata_file.exists():
             return {}
         try:
-            with open(self.metadata_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
+            return load_json_or_snapshot(self.metadata_file, self.logger)
         except Exception as e:
             self.logger.error(f"Error loading metadata: {e}")
             return {}
@@ -206,34 +217,27 @@ class EventReviewGUI:
 
         Handles cases where file_index points to input/ but thumbnail_map uses Processed/ paths.
         """
-        norm_path = os.path.normpath(os.path.abspath(file_path))
-
-        # Try direct lookup first
-        thumb_path = self.thumbnail_map.get(norm_path)
-        if thumb_path and os.path.exists(thumb_path):
+        # Direct lookup by stable file ID (follows renames recorded in the registry)
+        thumb_path = self.thumbnail_map.get(self.file_registry.id_of(file_path))
+        if thumb_path and self.thumbnail_store.exists(thumb_path):
             return thumb_path
 
+        norm_path = canonical_path(file_path)
+
         # Try translating input path to processed path
         if self.raw_dir and self.processed_dir and norm_path.startswith(self.raw_dir):
             translated = norm_path.replace(self.raw_dir, self.processed_dir, 1)
-            thumb_path = self.thumbnail_map.get(translated)
-            if thumb_path and os.path.exists(thumb_path):
+            thumb_path = self.thumbnail_map.get(self.file_registry.id_of(translated))
+            if thumb_path and self.thumbnail_store.exists(thumb_path):
                 return thumb_path
 
         # Try translating processed path to input path
         if self.raw_dir and self.processed_dir and norm_path.startswith(self.processed_dir):
             translated = norm_path.replace(self.processed_dir, self.raw_dir, 1)
-            thumb_path = self.thumbnail_map.get(translated)
-            if thumb_path and os.path.exists(thumb_path):
+            thumb_path = self.thumbnail_map.get(self.file_registry.id_of(translated))
+            if thumb_path and self.thumbnail_store.exists(thumb_path):
                 return thumb_path
 
-        # Try finding by filename only (last resort)
-        filename = os.path.basename(norm_path)
-        for map_path, thumb in self.thumbnail_map.items():
-            if os.path.basename(map_path) == filename:
-                if os.path.exists(thumb):
-                    return thumb
-
         return None
 
     def _get_file_time(self, key: int) -> Optional[str]:
@@ -1192,14 +1196,10 @@ class EventReviewGUI:
 
         if thumb_path:
             try:
-                img = Image.open(thumb_path)
+                img = self.thumbnail_store.open_image(thumb_path, size)
 
                 # Scale to fit
-                orig_w, orig_h = img.size
-                scale = min(size / orig_w, size / orig_h)
-                new_w = int(orig_w * scale)
-                new_h = int(orig_h * scale)
-                scaled_img = img.resize((new_w, new_h), Image.Resampling.LANCZOS)
+                scaled_img = fit_image(img, size)
 
                 # Apply watermark
                 if is_junk:
@@ -1609,11 +1609,14 @@ class EventReviewGUI:
             popup.overrideredirect(True)
             popup.attributes('-topmost', True)
 
+            max_size = int(max(self.master.winfo_screenwidth(),
+                             self.master.winfo_screenheight()) * self.popup_max_screen_fraction)
+
             # Load image using path translation
             thumb_path = self._get_thumbnail_path(file_path)
 
             if thumb_path:
-                img = Image.open(thumb_path)
+                img = self.thumbnail_store.open_image(thumb_path, max_size)
             elif os.path.exists(file_path):
                 img = Image.open(file_path)
             else:
@@ -1629,9 +1632,6 @@ class EventReviewGUI:
                 pass
 
             # Scale for popup
-            max_size = int(max(self.master.winfo_screenwidth(),
-                             self.master.winfo_screenheight()) * self.popup_max_screen_fraction)
-
             orig_w, orig_h = img.size
             longest = max(orig_w, orig_h)
             scale = max_size / longest
@@ -1799,8 +1799,7 @@ class EventReviewGUI:
         }
 
         try:
-            with open(self.output_file, 'w', encoding='utf-8') as f:
-                json.dump(results, f, indent=2, ensure_ascii=False)
+            stream_json_atomic(results, self.output_file, raise_errors=True)
             self.logger.info(f"Saved review results to {self.output_file}")
         except Exception as e:
             self.logger.error(f"Error saving review results: {e}")
@@ -1808,8 +1807,7 @@ class EventReviewGUI:
         # Update metadata to mark junk files for deletion
         if self.junk_keys and self.metadata_file.exists():
             try:
-                with open(self.metadata_file, 'r', encoding='utf-8') as f:
-                    metadata = json.load(f)
+                metadata = read_json(self.metadata_file)
 
                 # Convert junk keys to file paths and mark for deletion
                 for key in self.junk_keys:
@@ -1817,8 +1815,7 @@ class EventReviewGUI:
                     if file_path and file_path in metadata:
                         metadata[file_path]['marked_for_deletion'] = True
 
-                with open(self.metadata_file, 'w', encoding='utf-8') as f:
-                    json.dump(metadata, f, indent=2, ensure_ascii=False)
+                stream_json_atomic(metadata, self.metadata_file, raise_errors=True)
 
                 self.logger.info(f"Marked {len(self.junk_keys)} files for deletion in metadata")
             except Exception as e:
@@ -1832,7 +1829,8 @@ class EventReviewGUI:
         }
 
 
-def run_event_review(settings: dict, progress_info: dict, logger, config_data: dict) -> bool:
+def run_event_review(settings: dict, progress_info: dict, logger, config_data: dict,
+                     sets_file: Optional[str] = None) -> bool:
     """
     Run the event review GUI.
 
@@ -1841,6 +1839,7 @@ def run_event_review(settings: dict, progress_info: dict, logger, config_data: d
         progress_info: Pipeline progress information
         logger: Logger instance
         config_data: Full configuration dictionary
+        sets_file: Sets file in resultsDirectory (default relationship_sets.json)
 
     Returns:
         True if successful, False otherwise
@@ -1851,7 +1850,7 @@ def run_event_review(settings: dict, progress_info: dict, logger, config_data: d
         else:
             root = tk.Tk()
 
-        gui = EventReviewGUI(root, config_data, logger)
+        gui = EventReviewGUI(root, config_data, logger, sets_file=sets_file)
         root.mainloop()
 
         results = gui.get_results()
@@ -1873,6 +1872,9 @@ def main():
     parser = argparse.ArgumentParser(description='Event Review - Human Verification')
     parser.add_argument('--config-file', type=str, required=True,
                         help='Path to configuration JSON file')
+    parser.add_argument('--sets-file', type=str,
+                        help='Review E_prime sets from this results file instead of relationship_sets.json '
+                             '(e.g. near_duplicate_images.json)')
 
     args = parser.parse_args()
 
@@ -1886,7 +1888,8 @@ def main():
     logger = get_script_logger_with_config(config_data, 'event_review')
     settings = config_data.get('settings', {})
     progress_info = {'current_step': 1, 'total_steps': 1}  # Standalone execution
-    success = run_event_review(settings=settings, progress_info=progress_info, logger=logger, config_data=config_data)
+    success = run_event_review(settings=settings, progress_info=progress_info, logger=logger, config_data=config_data,
+                               sets_file=args.sets_file)
 
     sys.exit(0 if success else 1)
 
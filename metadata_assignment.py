@@ -48,6 +48,10 @@ if str(script_dir) not in sys.path:
     sys.path.insert(0, str(script_dir))
 
 from Utils.utils import get_script_logger_with_config, update_pipeline_progress
+from Utils.thumbnail_store import ThumbnailStore, fit_image
+from Utils.file_registry import FileRegistry, canonical_path
+from Utils.jsonio import read_json, stream_json_atomic, configure_json_output
+from Utils.snapshot import load_json_or_snapshot
 
 try:
     import customtkinter as ctk
@@ -63,7 +67,7 @@ try:
 except ImportError:
     MAP_AVAILABLE = False
 
-from PIL import Image, ImageTk
+from PIL import ImageTk
 
 
 class MetadataAssignmentGUI:
@@ -83,13 +87,16 @@ class MetadataAssignmentGUI:
         self.results_dir = results_dir
         self.relationship_file = results_dir / 'relationship_sets.json'
         self.thumbnail_map_file = results_dir / 'thumbnail_map.json'
+        self.thumbnail_store = ThumbnailStore(results_dir / '.thumbnails')
         self.metadata_file = results_dir / 'Consolidate_Meta_Results.json'
         self.output_file = results_dir / 'metadata_assignment_results.json'
         self.state_file = results_dir / 'metadata_assignment_state.json'
 
         # Store input/processed directories for path translation
-        self.raw_dir = os.path.normpath(os.path.abspath(config_data['paths'].get('rawDirectory', '')))
-        self.processed_dir = os.path.normpath(os.path.abspath(config_data['paths'].get('processedDirectory', '')))
+        self.raw_dir = canonical_path(config_data['paths'].get('rawDirectory', ''))
+        self.processed_dir = canonical_path(config_data['paths'].get('processedDirectory', ''))
+        self.file_registry = FileRegistry.open(results_dir, logger)
+        configure_json_output(config_data, logger)
 
         # Load data
         self.relationship_data = self._load_relationships()
@@ -164,8 +171,7 @@ class MetadataAssignmentGUI:
         if not self.relationship_file.exists():
             return {'file_index': {}, 'T_prime': [], 'L_prime': [], 'E_prime': []}
         try:
-            with open(self.relationship_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
+            return load_json_or_snapshot(self.relationship_file, self.logger)
         except Exception as e:
             self.logger.error(f"Error loading relationships: {e}")
             return {'file_index': {}, 'T_prime': [], 'L_prime': [], 'E_prime': []}
@@ -174,9 +180,8 @@ class MetadataAssignmentGUI:
         if not self.thumbnail_map_file.exists():
             return {}
         try:
-            with open(self.thumbnail_map_file, 'r', encoding='utf-8') as f:
-                raw = json.load(f)
-            return {os.path.normpath(os.path.abspath(k)): v for k, v in raw.items()}
+            raw = read_json(self.thumbnail_map_file)
+            return self.file_registry.index(raw)
         except Exception as e:
             self.logger.error(f"Error loading thumbnail map: {e}")
             return {}
@@ -185,8 +190,7 @@ class MetadataAssignmentGUI:
         if not self.metadata_file.exists():
             return {}
         try:
-            with open(self.metadata_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
+            return load_json_or_snapshot(self.metadata_file, self.logger)
         except Exception as e:
             self.logger.error(f"Error loading metadata: {e}")
             return {}
@@ -197,34 +201,27 @@ class MetadataAssignmentGUI:
 
         Handles cases where file_index points to input/ but thumbnail_map uses Processed/ paths.
         """
-        norm_path = os.path.normpath(os.path.abspath(file_path))
-
-        # Try direct lookup first
-        thumb_path = self.thumbnail_map.get(norm_path)
-        if thumb_path and os.path.exists(thumb_path):
+        # Direct lookup by stable file ID (follows renames recorded in the registry)
+        thumb_path = self.thumbnail_map.get(self.file_registry.id_of(file_path))
+        if thumb_path and self.thumbnail_store.exists(thumb_path):
             return thumb_path
 
+        norm_path = canonical_path(file_path)
+
         # Try translating input path to processed path
         if self.raw_dir and self.processed_dir and norm_path.startswith(self.raw_dir):
             translated = norm_path.replace(self.raw_dir, self.processed_dir, 1)
-            thumb_path = self.thumbnail_map.get(translated)
-            if thumb_path and os.path.exists(thumb_path):
+            thumb_path = self.thumbnail_map.get(self.file_registry.id_of(translated))
+            if thumb_path and self.thumbnail_store.exists(thumb_path):
                 return thumb_path
 
         # Try translating processed path to input path
         if self.raw_dir and self.processed_dir and norm_path.startswith(self.processed_dir):
             translated = norm_path.replace(self.processed_dir, self.raw_dir, 1)
-            thumb_path = self.thumbnail_map.get(translated)
-            if thumb_path and os.path.exists(thumb_path):
+            thumb_path = self.thumbnail_map.get(self.file_registry.id_of(translated))
+            if thumb_path and self.thumbnail_store.exists(thumb_path):
                 return thumb_path
 
-        # Try finding by filename only (last resort)
-        filename = os.path.basename(norm_path)
-        for map_path, thumb in self.thumbnail_map.items():
-            if os.path.basename(map_path) == filename:
-                if os.path.exists(thumb):
-                    return thumb
-
         return None
 
     def _get_file_time(self, key: int) -> Optional[str]:
@@ -460,8 +457,7 @@ class MetadataAssignmentGUI:
             return
 
         try:
-            with open(self.state_file, 'r', encoding='utf-8') as f:
-                state = json.load(f)
+            state = read_json(self.state_file)
 
             self.current_item_index = state.get('current_item_index', 0)
             self.assignments = state.get('assignments', [])
@@ -488,8 +484,7 @@ class MetadataAssignmentGUI:
         }
 
         try:
-            with open(self.state_file, 'w', encoding='utf-8') as f:
-                json.dump(state, f, indent=2, ensure_ascii=False)
+            stream_json_atomic(state, self.state_file, raise_errors=True)
             self.logger.debug(f"Saved state at item {self.current_item_index + 1}")
         except Exception as e:
             self.logger.error(f"Error saving state: {e}")
@@ -2482,10 +2477,7 @@ class MetadataAssignmentGUI:
 
         if thumb_path:
             try:
-                img = Image.open(thumb_path)
-                orig_w, orig_h = img.size
-                scale = min(size / orig_w, size / orig_h)
-                img = img.resize((int(orig_w * scale), int(orig_h * scale)), Image.Resampling.LANCZOS)
+                img = fit_image(self.thumbnail_store.open_image(thumb_path, size), size)
                 photo = ImageTk.PhotoImage(img)
                 self.image_cache[cache_key] = photo
                 canvas.create_image(size // 2, size // 2, image=photo, anchor='center')
@@ -2768,8 +2760,7 @@ class MetadataAssignmentGUI:
         }
 
         try:
-            with open(self.output_file, 'w', encoding='utf-8') as f:
-                json.dump(results, f, indent=2, ensure_ascii=False)
+            stream_json_atomic(results, self.output_file, raise_errors=True)
             self.logger.info(f"Saved metadata assignments to {self.output_file}")
         except Exception as e:
             self.logger.error(f"Error saving results: {e}")
@@ -2777,8 +2768,7 @@ class MetadataAssignmentGUI:
         # Apply to metadata
         if self.assignments and self.metadata_file.exists():
             try:
-                with open(self.metadata_file, 'r', encoding='utf-8') as f:
-                    metadata = json.load(f)
+                metadata = read_json(self.metadata_file)
 
                 for assignment in self.assignments:
                     for key in assignment['keys']:
@@ -2798,8 +2788,7 @@ class MetadataAssignmentGUI:
                                     'source': 'user_assigned'
                                 }
 
-                with open(self.metadata_file, 'w', encoding='utf-8') as f:
-                    json.dump(metadata, f, indent=2, ensure_ascii=False)
+                stream_json_atomic(metadata, self.metadata_file, raise_errors=True)
 
                 self.logger.info(f"Applied {len(self.assignments)} metadata assignments")
             except Exception as e:
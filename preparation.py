@@ -13,7 +13,7 @@ OVERVIEW
 ================================================================================
 
 This module handles all automated media file preparation tasks. It consolidates
-14 processing steps into a single unified pipeline that:
+16 processing steps into a single unified pipeline that:
 - Extracts and organizes media files
 - Standardizes formats and names
 - Detects and repairs corruption
@@ -37,7 +37,8 @@ INPUTS (Required)
        "outputDrives": ["drive1", "drive2"],         # Multi-drive support
        "tools": {
          "ffmpeg": "ffmpeg",                         # FFmpeg executable
-         "ffprobe": "ffprobe"                        # FFprobe executable
+         "ffprobe": "ffprobe",                       # FFprobe executable
+         "sevenZip": "7z"                            # Optional: 7-Zip for .7z/.rar
        }
      },
      "settings": {
@@ -48,6 +49,10 @@ INPUTS (Required)
        },
        "multiDrive": {
          "minFreeSpaceGB": 10,                       # Switch drives at this threshold
+         "spaceRefreshSeconds": 30,                  # Free-space ledger refresh interval
+         "placement": "fill",                        # fill | stripe (spread writes over all drives)
+         "ioOrder": {"default": "none",              # none | inode | extent (HDD-friendly order)
+                     "drives": {"drive1": "extent"}}
          "autoSwitch": true
        }
      }
@@ -71,27 +76,38 @@ OUTPUTS
 
 2. METADATA FILES (in resultsDirectory):
    - Consolidate_Meta_Results.json   : Complete metadata for all files
+   - file_registry.json              : Stable file IDs <-> canonical paths (with rename aliases)
+   - processing_history.jsonl        : Append-only per-file processing events (by file_id)
    - deletion_manifest.json          : Files marked for deletion (with rollback)
    - video_grouping_info.json        : Video duplicate groups
    - image_grouping_info.json        : Image duplicate groups
    - thumbnail_map.json              : File-to-thumbnail mapping
    - videos_to_reconstruct.json      : List of corrupt videos
    - images_to_reconstruct.json      : List of corrupt images
+   - near_duplicate_images.json      : Visually near-identical image groups (E_prime format)
+   - near_duplicate_videos.json      : Re-encoded/trimmed video copy groups (E_prime format)
+   - pipeline_timing.json            : Per-step timing, critical path and per-tool process stats
+   - tool_capabilities.json          : Cached ffmpeg/ffprobe/7-Zip versions and codecs
+   - library_index.sqlite/.bloom     : Content hash -> canonical file across imports
 
 3. THUMBNAILS (in resultsDirectory/.thumbnails/):
    - JPEG thumbnails for all media files
-   - Named by MD5 hash of source path
+   - Keyed by MD5 hash of source path, plus <hash>_<level> pyramid levels
+     and optional <hash>_strip animated preview strips for videos
+   - Packed into thumbnails_NNN.pack shards + thumbnails.idx (default),
+     or loose <hash>.jpg files when thumbnail.packed is false
 
 4. DELETED FILES (in resultsDirectory/.deleted/):
    - Files moved here instead of permanent deletion
    - Can be restored via rollback() function
 
 ================================================================================
-PIPELINE STEPS (14 Total)
+PIPELINE STEPS (16 Total)
 ================================================================================
 
 Step 1:  EXTRACT ZIP FILES
-         - Extracts all .zip archives to processedDirectory
+         - Extracts .zip, .tar(.gz/.bz2/.xz), .gz/.bz2/.xz and (with 7-Zip)
+           .7z/.rar archives to processedDirectory
          - Cleans Windows-invalid characters from filenames
          - Tracks original source paths in metadata
 
@@ -132,13 +148,15 @@ Step 8:  HASH IMAGES
 
 Step 9:  MARK VIDEO DUPLICATES
          - Identifies exact video duplicates (same hash)
+         - Byte-compares hash groups whose recorded sizes disagree
          - Marks duplicates for deletion
-         - Keeps file with longest name as original
+         - Keeps one file per group by duplicates.keeperPolicy
 
 Step 10: MARK IMAGE DUPLICATES
          - Identifies exact image duplicates (same hash)
+         - Byte-compares hash groups whose recorded sizes disagree
          - Marks duplicates for deletion
-         - Keeps file with longest name as original
+         - Keeps one file per group by duplicates.keeperPolicy
 
 Step 11: DETECT CORRUPTION
          - Checks video playability with OpenCV
@@ -161,6 +179,16 @@ Step 14: CREATE THUMBNAILS
          - Images: LANCZOS resampling
          - Stores in .thumbnails directory
 
+Step 15: FIND NEAR-DUPLICATE IMAGES
+         - dHash/pHash of each image's thumbnail (NumPy, batched)
+         - Multi-index Hamming search for pHash matches within a radius
+         - Writes groups for review; marks nothing for deletion
+
+Step 16: FIND NEAR-DUPLICATE VIDEOS
+         - Fingerprint = duration + pHashes of the preview strip frames
+         - Candidates by duration window, scored by frame-sequence alignment
+         - Writes groups for review; marks nothing for deletion
+
 ================================================================================
 FILENAME PATTERNS (15 Supported Formats)
 ================================================================================
@@ -187,11 +215,14 @@ METADATA STRUCTURE
 
 Each file's metadata object contains:
 {
+    "file_id": 42,                        # Stable ID from file_registry.json
     "name": "filename.ext",
     "hash": "sha256_hash_string",
+    "partial_hash": null,                 # SHA256 of the first 64 KB (optional)
     "size": 12345678,
     "duration": 120.5,                    # For videos (seconds)
     "original_source_path": "path/to/original",
+    "import_mode": "reflink",             # extract | reflink | hardlink | kernel_copy | copy
     "output_drive": "path/to/drive",
     "output_path": "path/to/current/location",
     "is_converted": false,
@@ -202,14 +233,20 @@ Each file's metadata object contains:
     "is_corrupt": false,
     "is_repaired": false,
     "thumbnail_path": "path/to/thumbnail.jpg",
+    "preview_strip": true,                # Video preview strip made (false: too short/unreadable)
+    "dhash": "f0e4c2d7a9b3c1e5",          # 64-bit perceptual hashes of images (step 29)
+    "phash": "d1c3b5a7e9f0a2c4",
+    "video_fingerprint": ["e1c3...", ...], # Frame pHashes of videos (step 31)
     "exif": [{"timestamp": "...", "geotag": {...}}],
     "filename": [{"timestamp": "..."}],
     "ffprobe": [{"timestamp": "...", "rotation": 90}],
     "json": [{"timestamp": "...", "geotag": {...}}],
-    "processing_history": [
-        {"step": "extract", "status": "success", "timestamp": "..."},
-        {"step": "convert", "status": "success", "timestamp": "..."}
-    ]
+    "processing_status": {                # Latest event; full history is in
+        "step": "convert_media",          #  processing_history.jsonl by file_id
+        "status": "success",
+        "message": "Converted from .heic",
+        "timestamp": "..."
+    }
 }
 
 ================================================================================
@@ -250,7 +287,7 @@ STANDARDS COMPLIANCE (Per DIRECTIVES.txt)
    ✅ Files moved to .deleted/ directory (not permanent deletion)
    ✅ DeletionManifest tracks all movements with timestamps
    ✅ rollback() function for undo capability
-   ✅ processing_history tracks all actions
+   ✅ processing_history.jsonl event log tracks all actions
    ✅ Original data preserved until user confirmation
 
 ================================================================================
@@ -293,13 +330,20 @@ import hashlib
 import shutil
 import stat
 import zipfile
+import tarfile
+import gzip
+import bz2
+import lzma
+import zlib
 import re
-import subprocess
+import io
 import contextlib
+import tempfile
 import concurrent.futures
 import threading
+import time
 from pathlib import Path
-from typing import Dict, Any, List, Optional, Tuple, Set
+from typing import Dict, Any, List, NamedTuple, Optional, Tuple, Set
 from datetime import datetime
 
 # Add project root to path
@@ -314,7 +358,30 @@ from Utils.utils import (
     GUIStyle,
     MediaOrganizerConfig,
     FileUtils,
-    PathUtils
+    PathUtils,
+    PathRenameTrie
+)
+from Utils.thumbnail_store import ThumbnailPackWriter, ThumbnailStore, split_preview_strip, strip_path
+from Utils.file_registry import FileRegistry, canonical_path
+from Utils.media_record import MediaRecord, records_from_json, extend_list_field, benchmark_memory
+from Utils.event_log import EventLog, set_active_event_log, get_active_event_log
+from Utils.snapshot import write_snapshot, snapshot_path
+from Utils.jsonio import stream_json_atomic, read_json, configure_json_output
+from Utils.library_index import LibraryIndex
+from Utils.duplicate_resolver import (
+    DuplicateResolver, MediaGrouping, group_media_files, DEFAULT_KEEPER_POLICY, METADATA_LIST_KEYS
+)
+from Utils.process_runner import configure_process_runner, get_process_runner
+from Utils.tool_probe import ToolProfile, configure_tool_probe, get_tool_profile
+from Utils.step_graph import PipelineStep, StepGraph, EXECUTION_PARALLEL, POOL_CPU, POOL_IO
+from Utils.perceptual_hash import (
+    compute_hashes, find_near_duplicates, find_similar_videos, hash_to_hex, hex_to_hash,
+    NUMPY_AVAILABLE, PHASH_SIZE
+)
+from Utils.fileio import (
+    copy_with_hash, import_file, sort_for_io, evict_from_cache, read_file_chunks,
+    set_cache_mode, get_cache_mode,
+    DEFAULT_BUFFER_SIZE, IMPORT_REFLINK, IMPORT_HARDLINK, IO_ORDER_NONE, IO_ORDERS, CACHE_MODE_NORMAL, CACHE_MODES
 )
 
 # Optional imports with availability flags
@@ -359,6 +426,8 @@ VIDEO_EXTENSIONS = {'.mp4', '.avi', '.mov', '.mkv', '.wmv', '.flv', '.webm', '.m
 IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff', '.webp', '.heic', '.heif'}
 CONVERTIBLE_VIDEO_EXTENSIONS = {'.mov', '.avi', '.mkv', '.flv', '.webm', '.mpeg', '.mpx', '.3gp', '.wmv', '.mpg', '.m4v'}
 CONVERTIBLE_PHOTO_EXTENSIONS = {'.jpeg', '.png', '.gif', '.bmp', '.tiff', '.heic', '.heif'}
+TAR_EXTENSIONS = {'.tar', '.tgz', '.tbz', '.tbz2', '.txz'}
+ARCHIVE_EXTENSIONS = {'.zip', '.7z', '.rar', '.gz', '.bz2', '.xz'} | TAR_EXTENSIONS
 
 # Hashing
 HASH_ALGORITHM = "sha256"
@@ -379,14 +448,68 @@ def get_settings_from_config(config_data: dict) -> dict:
     thumbnail_width = thumbnail_config.get('width', GUIStyle.GRID_MIN_THUMBNAIL_SIZE)
     thumbnail_height = thumbnail_config.get('height', GUIStyle.GRID_MIN_THUMBNAIL_SIZE)
     thumbnail_quality = thumbnail_config.get('quality', 85)
+    thumbnail_packed = thumbnail_config.get('packed', True)
+    thumbnail_pyramid_levels = thumbnail_config.get('pyramidLevels', list(GUIStyle.THUMBNAIL_PYRAMID_LEVELS))
+    thumbnail_pack_shard_mb = thumbnail_config.get('packShardSizeMB', 512)
+    preview_strip_config = thumbnail_config.get('previewStrip', {})
 
     # Multi-drive settings
     min_free_space_gb = multi_drive.get('minFreeSpaceGB', 10)
 
+    # Extraction settings
+    extraction = settings.get('extraction', {})
+
+    # Near-duplicate image settings
+    near_duplicates = settings.get('nearDuplicates', {})
+
+    # Step scheduling
+    pipeline = settings.get('pipeline', {})
+
+    # External tools (ffmpeg, ffprobe, 7-Zip)
+    processes = settings.get('processes', {})
+
     return {
         'thumbnail_size': (thumbnail_width, thumbnail_height),
         'thumbnail_quality': thumbnail_quality,
+        'thumbnail_packed': thumbnail_packed,
+        'thumbnail_pyramid_levels': sorted(thumbnail_pyramid_levels),
+        'thumbnail_pack_shard_bytes': thumbnail_pack_shard_mb * 1024 * 1024,
+        'preview_strip_enabled': preview_strip_config.get('enabled', False),
+        'preview_strip_frames': preview_strip_config.get('frames', 8),
+        'preview_strip_frame_size': preview_strip_config.get('frameSize', 384),
         'min_free_space_bytes': min_free_space_gb * 1024 * 1024 * 1024,
+        'space_refresh_seconds': multi_drive.get('spaceRefreshSeconds', DEFAULT_SPACE_REFRESH_SECONDS),
+        'drive_placement': multi_drive.get('placement', PLACEMENT_FILL),
+        'drive_io_order': multi_drive.get('ioOrder', {}),
+        'io_cache_mode': settings.get('io', {}).get('cacheMode', CACHE_MODE_NORMAL),
+        'extraction_workers_per_drive': extraction.get('workersPerDrive', 4),
+        'extraction_buffer_bytes': int(extraction.get('copyBufferMB', 1) * 1024 * 1024),
+        'extraction_task_bytes': int(extraction.get('taskSizeMB', 256) * 1024 * 1024),
+        'extraction_skip_duplicates': extraction.get('skipDuplicateMembers', True),
+        'extraction_confirm_duplicates': extraction.get('confirmDuplicatesByHash', False),
+        'extraction_hash_on_write': extraction.get('hashOnWrite', True),
+        'extraction_partial_hash': extraction.get('partialHash', False),
+        'extraction_import_mode': extraction.get('importMode', 'auto'),
+        'library_index_enabled': settings.get('libraryIndex', {}).get('enabled', True),
+        'pipeline_execution': pipeline.get('execution', EXECUTION_PARALLEL),
+        'pipeline_io_workers': pipeline.get('ioWorkers', 2),
+        'pipeline_cpu_workers': pipeline.get('cpuWorkers', 2),
+        'pipeline_io_steps_per_drive': pipeline.get('ioStepsPerDrive', 2),
+        'process_max_concurrent': processes.get('maxConcurrent', 4),
+        'process_ffprobe_timeout': processes.get('ffprobeTimeout', 30),
+        'process_ffmpeg_timeout': processes.get('ffmpegTimeout', 300),
+        'process_convert_timeout': processes.get('convertTimeout', 3600),
+        'duplicate_keeper_policy': settings.get('duplicates', {}).get('keeperPolicy', DEFAULT_KEEPER_POLICY),
+        'near_duplicates_enabled': near_duplicates.get('enabled', True),
+        'near_duplicates_phash_radius': near_duplicates.get('phashRadius', 8),
+        'near_duplicates_dhash_radius': near_duplicates.get('dhashRadius', 16),
+        'near_duplicates_batch_size': near_duplicates.get('batchSize', 512),
+        'near_duplicates_videos': near_duplicates.get('videos', True),
+        'near_duplicates_frame_radius': near_duplicates.get('videoFrameRadius', 10),
+        'near_duplicates_min_score': near_duplicates.get('videoMinScore', 0.6),
+        'near_duplicates_duration_tolerance': near_duplicates.get('videoDurationTolerance', 2.0),
+        'near_duplicates_duration_ratio': near_duplicates.get('videoDurationRatio', 0.05),
+        'near_duplicates_workers': near_duplicates.get('workers', 4),
         'gui': {
             'frame_bg_primary': gui_settings.get('frameColors', {}).get('primary', GUIStyle.FRAME_BG_PRIMARY),
             'frame_bg_secondary': gui_settings.get('frameColors', {}).get('secondary', GUIStyle.FRAME_BG_SECONDARY),
@@ -409,6 +532,9 @@ def get_settings_from_config(config_data: dict) -> dict:
 # Default values (used if config not loaded yet)
 DEFAULT_THUMBNAIL_SIZE = (GUIStyle.GRID_MIN_THUMBNAIL_SIZE, GUIStyle.GRID_MIN_THUMBNAIL_SIZE)
 DEFAULT_MIN_FREE_SPACE_BYTES = 10 * 1024 * 1024 * 1024  # 10 GB
+DEFAULT_SPACE_REFRESH_SECONDS = 30
+PLACEMENT_FILL = "fill"      # Fill the current drive, switch when it runs low
+PLACEMENT_STRIPE = "stripe"  # Spread new files across all drives
 
 
 # =============================================================================
@@ -420,9 +546,28 @@ class DriveManager:
     Manages multiple output drives with automatic switching when drives fill up.
     Auto-detects available space and switches to next drive when below minimum free space.
     Uses settings from config.json for min_free_space threshold.
+
+    Free space is tracked in an in-memory ledger instead of being queried for
+    every file. The ledger is refreshed from the filesystem every
+    refresh_interval seconds (or when a reservation would otherwise fail).
+    Writers reserve bytes before writing and release them afterwards,
+    reporting what they actually wrote, so concurrent writers never
+    over-commit a drive. All ledger operations hold one lock.
+
+    With the "stripe" placement policy, new files are spread over all drives
+    by smooth weighted round-robin; a drive's weight is its available space
+    times its measured write throughput, so faster and emptier disks take
+    proportionally more of the load.
+
+    Each drive also has an I/O order (none/inode/extent) used by
+    order_for_io() to sort per-step work lists by physical location, which
+    avoids seek storms on spinning disks.
     """
 
-    def __init__(self, output_drives: List[str], logger, min_free_space: int = DEFAULT_MIN_FREE_SPACE_BYTES):
+    def __init__(self, output_drives: List[str], logger, min_free_space: int = DEFAULT_MIN_FREE_SPACE_BYTES,
+                 refresh_interval: float = DEFAULT_SPACE_REFRESH_SECONDS,
+                 placement: str = PLACEMENT_FILL,
+                 io_order: Optional[Dict[str, Any]] = None):
         """
         Initialize drive manager.
 
@@ -430,17 +575,38 @@ class DriveManager:
             output_drives: List of output directory paths (can be on different drives)
             logger: Logger instance
             min_free_space: Minimum free space in bytes before switching (default 10GB)
+            refresh_interval: Seconds between free-space refreshes of the ledger
+            placement: PLACEMENT_FILL or PLACEMENT_STRIPE
+            io_order: {'default': mode, 'drives': {drive_path: mode}} with modes
+                      from Utils.fileio.IO_ORDERS
         """
         self.logger = logger
         self.min_free_space = min_free_space
+        self.refresh_interval = refresh_interval
+        if placement not in (PLACEMENT_FILL, PLACEMENT_STRIPE):
+            self.logger.warning(f"Unknown placement policy '{placement}', using '{PLACEMENT_FILL}'")
+            placement = PLACEMENT_FILL
+        self.placement = placement
         self.drives = []
         self.current_drive_index = 0
 
+        # Free-space ledger, keyed by device so drives sharing a filesystem share one balance
+        self._lock = threading.RLock()
+        self._device: Dict[Path, int] = {}
+        self._free: Dict[int, int] = {}
+        self._reserved: Dict[int, int] = {}
+        self._refreshed_at = 0.0
+
+        # Striping state: measured write throughput (bytes/s, EWMA) and round-robin credit
+        self._throughput: Dict[Path, float] = {}
+        self._stripe_credit: Dict[Path, float] = {}
+
         # Validate and setup drives
         for drive_path in output_drives:
             drive_path = Path(drive_path)
             try:
                 drive_path.mkdir(parents=True, exist_ok=True)
+                self._device[drive_path] = drive_path.stat().st_dev
                 self.drives.append(drive_path)
                 self.logger.info(f"Registered output drive: {drive_path}")
             except Exception as e:
@@ -449,6 +615,20 @@ class DriveManager:
         if not self.drives:
             raise ValueError("No valid output drives configured")
 
+        # Per-drive work-list ordering
+        io_order = io_order or {}
+        default_order = io_order.get('default', IO_ORDER_NONE)
+        per_drive = {Path(path): mode for path, mode in io_order.get('drives', {}).items()}
+        self.io_order: Dict[Path, str] = {}
+        for drive in self.drives:
+            mode = per_drive.get(drive, default_order)
+            if mode not in IO_ORDERS:
+                self.logger.warning(f"Unknown I/O order '{mode}' for {drive}, using '{IO_ORDER_NONE}'")
+                mode = IO_ORDER_NONE
+            self.io_order[drive] = mode
+            if mode != IO_ORDER_NONE:
+                self.logger.info(f"Drive {drive}: work lists sorted by {mode}")
+
         # Select initial drive with most free space
         self._select_best_drive()
 
@@ -469,13 +649,32 @@ class DriveManager:
             self.logger.warning(f"Could not get free space for {path}: {e}")
             return 0
 
+    def refresh(self, force: bool = False) -> None:
+        """
+        Re-read free space for all drives if the ledger is stale.
+
+        Outstanding reservations are kept; bytes already written are part of
+        the fresh reading.
+        """
+        with self._lock:
+            if not force and time.monotonic() - self._refreshed_at < self.refresh_interval:
+                return
+            for drive in self.drives:
+                self._free[self._device[drive]] = self._get_free_space(drive)
+            self._refreshed_at = time.monotonic()
+
+    def _available(self, drive: Path) -> int:
+        device = self._device[drive]
+        return self._free.get(device, 0) - self._reserved.get(device, 0)
+
     def _select_best_drive(self):
         """Select the drive with the most free space."""
         best_index = 0
         best_space = 0
 
+        self.refresh(force=True)
         for i, drive in enumerate(self.drives):
-            free_space = self._get_free_space(drive)
+            free_space = self._free[self._device[drive]]
             self.logger.info(f"Drive {drive}: {free_space / (1024**3):.2f} GB free")
             if free_space > best_space:
                 best_space = free_space
@@ -488,47 +687,152 @@ class DriveManager:
         """Get the current active output drive."""
         return self.drives[self.current_drive_index]
 
-    def check_and_switch_drive(self, required_space: int = 0) -> bool:
+    def drive_of(self, path: Path) -> Path:
+        """Return the output drive containing path (current drive if none does)."""
+        path = Path(path)
+        for drive in self.drives:
+            if path == drive or drive in path.parents:
+                return drive
+        return self.get_current_drive()
+
+    def record_throughput(self, drive: Path, nbytes: int, seconds: float) -> None:
+        """Feed a completed write into the drive's throughput estimate (used for striping)."""
+        if nbytes <= 0 or seconds <= 0:
+            return
+        with self._lock:
+            drive = self.drive_of(drive)
+            sample = nbytes / seconds
+            previous = self._throughput.get(drive)
+            self._throughput[drive] = sample if previous is None else 0.8 * previous + 0.2 * sample
+
+    def _stripe_candidates(self, needed_space: int) -> List[Path]:
+        """Order drives for the next striped write (smooth weighted round-robin)."""
+        eligible = [d for d in self.drives if self._available(d) >= needed_space]
+        if not eligible:
+            return []
+
+        # Unmeasured drives are assumed to be as fast as the average measured one
+        measured = [self._throughput[d] for d in eligible if d in self._throughput]
+        default_rate = sum(measured) / len(measured) if measured else 1.0
+        weights = {d: max(1, self._available(d) - self.min_free_space) *
+                   self._throughput.get(d, default_rate) for d in eligible}
+        total = sum(weights.values())
+
+        for d in eligible:
+            self._stripe_credit[d] = self._stripe_credit.get(d, 0.0) + weights[d] / total
+        chosen = max(eligible, key=lambda d: self._stripe_credit[d])
+        self._stripe_credit[chosen] -= 1.0
+        return [chosen] + [d for d in eligible if d != chosen]
+
+    def order_for_io(self, paths: List[Any]) -> List[Any]:
         """
-        Check if current drive has enough space, switch if needed.
+        Sort a work list by physical location, per drive.
+
+        Paths are grouped by drive (in drive order) and each group is sorted
+        by that drive's I/O order. Items are returned unchanged (str or Path).
+        """
+        if all(mode == IO_ORDER_NONE for mode in self.io_order.values()):
+            return list(paths)
+        groups: Dict[Path, List[Any]] = {drive: [] for drive in self.drives}
+        for path in paths:
+            groups[self.drive_of(Path(path))].append(path)
+        ordered = []
+        for drive, group in groups.items():
+            ordered.extend(sort_for_io(group, self.io_order[drive]))
+        return ordered
+
+    def reserve(self, required_space: int, drive: Optional[Path] = None) -> Optional[Path]:
+        """
+        Atomically reserve space for a write.
 
         Args:
-            required_space: Additional space required for next operation
+            required_space: Bytes about to be written
+            drive: Drive to reserve on; None picks one by the placement policy
+                   (current drive with switching, or the next stripe)
 
         Returns:
-            True if a valid drive is available, False if all drives are full
+            The drive holding the reservation, or None if no drive has room
         """
-        current_drive = self.drives[self.current_drive_index]
-        free_space = self._get_free_space(current_drive)
-
+        required_space = max(0, int(required_space))
         needed_space = self.min_free_space + required_space
 
-        if free_space >= needed_space:
-            return True
+        with self._lock:
+            self.refresh()
+            current_drive = self.get_current_drive()
+
+            for force in (False, True):
+                if force:
+                    # The ledger may be pessimistic (files deleted, estimates too high)
+                    self.refresh(force=True)
+                if drive is not None:
+                    candidates = [drive]
+                elif self.placement == PLACEMENT_STRIPE:
+                    candidates = self._stripe_candidates(needed_space)
+                else:
+                    candidates = [current_drive] + [d for d in self.drives if d != current_drive]
+                for candidate in candidates:
+                    if self._available(candidate) < needed_space:
+                        continue
+                    device = self._device[candidate]
+                    self._reserved[device] = self._reserved.get(device, 0) + required_space
+                    if drive is None and self.placement == PLACEMENT_STRIPE:
+                        self.current_drive_index = self.drives.index(candidate)
+                    elif drive is None and candidate != current_drive:
+                        self.logger.warning(
+                            f"Drive {current_drive} low on space "
+                            f"({self._available(current_drive) / (1024**3):.2f} GB available)."
+                        )
+                        self.current_drive_index = self.drives.index(candidate)
+                        self.logger.info(f"Switched to drive: {candidate} "
+                                         f"({self._available(candidate) / (1024**3):.2f} GB available)")
+                    return candidate
 
-        self.logger.warning(
-            f"Drive {current_drive} low on space ({free_space / (1024**3):.2f} GB free). "
-            f"Looking for another drive..."
-        )
+        if drive is None:
+            self.logger.error("All drives are full! Cannot continue.")
+        else:
+            self.logger.error(f"Drive {drive} does not have {required_space:,} bytes available.")
+        return None
 
-        # Try to find another drive with enough space
-        for i, drive in enumerate(self.drives):
-            if i == self.current_drive_index:
-                continue
+    def release(self, path: Path, reserved: int, written: int = 0) -> None:
+        """
+        Release a reservation and record what was actually written.
 
-            drive_free = self._get_free_space(drive)
-            if drive_free >= needed_space:
-                self.current_drive_index = i
-                self.logger.info(f"Switched to drive: {drive} ({drive_free / (1024**3):.2f} GB free)")
-                return True
+        Args:
+            path: The drive (or any path on it) the reservation was made on
+            reserved: Bytes that were reserved
+            written: Bytes actually written (charged to the ledger until the next refresh)
+        """
+        with self._lock:
+            device = self._device[self.drive_of(path)]
+            self._reserved[device] = max(0, self._reserved.get(device, 0) - max(0, int(reserved)))
+            self._free[device] = self._free.get(device, 0) - max(0, int(written))
 
-        self.logger.error("All drives are full! Cannot continue.")
-        return False
+    def check_and_switch_drive(self, required_space: int = 0) -> bool:
+        """
+        Check if current drive has enough space, switch if needed.
+
+        Uses the free-space ledger; nothing is reserved.
+
+        Args:
+            required_space: Additional space required for next operation
+
+        Returns:
+            True if a valid drive is available, False if all drives are full
+        """
+        with self._lock:
+            drive = self.reserve(required_space)
+            if drive is None:
+                return False
+            self.release(drive, required_space)
+            return True
 
     def get_output_path(self, relative_path: str, file_size: int = 0) -> Optional[Path]:
         """
         Get full output path on current drive, switching drives if needed.
 
+        file_size bytes are reserved on the chosen drive; call
+        release(output_path, file_size, written) once the file is written.
+
         Args:
             relative_path: Relative path within the output directory
             file_size: Size of file to be written (for space checking)
@@ -536,28 +840,66 @@ class DriveManager:
         Returns:
             Full output path, or None if no drive has enough space
         """
-        if not self.check_and_switch_drive(file_size):
+        drive = self.reserve(file_size)
+        if drive is None:
             return None
 
-        output_path = self.get_current_drive() / relative_path
+        output_path = drive / relative_path
         output_path.parent.mkdir(parents=True, exist_ok=True)
         return output_path
 
     def get_drive_status(self) -> List[Dict[str, Any]]:
         """Get status of all drives."""
         status = []
-        for i, drive in enumerate(self.drives):
-            free_space = self._get_free_space(drive)
-            status.append({
-                "path": str(drive),
-                "free_space_gb": free_space / (1024**3),
-                "free_space_bytes": free_space,
-                "is_current": i == self.current_drive_index,
-                "is_full": free_space < self.min_free_space
-            })
+        with self._lock:
+            self.refresh(force=True)
+            for i, drive in enumerate(self.drives):
+                free_space = self._free[self._device[drive]]
+                status.append({
+                    "path": str(drive),
+                    "free_space_gb": free_space / (1024**3),
+                    "free_space_bytes": free_space,
+                    "reserved_bytes": self._reserved.get(self._device[drive], 0),
+                    "write_throughput_mbps": round(self._throughput.get(drive, 0.0) / (1024**2), 1),
+                    "is_current": i == self.current_drive_index,
+                    "is_full": free_space < self.min_free_space
+                })
         return status
 
 
+class DriveWorkerPool:
+    """
+    One thread pool per output drive.
+
+    Every disk gets its own I/O queue, so a slow or busy drive never holds up
+    writes to the others and total bandwidth scales with the number of drives.
+    """
+
+    def __init__(self, drives: List[Path], workers_per_drive: int = 4):
+        self.workers_per_drive = max(1, workers_per_drive)
+        self._executors = {
+            drive: concurrent.futures.ThreadPoolExecutor(
+                max_workers=self.workers_per_drive,
+                thread_name_prefix=f"io-{drive.name or 'drive'}"
+            )
+            for drive in drives
+        }
+
+    def submit(self, drive: Path, fn, *args, **kwargs) -> concurrent.futures.Future:
+        """Queue fn on the drive's workers."""
+        return self._executors[drive].submit(fn, *args, **kwargs)
+
+    def shutdown(self, wait: bool = True) -> None:
+        for executor in self._executors.values():
+            executor.shutdown(wait=wait)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.shutdown()
+
+
 # =============================================================================
 # DELETION MANIFEST MANAGER
 # =============================================================================
@@ -566,6 +908,7 @@ class DeletionManifest:
     """
     Manages files marked for deletion without actually deleting them.
     Creates a JSON manifest that can be reviewed before actual deletion.
+    Marking and saving hold one lock, so concurrent steps can share a manifest.
     """
 
     def __init__(self, manifest_path: Path, logger):
@@ -578,14 +921,14 @@ class DeletionManifest:
         """
         self.manifest_path = manifest_path
         self.logger = logger
+        self._lock = threading.RLock()
         self.manifest = self._load_manifest()
 
     def _load_manifest(self) -> Dict[str, Any]:
         """Load existing manifest or create new one."""
         if self.manifest_path.exists():
             try:
-                with open(self.manifest_path, 'r', encoding='utf-8') as f:
-                    return json.load(f)
+                return read_json(self.manifest_path)
             except Exception as e:
                 self.logger.warning(f"Could not load manifest: {e}")
 
@@ -600,12 +943,9 @@ class DeletionManifest:
     def _save_manifest(self) -> bool:
         """Save manifest to file atomically."""
         try:
-            self.manifest["updated_at"] = datetime.now().isoformat()
-            temp_path = self.manifest_path.with_suffix('.tmp')
-            with open(temp_path, 'w', encoding='utf-8') as f:
-                json.dump(self.manifest, f, indent=2, ensure_ascii=False)
-            temp_path.replace(self.manifest_path)
-            return True
+            with self._lock:
+                self.manifest["updated_at"] = datetime.now().isoformat()
+                return stream_json_atomic(self.manifest, self.manifest_path, self.logger)
         except Exception as e:
             self.logger.error(f"Failed to save manifest: {e}")
             return False
@@ -635,12 +975,6 @@ class DeletionManifest:
         Returns:
             True if successfully marked
         """
-        # Check if already marked
-        for entry in self.manifest["entries"]:
-            if entry["file_path"] == file_path:
-                self.logger.debug(f"File already marked for deletion: {file_path}")
-                return True
-
         # Get file info if not provided
         if file_size is None:
             try:
@@ -648,6 +982,19 @@ class DeletionManifest:
             except:
                 file_size = 0
 
+        with self._lock:
+            return self._add_entry(file_path, reason, original_path, duplicate_of,
+                                   file_size, file_hash, metadata)
+
+    def _add_entry(self, file_path: str, reason: str, original_path: Optional[str],
+                   duplicate_of: Optional[str], file_size: int, file_hash: Optional[str],
+                   metadata: Optional[Dict]) -> bool:
+        # Check if already marked
+        for entry in self.manifest["entries"]:
+            if entry["file_path"] == file_path:
+                self.logger.debug(f"File already marked for deletion: {file_path}")
+                return True
+
         entry = {
             "file_path": file_path,
             "original_path": original_path,
@@ -669,14 +1016,15 @@ class DeletionManifest:
 
     def unmark(self, file_path: str) -> bool:
         """Remove a file from the deletion manifest."""
-        for i, entry in enumerate(self.manifest["entries"]):
-            if entry["file_path"] == file_path:
-                removed = self.manifest["entries"].pop(i)
-                self.manifest["total_marked"] -= 1
-                self.manifest["total_size_bytes"] -= removed.get("file_size", 0)
-                self.logger.info(f"Unmarked from deletion: {file_path}")
-                return self._save_manifest()
-        return False
+        with self._lock:
+            for i, entry in enumerate(self.manifest["entries"]):
+                if entry["file_path"] == file_path:
+                    removed = self.manifest["entries"].pop(i)
+                    self.manifest["total_marked"] -= 1
+                    self.manifest["total_size_bytes"] -= removed.get("file_size", 0)
+                    self.logger.info(f"Unmarked from deletion: {file_path}")
+                    return self._save_manifest()
+            return False
 
     def is_marked(self, file_path: str) -> bool:
         """Check if a file is marked for deletion."""
@@ -825,7 +1173,7 @@ def create_default_metadata_object(
     output_drive: Optional[str] = None
 ) -> Dict[str, Any]:
     """
-    Create a default metadata object for a file.
+    Create a default metadata object for a file (as a compact MediaRecord).
 
     Args:
         file_path: Current path of the file
@@ -835,12 +1183,15 @@ def create_default_metadata_object(
     try:
         name = file_path.name if file_path.exists() else None
         size = file_path.stat().st_size if file_path.exists() else None
-        return {
+        return MediaRecord.from_dict({
+            "file_id": None,                                # Assigned by FileRegistry.sync_metadata
             "name": name,
             "hash": None,
+            "partial_hash": None,                           # Hash of the first 64 KB (prefilter)
             "size": size,
             "duration": None,
             "original_source_path": original_source_path,  # NEW: Track original location
+            "import_mode": None,                            # How step 1 brought the file in
             "output_drive": output_drive,                   # NEW: Track which drive
             "output_path": str(file_path),                  # NEW: Current output path
             "is_converted": False,                          # NEW: Was format converted
@@ -851,19 +1202,26 @@ def create_default_metadata_object(
             "is_corrupt": False,                            # NEW: Corruption detected
             "is_repaired": False,                           # NEW: Successfully repaired
             "thumbnail_path": None,                         # Thumbnail location
+            "preview_strip": None,                          # Strip made (step 27); false = video too short/unreadable
+            "dhash": None,                                  # Perceptual hashes (step 29, images)
+            "phash": None,
+            "video_fingerprint": None,                      # Frame pHashes (step 31, videos)
             "exif": [],
             "filename": [],
             "ffprobe": [],
             "json": [],
-            "processing_history": []                        # NEW: Track all processing steps
-        }
+            "processing_status": None                       # Latest processing event
+        })
     except Exception:
-        return {
+        return MediaRecord.from_dict({
+            "file_id": None,
             "name": file_path.name if file_path else None,
             "hash": None,
+            "partial_hash": None,
             "size": None,
             "duration": None,
             "original_source_path": original_source_path,
+            "import_mode": None,
             "output_drive": output_drive,
             "output_path": str(file_path) if file_path else None,
             "is_converted": False,
@@ -874,70 +1232,85 @@ def create_default_metadata_object(
             "is_corrupt": False,
             "is_repaired": False,
             "thumbnail_path": None,
+            "preview_strip": None,
+            "dhash": None,
+            "phash": None,
+            "video_fingerprint": None,
             "exif": [],
             "filename": [],
             "ffprobe": [],
             "json": [],
-            "processing_history": []
-        }
+            "processing_status": None
+        })
 
 
 def add_processing_history(metadata: Dict, step_name: str, status: str, message: str = ""):
-    """Add a processing history entry to metadata."""
-    if "processing_history" not in metadata:
-        metadata["processing_history"] = []
+    """
+    Record a processing event for a file.
 
-    metadata["processing_history"].append({
+    The event goes to the active event log under the record's file_id and
+    replaces the record's processing_status. Records without a file_id (or
+    with no active log) keep the event in processing_history until
+    EventLog.absorb() moves it out.
+    """
+    event = {
         "step": step_name,
         "status": status,
         "message": message,
         "timestamp": datetime.now().isoformat()
-    })
+    }
+    metadata["processing_status"] = event
+
+    event_log = get_active_event_log()
+    file_id = metadata.get("file_id")
+    if event_log is not None and file_id is not None:
+        event_log.append(file_id, event)
+        return
+
+    if isinstance(metadata, MediaRecord):
+        metadata.add_history(step_name, status, message, event["timestamp"])
+        return
+
+    if "processing_history" not in metadata:
+        metadata["processing_history"] = []
+    metadata["processing_history"].append(event)
 
 
 def load_metadata(metadata_path: Path, logger) -> Dict[str, Any]:
-    """Load metadata from JSON file."""
+    """Load metadata from JSON file into compact MediaRecords."""
     if not metadata_path.exists():
         logger.warning(f"Metadata file not found: {metadata_path}")
         return {}
     try:
-        with open(metadata_path, 'r', encoding='utf-8') as f:
-            raw_data = json.load(f)
+        raw_data = read_json(metadata_path)
         # Normalize paths
         normalized_data = {}
         for path, metadata in raw_data.items():
             normalized_path = path.replace('\\', '/')
             normalized_data[normalized_path] = metadata
-        return normalized_data
+        return records_from_json(normalized_data)
     except Exception as e:
         logger.error(f"Failed to load metadata from {metadata_path}: {e}")
         return {}
 
 
 def save_metadata_atomic(metadata: Dict[str, Any], output_path: Path, logger) -> bool:
-    """Atomically save metadata to JSON file."""
-    try:
-        temp_path = output_path.with_suffix('.tmp')
-        with open(temp_path, 'w', encoding='utf-8') as f:
-            json.dump(metadata, f, indent=2, ensure_ascii=False)
-        temp_path.replace(output_path)
+    """Atomically save metadata to JSON file, streamed record by record (see Utils.jsonio)."""
+    if stream_json_atomic(metadata, output_path, logger):
         logger.info(f"Successfully saved metadata to: {output_path}")
         return True
-    except Exception as e:
-        logger.error(f"Failed to save metadata to {output_path}: {e}")
-        return False
+    logger.error(f"Failed to save metadata to {output_path}")
+    return False
 
 
 def generate_file_hash(file_path: str) -> Optional[str]:
     """Generate SHA256 hash for a file."""
     try:
         hasher = hashlib.new(HASH_ALGORITHM)
-        with open(file_path, 'rb') as f:
-            while True:
-                chunk = f.read(CHUNK_SIZE)
-                if not chunk:
-                    break
-                hasher.update(chunk)
+        # Large reads: 4 KB chunks would mean one syscall (or one O_DIRECT
+        # request with no readahead) per 4 KB
+        for chunk in read_file_chunks(file_path, DEFAULT_BUFFER_SIZE):
+            hasher.update(chunk)
         return hasher.hexdigest()
     except Exception:
         return None
@@ -967,272 +1340,994 @@ def get_sanitized_name(name: str) -> str:
 # STEP 1: EXTRACT ZIP FILES (PRESERVES ORIGINALS)
 # =============================================================================
 
-def extract_with_overwrite(zip_ref, extract_to: Path, logger, progress_callback=None):
-    """Extract ZIP archive with overwrite support."""
-    members = [m for m in zip_ref.infolist() if not m.is_dir()]
-    total_files = len(members)
+def clean_member_name(filename: str) -> str:
+    """Clean an archive member name for Windows compatibility."""
+    clean_filename = re.sub(r'([^/\\]+) +([/\\])', r'\1\2', filename)
+    clean_filename = re.sub(r' +$', '', clean_filename)
+    return clean_filename
 
-    for idx, member in enumerate(members, 1):
-        try:
-            if progress_callback:
-                progress_callback(idx, total_files)
 
-            # Clean the filename for Windows compatibility
-            clean_filename = member.filename
-            clean_filename = re.sub(r'([^/\\]+) +([/\\])', r'\1\2', clean_filename)
-            clean_filename = re.sub(r' +$', '', clean_filename)
+def member_target_path(drive: Path, member_name: str) -> Path:
+    """Map an archive member name to its output path, keeping it inside drive."""
+    parts = [part for part in re.split(r'[/\\]+', clean_member_name(member_name))
+             if part not in ('', '.', '..')]
+    return drive.joinpath(*parts) if parts else drive / '_unnamed_'
 
-            target_path = extract_to / clean_filename
-            target_path.parent.mkdir(parents=True, exist_ok=True)
 
-            if target_path.exists():
-                logger.debug(f"Skipping existing file: {clean_filename}")
-                continue
+def find_seven_zip(config_data: dict) -> Optional[str]:
+    """Return the 7-Zip executable from config or PATH, or None if unavailable."""
+    configured = config_data.get('paths', {}).get('tools', {}).get('sevenZip')
+    for candidate in ([configured] if configured else []) + ['7z', '7zz']:
+        if os.path.isfile(candidate) or shutil.which(candidate):
+            return candidate
+    return None
 
-            with zip_ref.open(member) as source, open(target_path, 'wb') as target:
-                shutil.copyfileobj(source, target)
 
-        except Exception as e:
-            logger.warning(f"Failed to extract {member.filename}: {e}")
+class ArchiveMember(NamedTuple):
+    """A regular file inside an archive."""
+    name: str
+    size: Optional[int]  # None when the format does not record it up front
+    crc: Optional[int]   # CRC32 when the format stores one (zip, 7z, rar)
+    info: Any            # Backend handle (ZipInfo, TarInfo, ...)
 
 
-def step1_extract_zip_files(config_data: dict, logger, drive_manager: DriveManager) -> Tuple[bool, Dict[str, str]]:
-    """
-    Step 1: Extract all archive files from source directory.
-    PRESERVES original ZIP files (does not delete them).
+class ZipArchiveReader:
+    """Random-access reader for ZIP archives."""
 
-    Returns:
-        Tuple of (success, source_mapping) where source_mapping maps output_path -> original_zip_path
-    """
-    logger.info("--- Step 1: Extract Zip Files Started ---")
+    random_access = True
 
-    progress_info = config_data.get('_progress', {})
-    number_of_enabled_real_steps = progress_info.get('number_of_enabled_real_steps', 1)
-    current_enabled_real_step = progress_info.get('current_enabled_real_step', 1)
+    def __init__(self, path: Path):
+        self.path = path
 
-    raw_directory = config_data['paths']['rawDirectory']
-    raw_path = Path(raw_directory)
+    def list_members(self) -> List[ArchiveMember]:
+        with zipfile.ZipFile(self.path, 'r') as zip_ref:
+            return [ArchiveMember(m.filename, m.file_size, m.CRC, m)
+                    for m in zip_ref.infolist() if not m.is_dir()]
 
-    if not raw_path.exists():
-        logger.error(f"Source directory does not exist: {raw_directory}")
-        return False, {}
+    def open_handle(self) -> zipfile.ZipFile:
+        return zipfile.ZipFile(self.path, 'r')
 
-    # Track mapping of extracted files to their source
-    source_mapping = {}  # output_path -> original_source_path
 
-    zip_files = list(raw_path.glob('*.zip'))
+class TarArchiveReader:
+    """
+    Streaming reader for tar archives, plain or compressed (gz/bz2/xz).
 
-    if not zip_files:
-        logger.info("No zip files found to extract.")
-        # Still copy non-archive files
-    else:
-        total_size = sum(zip_path.stat().st_size for zip_path in zip_files)
-        logger.info(f"Found {len(zip_files)} zip files to extract (total size: {total_size:,} bytes).")
+    Uses tarfile's stream mode, so a compressed tar is decompressed once,
+    front to back, and members are handed out as they are reached.
+    """
 
-        errors = 0
-        processed_size = 0
+    random_access = False
 
-        for zip_index, zip_path in enumerate(zip_files, 1):
-            file_size = zip_path.stat().st_size
+    def __init__(self, path: Path):
+        self.path = path
 
-            # Check drive space before extraction
-            if not drive_manager.check_and_switch_drive(file_size * 2):  # Estimate 2x for safety
-                logger.error("No drive space available for extraction")
-                return False, source_mapping
+    def list_members(self) -> Optional[List[ArchiveMember]]:
+        return None  # Listing a compressed tar would cost a full decompression
 
-            current_output = drive_manager.get_current_drive()
+    def iter_members(self):
+        with tarfile.open(self.path, 'r|*') as tar:
+            for info in tar:
+                if info.isfile():
+                    yield ArchiveMember(info.name, info.size, None, info), tar.extractfile(info)
 
-            try:
-                with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-                    last_percent = [0]
-
-                    def zip_progress_callback(current_file, total_files_in_zip):
-                        zip_progress = (current_file / total_files_in_zip) if total_files_in_zip > 0 else 1.0
-                        current_file_progress = processed_size + (file_size * zip_progress)
-                        subtask_percent = int((current_file_progress / total_size) * 100) if total_size > 0 else 0
-
-                        if (current_file % 50 == 0 or
-                            abs(subtask_percent - last_percent[0]) >= 2 or
-                            current_file == total_files_in_zip):
-                            last_percent[0] = subtask_percent
-                            update_pipeline_progress(
-                                number_of_enabled_real_steps,
-                                current_enabled_real_step,
-                                "Extract Zip Files",
-                                subtask_percent,
-                                f"Extracting: {zip_path.name} ({zip_index}/{len(zip_files)})"
-                            )
 
-                    # Track extracted files
-                    for member in zip_ref.infolist():
-                        if not member.is_dir():
-                            output_file = current_output / member.filename
-                            source_mapping[str(output_file)] = str(zip_path)
+class CompressedFileReader:
+    """Streaming reader for a single gzip/bzip2/xz compressed file (not a tar)."""
 
-                    extract_with_overwrite(zip_ref, current_output, logger, zip_progress_callback)
-                    logger.info(f"Successfully extracted '{zip_path.name}' (SOURCE PRESERVED)")
+    random_access = False
+    OPENERS = {'.gz': gzip.open, '.bz2': bz2.open, '.xz': lzma.open}
 
-                processed_size += file_size
+    def __init__(self, path: Path):
+        self.path = path
 
-            except zipfile.BadZipFile:
-                logger.error(f"'{zip_path.name}' is not a valid zip file or is corrupted.")
-                processed_size += file_size
-                errors += 1
-            except Exception as e:
-                logger.error(f"Error processing '{zip_path.name}': {e}")
-                processed_size += file_size
-                errors += 1
+    def list_members(self) -> Optional[List[ArchiveMember]]:
+        return None  # bzip2/xz do not record the uncompressed size
 
-    # Copy non-archive files (COPY, not move - preserves originals)
-    logger.info("Copying non-archive files (preserving originals)...")
-    archive_extensions = {'.zip', '.7z', '.rar', '.tar', '.gz', '.bz2', '.xz'}
+    def iter_members(self):
+        with self.OPENERS[self.path.suffix.lower()](self.path, 'rb') as source:
+            yield ArchiveMember(self.path.stem, None, None, None), source
 
-    non_archive_files = []
-    for file_path in raw_path.rglob('*'):
-        if file_path.is_file() and file_path.suffix.lower() not in archive_extensions:
-            non_archive_files.append(file_path)
 
-    if non_archive_files:
-        logger.info(f"Found {len(non_archive_files)} non-archive files to copy")
-        for file_path in non_archive_files:
-            try:
-                file_size = file_path.stat().st_size
-                relative_path = file_path.relative_to(raw_path)
+class _CrcCheckedStream:
+    """File-like view of the next size bytes of a pipe that verifies their CRC32."""
 
-                dest_path = drive_manager.get_output_path(str(relative_path), file_size)
-                if dest_path is None:
-                    logger.error(f"No drive space for {file_path}")
-                    continue
+    def __init__(self, pipe, member: ArchiveMember):
+        self.pipe = pipe
+        self.member = member
+        self.remaining = member.size or 0
+        self._crc = 0
 
-                # COPY instead of move - preserves original
-                shutil.copy2(file_path, dest_path)
-                source_mapping[str(dest_path)] = str(file_path)
-                logger.info(f"Copied: {relative_path} (SOURCE PRESERVED)")
-            except Exception as e:
-                logger.error(f"Failed to copy '{file_path}': {e}")
+    def read(self, size: int = -1) -> bytes:
+        if self.remaining <= 0:
+            if self.member.crc is not None and self._crc != self.member.crc:
+                raise OSError(f"CRC mismatch for {self.member.name}")
+            return b''
+        size = self.remaining if size is None or size < 0 else min(size, self.remaining)
+        data = self.pipe.read(size)
+        if not data:
+            raise OSError(f"7-Zip output ended inside {self.member.name}")
+        self.remaining -= len(data)
+        self._crc = zlib.crc32(data, self._crc)
+        return data
 
-    logger.info("--- Step 1: Extract Zip Files Completed (Sources Preserved) ---")
-    return True, source_mapping
+    def drain(self) -> None:
+        """Skip whatever the consumer did not read, keeping the pipe aligned."""
+        while self.remaining > 0:
+            self.read(CHUNK_SIZE)
 
+    def __enter__(self):
+        return self
 
-# =============================================================================
-# STEP 3: SANITIZE NAMES
-# =============================================================================
+    def __exit__(self, exc_type, exc, tb):
+        return False
 
-def step3_sanitize_names(config_data: dict, logger, drive_manager: DriveManager, metadata: Dict) -> bool:
-    """Step 3: Recursively sanitize all file and directory names."""
-    logger.info("--- Step 3: Sanitize Names Started ---")
 
-    progress_info = config_data.get('_progress', {})
-    current_enabled_real_step = progress_info.get('current_enabled_real_step', 1)
-    number_of_enabled_real_steps = progress_info.get('number_of_enabled_real_steps', 1)
+class SevenZipArchiveReader:
+    """
+    Streaming reader for 7z and rar archives through the 7-Zip command line.
 
-    # Process all output drives
-    for drive in drive_manager.drives:
-        root_path = Path(drive)
+    The listing ('7z l -slt') gives names, sizes and CRCs. Extraction runs a
+    single '7z x -so' process that writes every member to stdout back to
+    back in listing order, so solid archives are decompressed once. The
+    stream is split by the listed sizes and each member's CRC is verified.
+    """
 
-        if not root_path.exists() or not root_path.is_dir():
-            continue
+    random_access = False
+
+    def __init__(self, path: Path, executable: str):
+        self.path = path
+        self.executable = executable
+        self._members: Optional[List[ArchiveMember]] = None
+
+    def list_members(self) -> List[ArchiveMember]:
+        if self._members is not None:
+            return self._members
+        members = []
+        fields: Dict[str, str] = {}
+        in_body = False
+
+        def end_block():
+            if 'Path' in fields and fields.get('Folder') != '+' and 'D' not in fields.get('Attributes', '')[:1]:
+                crc = fields.get('CRC')
+                members.append(ArchiveMember(
+                    fields['Path'],
+                    int(fields.get('Size') or 0),
+                    int(crc, 16) if crc else None,
+                    len(members)
+                ))
+            fields.clear()
+
+        def on_line(line: str):
+            # Header until the '----------' line, then one 'Key = Value' block per entry
+            nonlocal in_body
+            if not in_body:
+                in_body = line == '----------'
+            elif not line:
+                end_block()
+            elif ' = ' in line:
+                key, value = line.split(' = ', 1)
+                fields[key] = value
+
+        result = get_process_runner().run([self.executable, 'l', '-slt', '-sccUTF-8', str(self.path)],
+                                          on_line=on_line)
+        if result.returncode != 0:
+            raise OSError(f"7-Zip could not list archive: {result.stderr.strip() or result.returncode}")
+        end_block()
+        self._members = members
+        return members
+
+    def _spawn(self, *names: str):
+        command = [self.executable, 'x', '-so', '-y', '-bd', '-spd', str(self.path)]
+        if names:
+            command += ['--', *names]
+        return get_process_runner().open_stream(command)
+
+    def iter_members(self):
+        members = self.list_members()
+        with self._spawn() as proc:
+            for member in members:
+                stream = _CrcCheckedStream(proc.stdout, member)
+                yield member, stream
+                stream.drain()
+            if proc.wait() != 0:
+                raise OSError(f"7-Zip exited with code {proc.returncode}")
+
+    @contextlib.contextmanager
+    def open_member(self, member: ArchiveMember):
+        """Stream a single member (used for duplicate checks and retries)."""
+        with self._spawn(member.name) as proc:
+            yield _CrcCheckedStream(proc.stdout, member)
+
+
+def open_archive_reader(path: Path, seven_zip: Optional[str] = None):
+    """Return a reader for an archive, or None if no available backend reads it."""
+    suffix = path.suffix.lower()
+    if suffix == '.zip':
+        return ZipArchiveReader(path)
+    if suffix in ('.7z', '.rar'):
+        return SevenZipArchiveReader(path, seven_zip) if seven_zip else None
+    try:
+        is_tar = suffix in TAR_EXTENSIONS or tarfile.is_tarfile(path)
+    except OSError:
+        is_tar = False
+    if is_tar:
+        return TarArchiveReader(path)
+    if suffix in CompressedFileReader.OPENERS:
+        return CompressedFileReader(path)
+    return None
 
-        all_items = list(root_path.rglob('*'))
-        logger.info(f"Found {len(all_items)} items to process on {drive}")
 
-        if not all_items:
-            continue
+class ArchiveExtractionEngine:
+    """
+    Extracts many archives concurrently.
+
+    Every archive that can be listed cheaply (zip central directory, 7-Zip
+    listing) is read once up front to plan the work: the output drive is
+    chosen per archive, the directory tree is created in one pass and
+    existing files are found with one listing per directory instead of a
+    stat per member. ZIP members are split into tasks, each worker using its
+    own ZipFile handle; streaming formats (tar, 7z/rar, single gz/bz2/xz
+    files) run as one task per archive. Tasks are queued on their drive's
+    own worker pool (DriveWorkerPool), and every member is written straight
+    to its final path.
+
+    The same planning pass indexes members by (CRC32, uncompressed size).
+    A member matching one already planned is recorded as a duplicate
+    reference and never decompressed, unless confirmation by full hash is
+    requested and the contents turn out to differ. Formats without CRCs
+    (tar, single compressed files) are checked after writing against the
+    hashes computed on write, and duplicates are removed again.
+    """
 
-        # Sort by depth (deepest first)
-        all_items.sort(key=lambda x: len(x.parts), reverse=True)
+    def __init__(self, drive_manager: DriveManager, logger,
+                 workers_per_drive: int = 4,
+                 buffer_size: int = 1024 * 1024,
+                 task_size: int = 256 * 1024 * 1024,
+                 skip_duplicates: bool = True,
+                 confirm_duplicates: bool = False,
+                 hash_on_write: bool = True,
+                 partial_hash: bool = False,
+                 seven_zip: Optional[str] = None):
+        """
+        Initialize extraction engine.
 
-        files_renamed = 0
-        dirs_renamed = 0
+        Args:
+            drive_manager: DriveManager used to pick an output drive per archive
+            logger: Logger instance
+            workers_per_drive: Worker threads in each output drive's queue
+            buffer_size: Copy buffer size in bytes
+            task_size: Uncompressed bytes per task when splitting an archive
+            skip_duplicates: Skip members whose CRC32 and size match an earlier member
+            confirm_duplicates: Confirm skipped members by comparing full hashes
+            hash_on_write: Hash members while writing them
+            partial_hash: Also record the partial (prefix) hash
+            seven_zip: 7-Zip executable for 7z/rar archives (None = unsupported)
+        """
+        self.drive_manager = drive_manager
+        self.logger = logger
+        self.workers_per_drive = max(1, workers_per_drive)
+        self.buffer_size = buffer_size
+        self.task_size = max(1, task_size)
+        self.skip_duplicates = skip_duplicates
+        self.confirm_duplicates = confirm_duplicates
+        self.hash_on_write = hash_on_write
+        self.partial_hash = partial_hash
+        self.seven_zip = seven_zip
+
+        # output_path -> archive path, including members found while streaming
+        self.source_mapping: Dict[str, str] = {}
+        # target path -> {'hash', 'partial_hash', 'size'} computed while writing
+        self.digests: Dict[str, Dict[str, Any]] = {}
+
+        # (CRC32, size) -> target path of the first member with that content
+        self.crc_index: Dict[Tuple[int, int], Path] = {}
+        # (hash, size) -> first written file with that content
+        self.hash_index: Dict[Tuple[str, int], Path] = {}
+        # (reader, ArchiveMember, would-be target, keeper target) for skipped members
+        self.duplicates: List[Tuple[Any, ArchiveMember, Path, Path]] = []
+        # References for streamed members removed after a hash match
+        self.hash_duplicates: List[Dict[str, Any]] = []
+
+        self._planned_targets: Set[Path] = set()
+        self._local = threading.local()
+        self._handles = []
+        self._lock = threading.Lock()
+
+    def _get_handle(self, reader) -> zipfile.ZipFile:
+        """Return this worker's handle for a random-access archive."""
+        handles = getattr(self._local, 'handles', None)
+        if handles is None:
+            handles = self._local.handles = {}
+        if reader.path not in handles:
+            handle = reader.open_handle()
+            handles[reader.path] = handle
+            with self._lock:
+                self._handles.append(handle)
+        return handles[reader.path]
+
+    def _open_member(self, reader, member: ArchiveMember):
+        """Open a single member for reading (context manager)."""
+        if reader.random_access:
+            return self._get_handle(reader).open(member.info)
+        return reader.open_member(member)
+
+    def _list_existing(self, directories: Set[Path]) -> Set[Path]:
+        """Create missing directories and return files that already exist in them."""
+        existing = set()
+        for directory in sorted(directories, key=lambda d: len(d.parts)):
+            try:
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        existing.add(directory / entry.name)
+            except FileNotFoundError:
+                directory.mkdir(parents=True, exist_ok=True)
+            except NotADirectoryError:
+                self.logger.warning(f"Cannot create directory, a file is in the way: {directory}")
+        return existing
+
+    def plan(self, archive_files: List[Path]) -> Tuple[List[Tuple], Dict[str, str], int]:
+        """
+        Read archive listings and build extraction tasks.
 
-        for i, item in enumerate(all_items):
-            if (i + 1) % 50 == 0 or (i + 1) == len(all_items):
-                percent = int(((i + 1) / len(all_items)) * 100)
-                update_pipeline_progress(
-                    number_of_enabled_real_steps,
-                    current_enabled_real_step,
-                    "Sanitize Names",
-                    percent,
-                    f"Sanitizing: {i + 1}/{len(all_items)}"
-                )
+        Returns:
+            Tuple of (tasks, source_mapping, errors). Each task is
+            (reader, drive, [(ArchiveMember, target_path), ...] or None, task_bytes);
+            None means the members are only discovered while streaming.
+            source_mapping keeps growing while streamed archives are extracted.
+        """
+        tasks = []
+        errors = 0
+
+        for archive_path in archive_files:
+            reader = open_archive_reader(archive_path, self.seven_zip)
+            if reader is None:
+                self.logger.error(f"No reader available for '{archive_path.name}' "
+                                  f"(7z/rar archives need 7-Zip, see paths.tools.sevenZip)")
+                errors += 1
+                continue
 
             try:
-                if not item.exists():
+                members = reader.list_members()
+            except zipfile.BadZipFile:
+                self.logger.error(f"'{archive_path.name}' is not a valid zip file or is corrupted.")
+                errors += 1
+                continue
+            except Exception as e:
+                self.logger.error(f"Error reading '{archive_path.name}': {e}")
+                errors += 1
+                continue
+
+            if members is None:
+                # Media barely compresses, so the archive size is a fair space estimate
+                estimate = archive_path.stat().st_size
+                drive = self.drive_manager.reserve(estimate)
+                if drive is None:
+                    self.logger.error(f"No drive space available for extraction of '{archive_path.name}'")
+                    errors += 1
                     continue
+                tasks.append((reader, drive, None, estimate))
+                self.logger.info(f"Planned '{archive_path.name}': streaming extraction "
+                                 f"(~{estimate:,} bytes) to {drive}")
+                continue
 
-                original_name = item.name
-                old_path = str(item)
+            uncompressed = sum(m.size for m in members)
+            drive = self.drive_manager.reserve(uncompressed)
+            if drive is None:
+                self.logger.error(f"No drive space available for extraction of '{archive_path.name}'")
+                errors += 1
+                continue
 
-                if item.is_file():
-                    sanitized_base = get_sanitized_name(item.stem)
-                    if not sanitized_base:
+            planned = []
+            duplicate_count = 0
+            for member in members:
+                target_path = member_target_path(drive, member.name)
+                if target_path in self._planned_targets:
+                    continue  # Same path in an earlier archive wins, as with sequential extraction
+
+                if self.skip_duplicates and member.crc is not None and member.size > 0:
+                    content_key = (member.crc, member.size)
+                    keeper = self.crc_index.get(content_key)
+                    if keeper is not None:
+                        self.duplicates.append((reader, member, target_path, keeper))
+                        duplicate_count += 1
                         continue
-                    sanitized_name = sanitized_base + item.suffix
-                else:
-                    sanitized_name = get_sanitized_name(original_name)
+                    self.crc_index[content_key] = target_path
+
+                self._planned_targets.add(target_path)
+                planned.append((member, target_path))
+                self.source_mapping[str(target_path)] = str(archive_path)
+
+            if duplicate_count:
+                self.logger.info(f"'{archive_path.name}': {duplicate_count} members match earlier members "
+                                 f"by CRC32 and size, not extracting")
+
+            existing = self._list_existing({target.parent for _, target in planned})
+            pending = [(m, t) for m, t in planned if t not in existing]
+            skipped = len(planned) - len(pending)
+            if skipped:
+                self.logger.debug(f"Skipping {skipped} existing files from '{archive_path.name}'")
+            # Keep only the bytes that will be written reserved; each task releases its share
+            self.drive_manager.release(drive, uncompressed - sum(m.size for m, _ in pending))
+
+            if not reader.random_access:
+                if pending:
+                    tasks.append((reader, drive, pending, sum(m.size for m, _ in pending)))
+            else:
+                batch, batch_bytes = [], 0
+                for member, target_path in pending:
+                    batch.append((member, target_path))
+                    batch_bytes += member.size
+                    if batch_bytes >= self.task_size:
+                        tasks.append((reader, drive, batch, batch_bytes))
+                        batch, batch_bytes = [], 0
+                if batch:
+                    tasks.append((reader, drive, batch, batch_bytes))
+
+            self.logger.info(f"Planned '{archive_path.name}': {len(pending)} members to extract "
+                             f"({uncompressed:,} bytes) to {drive}")
+
+        return tasks, self.source_mapping, errors
+
+    def _hash_member(self, reader, member: ArchiveMember) -> Optional[str]:
+        """Hash an archive member by streaming it, without writing to disk."""
+        try:
+            hasher = hashlib.new(HASH_ALGORITHM)
+            with self._open_member(reader, member) as source:
+                for chunk in iter(lambda: source.read(self.buffer_size), b''):
+                    hasher.update(chunk)
+            return hasher.hexdigest()
+        except Exception as e:
+            self.logger.warning(f"Could not hash {member.name} in '{reader.path.name}': {e}")
+            return None
 
-                if original_name == sanitized_name:
-                    continue
+    def resolve_duplicates(self, source_mapping: Dict[str, str]) -> List[Dict[str, Any]]:
+        """
+        Settle members skipped as duplicates after the keepers are extracted.
 
-                new_path = item.parent / sanitized_name
+        A duplicate is extracted after all when its keeper failed to extract,
+        or when confirmation is enabled and the full hashes differ.
 
-                # Handle naming conflicts
-                counter = 1
-                while new_path.exists() and new_path != item:
-                    if item.is_file():
-                        new_name = f"{Path(sanitized_name).stem}_{counter}{Path(sanitized_name).suffix}"
-                    else:
-                        new_name = f"{sanitized_name}_{counter}"
-                    new_path = item.parent / new_name
-                    counter += 1
-
-                item.rename(new_path)
-                logger.info(f"Renamed: '{original_name}' -> '{new_path.name}'")
-
-                # Update metadata if this file is tracked
-                if old_path in metadata:
-                    metadata[str(new_path)] = metadata.pop(old_path)
-                    metadata[str(new_path)]["output_path"] = str(new_path)
-                    metadata[str(new_path)]["name"] = new_path.name
-                    add_processing_history(metadata[str(new_path)], "sanitize_names", "renamed",
-                                          f"'{original_name}' -> '{new_path.name}'")
-
-                if item.is_file():
-                    files_renamed += 1
+        Returns:
+            Duplicate references (JSON-serializable) for members that stayed
+            skipped or were removed after a hash match while streaming
+        """
+        references = []
+        keeper_hashes = {}
+        try:
+            for reader, member, target_path, keeper in self.duplicates:
+                confirmed = None
+                extract = not keeper.exists()
+
+                if not extract and self.confirm_duplicates:
+                    if keeper not in keeper_hashes:
+                        known = self.digests.get(str(keeper), {}).get('hash')
+                        keeper_hashes[keeper] = known or generate_file_hash(str(keeper))
+                    member_hash = self._hash_member(reader, member)
+                    confirmed = member_hash is not None and member_hash == keeper_hashes[keeper]
+                    extract = not confirmed
+
+                if extract:
+                    target_path.parent.mkdir(parents=True, exist_ok=True)
+                    if not target_path.exists():
+                        written = self._write_member(lambda: self._open_member(reader, member),
+                                                     target_path, member.name)
+                        if written is None:
+                            continue
+                        self.drive_manager.release(target_path, 0, written)
+                    source_mapping.setdefault(str(target_path), str(reader.path))
+                    continue
+
+                references.append({
+                    "archive": str(reader.path),
+                    "member": member.name,
+                    "size": member.size,
+                    "crc32": f"{member.crc:08x}",
+                    "duplicate_of": str(keeper),
+                    "hash_confirmed": confirmed
+                })
+        finally:
+            self._close_handles()
+        return references + self.hash_duplicates
+
+    def _close_handles(self):
+        """Close every worker's archive handles."""
+        for handle in self._handles:
+            with contextlib.suppress(Exception):
+                handle.close()
+        self._handles.clear()
+        self._local = threading.local()
+
+    def _write_member(self, open_source, target_path: Path, name: str) -> Optional[int]:
+        """Write one member to target_path, hashing it on the way. Returns bytes written, None on failure."""
+        try:
+            with open_source() as source, open(target_path, 'wb') as target:
+                if self.hash_on_write:
+                    digests = copy_with_hash(source, target, self.buffer_size,
+                                             HASH_ALGORITHM, self.partial_hash)
+                    with self._lock:
+                        self.digests[str(target_path)] = digests
+                        self.hash_index.setdefault((digests['hash'], digests['size']), target_path)
                 else:
-                    dirs_renamed += 1
+                    shutil.copyfileobj(source, target, self.buffer_size)
+                return target.tell()
+        except Exception as e:
+            self.logger.warning(f"Failed to extract {name}: {e}")
+            # Never leave a truncated file behind; it would be skipped next run
+            with contextlib.suppress(OSError):
+                target_path.unlink()
+            return None
 
-            except Exception as e:
-                logger.error(f"Error processing '{item}': {e}")
+    def _claim_target(self, reader, drive: Path, member: ArchiveMember) -> Optional[Path]:
+        """Reserve the output path of a member found while streaming (None = skip it)."""
+        target_path = member_target_path(drive, member.name)
+        with self._lock:
+            if target_path in self._planned_targets:
+                return None
+            self._planned_targets.add(target_path)
+            self.source_mapping[str(target_path)] = str(reader.path)
+        if target_path.exists():
+            return None
+        target_path.parent.mkdir(parents=True, exist_ok=True)
+        return target_path
 
-        logger.info(f"Drive {drive}: Files renamed: {files_renamed}, Directories renamed: {dirs_renamed}")
+    def _drop_if_duplicate(self, reader, member: ArchiveMember, target_path: Path) -> bool:
+        """Remove a streamed member whose hash matches a file written earlier. Returns True if removed."""
+        digests = self.digests.get(str(target_path))
+        if not self.skip_duplicates or not digests or not digests['size']:
+            return False
+        with self._lock:
+            keeper = self.hash_index.get((digests['hash'], digests['size']))
+            if keeper is None or keeper == target_path:
+                return False
+            self.source_mapping.pop(str(target_path), None)
+            self.digests.pop(str(target_path), None)
+            self.hash_duplicates.append({
+                "archive": str(reader.path),
+                "member": member.name,
+                "size": digests['size'],
+                "crc32": None,
+                "duplicate_of": str(keeper),
+                "hash_confirmed": True
+            })
+        with contextlib.suppress(OSError):
+            target_path.unlink()
+        return True
 
-    logger.info("--- Step 3: Sanitize Names Completed ---")
-    return True
+    def _run_stream(self, reader, drive: Path, members, task_bytes: int, on_progress) -> Tuple[int, int]:
+        """Extract a streaming archive front to back. Returns (failures, bytes written)."""
+        wanted = {m.name: t for m, t in members} if members is not None else None
+        failures = 0
+        written_total = 0
+        reported = 0
+        try:
+            for member, source in reader.iter_members():
+                if wanted is not None:
+                    target_path = wanted.get(member.name)
+                else:
+                    target_path = self._claim_target(reader, drive, member)
+                if target_path is not None:
+                    written = self._write_member(lambda: contextlib.nullcontext(source),
+                                                 target_path, member.name)
+                    if written is None:
+                        failures += 1
+                    elif member.crc is not None or not self._drop_if_duplicate(reader, member, target_path):
+                        written_total += written
+                step = min(member.size or 0, task_bytes - reported)
+                if step > 0:
+                    reported += step
+                    on_progress(step)
+        except Exception as e:
+            self.logger.error(f"Failed reading '{reader.path.name}': {e}")
+            failures += 1
+        on_progress(task_bytes - reported)
+        return failures, written_total
+
+    def _run_task(self, task, on_progress) -> int:
+        """Extract one batch of members. Returns the number of failures."""
+        reader, drive, members, task_bytes = task
+        failures, written_total = 0, 0
+        started = time.monotonic()
+        try:
+            if not reader.random_access:
+                failures, written_total = self._run_stream(reader, drive, members, task_bytes, on_progress)
+                return failures
+
+            handle = self._get_handle(reader)
+            for member, target_path in members:
+                written = self._write_member(lambda: handle.open(member.info), target_path, member.name)
+                if written is None:
+                    failures += 1
+                else:
+                    written_total += written
+                on_progress(member.size)
+            return failures
+        finally:
+            # Swap the task's reservation for the bytes it actually wrote
+            self.drive_manager.release(drive, task_bytes, written_total)
+            self.drive_manager.record_throughput(drive, written_total, time.monotonic() - started)
+
+    def extract(self, tasks: List[Tuple], progress_callback=None) -> int:
+        """
+        Run extraction tasks concurrently.
 
+        Args:
+            tasks: Tasks from plan()
+            progress_callback: Optional callable(done_bytes, total_bytes)
 
-# =============================================================================
-# STEP 5: MAP GOOGLE JSON (NO DELETION)
-# =============================================================================
+        Returns:
+            Number of members that failed to extract
+        """
+        total_bytes = sum(task[3] for task in tasks)
+        done = [0]
 
-def step5_map_google_json(config_data: dict, logger, drive_manager: DriveManager,
-                          metadata: Dict, deletion_manifest: DeletionManifest) -> bool:
+        def on_progress(nbytes):
+            with self._lock:
+                done[0] += nbytes
+                if progress_callback:
+                    progress_callback(done[0], total_bytes)
+
+        failures = 0
+        try:
+            with DriveWorkerPool(self.drive_manager.drives, self.workers_per_drive) as pool:
+                futures = [pool.submit(task[1], self._run_task, task, on_progress) for task in tasks]
+                for future in concurrent.futures.as_completed(futures):
+                    try:
+                        failures += future.result()
+                    except Exception as e:
+                        self.logger.error(f"Extraction task failed: {e}")
+                        failures += 1
+        finally:
+            self._close_handles()
+        return failures
+
+
+def step1_extract_zip_files(config_data: dict, logger, drive_manager: DriveManager
+                            ) -> Tuple[bool, Dict[str, str], Dict[str, Dict], Dict[str, str]]:
     """
-    Step 5: Map Google Photos JSON metadata to media files.
-    MARKS JSON files for deletion instead of deleting them.
+    Step 1: Extract all archive files from source directory.
+    PRESERVES original archives (does not delete them).
+
+    Handles zip, tar (plain or compressed), single gz/bz2/xz files and,
+    when 7-Zip is available, 7z and rar archives.
+
+    Non-archive files are imported with the cheapest method the filesystem
+    supports (see extraction.importMode); the originals are never modified.
+
+    Returns:
+        Tuple of (success, source_mapping, file_digests, import_modes) where
+        source_mapping maps output_path -> original archive path, file_digests maps
+        output_path -> {'hash', 'partial_hash', 'size'} for files hashed while
+        being written, and import_modes maps output_path -> import mode used
     """
-    logger.info("--- Step 5: Map Google JSON Started ---")
+    logger.info("--- Step 1: Extract Zip Files Started ---")
 
     progress_info = config_data.get('_progress', {})
-    current_enabled_real_step = progress_info.get('current_enabled_real_step', 1)
     number_of_enabled_real_steps = progress_info.get('number_of_enabled_real_steps', 1)
+    current_enabled_real_step = progress_info.get('current_enabled_real_step', 1)
 
-    for drive in drive_manager.drives:
-        unzipped_path = Path(drive)
-
-        if not unzipped_path.exists() or not unzipped_path.is_dir():
-            continue
+    settings = get_settings_from_config(config_data)
+
+    raw_directory = config_data['paths']['rawDirectory']
+    raw_path = Path(raw_directory)
+
+    if not raw_path.exists():
+        logger.error(f"Source directory does not exist: {raw_directory}")
+        return False, {}, {}, {}
+
+    # Track mapping of extracted files to their source
+    source_mapping = {}  # output_path -> original_source_path
+    file_digests = {}    # output_path -> digests computed on write
+    import_modes = {}    # output_path -> extract | reflink | hardlink | kernel_copy | copy
+
+    archive_files = sorted(p for p in raw_path.rglob('*')
+                           if p.is_file() and p.suffix.lower() in ARCHIVE_EXTENSIONS)
+
+    if not archive_files:
+        logger.info("No archives found to extract.")
+        # Still copy non-archive files
+    else:
+        total_size = sum(archive_path.stat().st_size for archive_path in archive_files)
+        logger.info(f"Found {len(archive_files)} archives to extract (total size: {total_size:,} bytes).")
+
+        engine = ArchiveExtractionEngine(
+            drive_manager, logger,
+            workers_per_drive=settings['extraction_workers_per_drive'],
+            buffer_size=settings['extraction_buffer_bytes'],
+            task_size=settings['extraction_task_bytes'],
+            skip_duplicates=settings['extraction_skip_duplicates'],
+            confirm_duplicates=settings['extraction_confirm_duplicates'],
+            hash_on_write=settings['extraction_hash_on_write'],
+            partial_hash=settings['extraction_partial_hash'],
+            seven_zip=find_seven_zip(config_data)
+        )
+        tasks, source_mapping, errors = engine.plan(archive_files)
+
+        last_percent = [-1]
+
+        def archive_progress_callback(done_bytes, total_bytes):
+            subtask_percent = int((done_bytes / total_bytes) * 100) if total_bytes > 0 else 100
+            if subtask_percent - last_percent[0] >= 2 or done_bytes == total_bytes:
+                last_percent[0] = subtask_percent
+                update_pipeline_progress(
+                    number_of_enabled_real_steps,
+                    current_enabled_real_step,
+                    "Extract Zip Files",
+                    subtask_percent,
+                    f"Extracting: {len(archive_files)} archives, {len(tasks)} tasks"
+                )
+
+        failures = engine.extract(tasks, archive_progress_callback)
+        logger.info(f"Extracted {len(archive_files) - errors}/{len(archive_files)} archives "
+                    f"({failures} member failures, SOURCES PRESERVED)")
+
+        duplicate_references = engine.resolve_duplicates(source_mapping)
+        file_digests.update(engine.digests)
+        import_modes.update({output: "extract" for output in source_mapping})
+        if engine.duplicates:
+            logger.info(f"Duplicate members skipped: {len(duplicate_references)} "
+                        f"(extracted after check: {len(engine.duplicates) - len(duplicate_references)})")
+            results_dir = Path(config_data['paths']['resultsDirectory'])
+            results_dir.mkdir(parents=True, exist_ok=True)
+            save_metadata_atomic({
+                "confirmed_by_hash": engine.confirm_duplicates,
+                "total_skipped": len(duplicate_references),
+                "total_size_bytes": sum(ref["size"] for ref in duplicate_references),
+                "members": duplicate_references,
+                "created_at": datetime.now().isoformat()
+            }, results_dir / "archive_duplicate_members.json", logger)
+
+    # Import non-archive files (clone/link/copy, never move - preserves originals)
+    import_mode = settings['extraction_import_mode']
+    logger.info(f"Importing non-archive files (mode: {import_mode}, preserving originals)...")
+    non_archive_files = []
+    for file_path in raw_path.rglob('*'):
+        if file_path.is_file() and file_path.suffix.lower() not in ARCHIVE_EXTENSIONS:
+            non_archive_files.append(file_path)
+
+    def import_one(file_path: Path, dest_path: Path, file_size: int):
+        # Clone/link/copy instead of move - preserves original
+        written = 0
+        started = time.monotonic()
+        try:
+            mode_used, digests = import_file(
+                file_path, dest_path, import_mode, settings['extraction_buffer_bytes'],
+                HASH_ALGORITHM if settings['extraction_hash_on_write'] else None,
+                settings['extraction_partial_hash'])
+            # Reflinks and hardlinks share the source's blocks
+            if mode_used not in (IMPORT_REFLINK, IMPORT_HARDLINK):
+                written = file_size
+        finally:
+            drive_manager.release(dest_path, file_size, written)
+        drive_manager.record_throughput(dest_path, written, time.monotonic() - started)
+        return mode_used, digests
+
+    if non_archive_files:
+        logger.info(f"Found {len(non_archive_files)} non-archive files to copy "
+                    f"(placement: {drive_manager.placement})")
+        with DriveWorkerPool(drive_manager.drives, settings['extraction_workers_per_drive']) as pool:
+            futures = {}
+            for file_path in non_archive_files:
+                try:
+                    file_size = file_path.stat().st_size
+                    relative_path = file_path.relative_to(raw_path)
+
+                    dest_path = drive_manager.get_output_path(str(relative_path), file_size)
+                    if dest_path is None:
+                        logger.error(f"No drive space for {file_path}")
+                        continue
+
+                    future = pool.submit(drive_manager.drive_of(dest_path), import_one,
+                                         file_path, dest_path, file_size)
+                    futures[future] = (file_path, dest_path, relative_path)
+                except Exception as e:
+                    logger.error(f"Failed to import '{file_path}': {e}")
+
+            for future in concurrent.futures.as_completed(futures):
+                file_path, dest_path, relative_path = futures[future]
+                try:
+                    mode_used, digests = future.result()
+                except Exception as e:
+                    logger.error(f"Failed to import '{file_path}': {e}")
+                    continue
+                if digests:
+                    file_digests[str(dest_path)] = digests
+                import_modes[str(dest_path)] = mode_used
+                source_mapping[str(dest_path)] = str(file_path)
+                logger.info(f"Imported ({mode_used}): {relative_path} (SOURCE PRESERVED)")
+
+    mode_counts = {}
+    for mode_used in import_modes.values():
+        mode_counts[mode_used] = mode_counts.get(mode_used, 0) + 1
+    logger.info(f"Import modes: {mode_counts}")
+    logger.info(f"Hashed on write: {len(file_digests)} files (I/O cache mode: {get_cache_mode()})")
+    logger.info("--- Step 1: Extract Zip Files Completed (Sources Preserved) ---")
+    return True, source_mapping, file_digests, import_modes
+
+
+# =============================================================================
+# STEP 3: SANITIZE NAMES
+# =============================================================================
+
+def _sanitized_entry_name(name: str, is_dir: bool) -> str:
+    """Return the sanitized form of a directory entry name (unchanged if nothing to do)."""
+    if is_dir:
+        return get_sanitized_name(name)
+    entry = Path(name)
+    sanitized_base = get_sanitized_name(entry.stem)
+    if not sanitized_base:
+        return name
+    return sanitized_base + entry.suffix
+
+
+def plan_sanitize_renames(root_path: Path, logger) -> List[Tuple[Path, str, bool]]:
+    """
+    Compute every rename needed to sanitize names under root_path.
+
+    Each directory is listed once with os.scandir and collisions are
+    resolved against that listing in memory, so no candidate name is ever
+    stat'ed. Names are compared case-insensitively on Windows and macOS.
+
+    Returns:
+        (old_path, new_name, is_dir) tuples, deepest first, so applying them
+        in order renames children before their parent directory moves
+    """
+    fold = str.casefold if sys.platform in ('win32', 'darwin') else (lambda name: name)
+    plan = []
+    stack = [root_path]
+
+    while stack:
+        directory = stack.pop()
+        try:
+            with os.scandir(directory) as it:
+                entries = sorted((entry.name, entry.is_dir(follow_symlinks=False)) for entry in it)
+        except OSError as e:
+            logger.error(f"Error listing '{directory}': {e}")
+            continue
+
+        taken = {fold(name) for name, _ in entries}
+        for name, is_dir in entries:
+            if is_dir:
+                stack.append(directory / name)
+
+            sanitized_name = _sanitized_entry_name(name, is_dir)
+            if sanitized_name == name:
+                continue
+
+            # Handle naming conflicts
+            new_name = sanitized_name
+            counter = 1
+            while fold(new_name) in taken and fold(new_name) != fold(name):
+                if is_dir:
+                    new_name = f"{sanitized_name}_{counter}"
+                else:
+                    new_name = f"{Path(sanitized_name).stem}_{counter}{Path(sanitized_name).suffix}"
+                counter += 1
+            taken.add(fold(new_name))
+            plan.append((directory / name, new_name, is_dir))
+
+    plan.sort(key=lambda item: len(item[0].parts), reverse=True)
+    return plan
+
+
+def remap_metadata_paths(metadata: Dict, renames: PathRenameTrie) -> int:
+    """
+    Rewrite metadata keys (and output_path) through recorded renames in one pass.
+
+    Returns:
+        Number of records moved to a new key
+    """
+    moved = {}
+    for key in metadata:
+        new_key = renames.rewrite(key)
+        if new_key != key:
+            moved[key] = new_key
+
+    for old_key, new_key in moved.items():
+        record = metadata.pop(old_key)
+        old_name = Path(old_key).name
+        record["output_path"] = renames.rewrite(record.get("output_path") or old_key)
+        record["name"] = Path(new_key).name
+        if record["name"] != old_name:
+            add_processing_history(record, "sanitize_names", "renamed",
+                                   f"'{old_name}' -> '{record['name']}'")
+        else:
+            add_processing_history(record, "sanitize_names", "moved",
+                                   f"parent directory renamed: '{old_key}' -> '{new_key}'")
+        metadata[new_key] = record
+    return len(moved)
+
+
+def step3_sanitize_names(config_data: dict, logger, drive_manager: DriveManager, metadata: Dict,
+                         file_registry: Optional[FileRegistry] = None) -> bool:
+    """
+    Step 3: Recursively sanitize all file and directory names.
+
+    Builds the full rename plan in memory first, applies it bottom-up, then
+    rewrites every affected metadata key (including files beneath renamed
+    directories) in a single pass through a path trie. The same trie moves
+    registered file IDs to their new paths.
+    """
+    logger.info("--- Step 3: Sanitize Names Started ---")
+
+    progress_info = config_data.get('_progress', {})
+    current_enabled_real_step = progress_info.get('current_enabled_real_step', 1)
+    number_of_enabled_real_steps = progress_info.get('number_of_enabled_real_steps', 1)
+
+    renames = PathRenameTrie()
+
+    # Process all output drives
+    for drive in drive_manager.drives:
+        root_path = Path(drive)
+
+        if not root_path.exists() or not root_path.is_dir():
+            continue
+
+        plan = plan_sanitize_renames(root_path, logger)
+        logger.info(f"Planned {len(plan)} renames on {drive}")
+
+        if not plan:
+            continue
+
+        files_renamed = 0
+        dirs_renamed = 0
+
+        for i, (old_path, new_name, is_dir) in enumerate(plan):
+            if (i + 1) % 50 == 0 or (i + 1) == len(plan):
+                percent = int(((i + 1) / len(plan)) * 100)
+                update_pipeline_progress(
+                    number_of_enabled_real_steps,
+                    current_enabled_real_step,
+                    "Sanitize Names",
+                    percent,
+                    f"Sanitizing: {i + 1}/{len(plan)}"
+                )
+
+            try:
+                old_path.rename(old_path.parent / new_name)
+                renames.add(old_path, new_name)
+                logger.info(f"Renamed: '{old_path.name}' -> '{new_name}'")
+
+                if is_dir:
+                    dirs_renamed += 1
+                else:
+                    files_renamed += 1
+
+            except Exception as e:
+                logger.error(f"Error processing '{old_path}': {e}")
+
+        logger.info(f"Drive {drive}: Files renamed: {files_renamed}, Directories renamed: {dirs_renamed}")
+
+    # Update metadata keys of renamed files and of everything under renamed directories
+    moved = remap_metadata_paths(metadata, renames)
+    logger.info(f"Metadata records remapped: {moved}")
+    if file_registry is not None and len(renames):
+        logger.info(f"Registry paths remapped: {file_registry.apply_renames(renames)}")
+
+    logger.info("--- Step 3: Sanitize Names Completed ---")
+    return True
+
+
+# =============================================================================
+# STEP 5: MAP GOOGLE JSON (NO DELETION)
+# =============================================================================
+
+def step5_map_google_json(config_data: dict, logger, drive_manager: DriveManager,
+                          metadata: Dict, deletion_manifest: DeletionManifest) -> bool:
+    """
+    Step 5: Map Google Photos JSON metadata to media files.
+    MARKS JSON files for deletion instead of deleting them.
+    """
+    logger.info("--- Step 5: Map Google JSON Started ---")
+
+    progress_info = config_data.get('_progress', {})
+    current_enabled_real_step = progress_info.get('current_enabled_real_step', 1)
+    number_of_enabled_real_steps = progress_info.get('number_of_enabled_real_steps', 1)
+
+    for drive in drive_manager.drives:
+        unzipped_path = Path(drive)
+
+        if not unzipped_path.exists() or not unzipped_path.is_dir():
+            continue
 
         json_files = sorted(list(unzipped_path.rglob("*.json")), key=lambda p: str(p))
         total_files = len(json_files)
@@ -1301,7 +2396,7 @@ def step5_map_google_json(config_data: dict, logger, drive_manager: DriveManager
                             media_path,
                             output_drive=str(drive)
                         )
-                    metadata[normalized_path]['json'].append(json_content)
+                    extend_list_field(metadata[normalized_path], 'json', [json_content])
                     add_processing_history(metadata[normalized_path], "map_google_json", "success",
                                           f"Mapped JSON: {json_file.name}")
 
@@ -1327,10 +2422,20 @@ def step5_map_google_json(config_data: dict, logger, drive_manager: DriveManager
 # =============================================================================
 
 class MediaConverter:
-    """Pure Python media converter using Pillow and OpenCV."""
+    """
+    Media converter using Pillow for photos, and ffmpeg or OpenCV for videos.
+
+    Videos go through ffmpeg when its probed profile has a usable encoder
+    (fastest first, see Utils/tool_probe.py), which also keeps the audio.
+    OpenCV is the fallback and writes video only.
+    """
 
-    def __init__(self, logger):
+    def __init__(self, logger, ffmpeg_profile: Optional[ToolProfile] = None,
+                 ffmpeg_timeout: Optional[float] = None):
         self.logger = logger
+        self.ffmpeg_profile = ffmpeg_profile
+        self.ffmpeg_timeout = ffmpeg_timeout
+        self.video_args = ffmpeg_profile.video_encode_args() if ffmpeg_profile else None
 
     def convert_photo_to_jpg(self, input_file: Path, output_file: Path) -> bool:
         """Convert photo to JPG using Pillow."""
@@ -1369,8 +2474,27 @@ class MediaConverter:
             self.logger.error(f"Failed to convert photo {input_file}: {e}")
             return False
 
+    def _convert_video_ffmpeg(self, input_file: Path, output_file: Path) -> bool:
+        audio_args = self.ffmpeg_profile.audio_encode_args() or ['-an']
+        cmd = [self.ffmpeg_profile.path, '-hide_banner', '-loglevel', 'error', '-i', str(input_file),
+               *self.video_args, *audio_args, '-movflags', '+faststart', '-f', 'mp4', '-y', str(output_file)]
+        try:
+            result = get_process_runner().run(cmd, timeout=self.ffmpeg_timeout)
+        except Exception as e:
+            self.logger.error(f"Failed to convert video {input_file}: {e}")
+            return False
+
+        if not result.ok:
+            reason = "timed out" if result.timed_out else (result.stderr.strip() or f"exit code {result.returncode}")
+            self.logger.error(f"Failed to convert video {input_file}: {reason}")
+            return False
+        self.logger.info(f"Converted video: {input_file.name} -> {output_file.name} ({self.video_args[1]})")
+        return True
+
     def convert_video_to_mp4(self, input_file: Path, output_file: Path) -> bool:
-        """Convert video to MP4 using OpenCV."""
+        """Convert video to MP4 using ffmpeg if available, else OpenCV."""
+        if self.video_args:
+            return self._convert_video_ffmpeg(input_file, output_file)
         if not OPENCV_AVAILABLE:
             self.logger.error(f"Cannot convert {input_file} - OpenCV not available")
             return False
@@ -1413,7 +2537,13 @@ def step7_convert_media(config_data: dict, logger, drive_manager: DriveManager,
     """
     logger.info("--- Step 7: Convert Media Started ---")
 
-    converter = MediaConverter(logger)
+    ffmpeg_profile = get_tool_profile(config_data.get('paths', {}).get('tools', {}).get('ffmpeg'))
+    converter = MediaConverter(logger, ffmpeg_profile,
+                               get_settings_from_config(config_data)['process_convert_timeout'])
+    if converter.video_args:
+        logger.info(f"Video conversion: ffmpeg {ffmpeg_profile.version}, {' '.join(converter.video_args)}")
+    else:
+        logger.info("Video conversion: OpenCV (no usable ffmpeg encoder)")
     converted_count = 0
     error_count = 0
 
@@ -1456,6 +2586,9 @@ def step7_convert_media(config_data: dict, logger, drive_manager: DriveManager,
                         # Already converted, mark original for deletion
                         if original_path_str in metadata:
                             metadata[str(new_path)] = metadata.pop(original_path_str)
+                            # Digests described the original file, not the converted one
+                            metadata[str(new_path)]['hash'] = None
+                            metadata[str(new_path)]['partial_hash'] = None
                         deletion_manifest.mark_for_deletion(
                             original_path_str,
                             reason="already_converted",
@@ -1463,11 +2596,22 @@ def step7_convert_media(config_data: dict, logger, drive_manager: DriveManager,
                         )
                         continue
 
+                    # The original stays until deletion is confirmed, so the output needs its own space
+                    source_size = file_path.stat().st_size
+                    if drive_manager.reserve(source_size, drive=drive) is None:
+                        logger.error(f"No space on {drive} to convert {file_path.name}")
+                        error_count += 1
+                        continue
+
                     success = False
-                    if extension in CONVERTIBLE_VIDEO_EXTENSIONS:
-                        success = converter.convert_video_to_mp4(file_path, new_path)
-                    elif extension in CONVERTIBLE_PHOTO_EXTENSIONS:
-                        success = converter.convert_photo_to_jpg(file_path, new_path)
+                    try:
+                        if extension in CONVERTIBLE_VIDEO_EXTENSIONS:
+                            success = converter.convert_video_to_mp4(file_path, new_path)
+                        elif extension in CONVERTIBLE_PHOTO_EXTENSIONS:
+                            success = converter.convert_photo_to_jpg(file_path, new_path)
+                    finally:
+                        drive_manager.release(drive, source_size,
+                                              new_path.stat().st_size if success and new_path.exists() else 0)
 
                     if success:
                         # Update metadata
@@ -1481,6 +2625,8 @@ def step7_convert_media(config_data: dict, logger, drive_manager: DriveManager,
                             )
 
                         metadata[new_path_str]['size'] = new_path.stat().st_size
+                        metadata[new_path_str]['hash'] = None
+                        metadata[new_path_str]['partial_hash'] = None
                         metadata[new_path_str]['name'] = new_path.name
                         metadata[new_path_str]['output_path'] = new_path_str
                         metadata[new_path_str]['is_converted'] = True
@@ -1524,9 +2670,10 @@ def step7_convert_media(config_data: dict, logger, drive_manager: DriveManager,
 class MetadataExtractor:
     """Extracts metadata using EXIF, FFprobe, and filename parsing."""
 
-    def __init__(self, logger, ffprobe_path: Optional[str] = None):
+    def __init__(self, logger, ffprobe_path: Optional[str] = None, ffprobe_timeout: float = 30):
         self.logger = logger
         self.ffprobe_path = ffprobe_path
+        self.ffprobe_timeout = ffprobe_timeout
 
         # Filename patterns for timestamp extraction (exact match from original code)
         self.filename_patterns = [
@@ -1580,14 +2727,19 @@ class MetadataExtractor:
             return result
 
         try:
-            cmd = [self.ffprobe_path, '-v', 'quiet', '-print_format', 'json',
-                   '-show_format', '-show_streams', str(file_path)]
-            process = subprocess.run(cmd, capture_output=True, text=True, timeout=30)
+            # Only the container tags that are used, one 'TAG:key=value' line each
+            tags = {}
+
+            def on_line(line: str):
+                key, sep, value = line.partition('=')
+                if sep and key.startswith('TAG:'):
+                    tags[key[4:]] = value
 
-            if process.returncode == 0:
-                data = json.loads(process.stdout)
-                tags = data.get('format', {}).get('tags', {})
+            cmd = [self.ffprobe_path, '-v', 'quiet', '-show_entries', 'format_tags=creation_time,date',
+                   '-of', 'default=noprint_wrappers=1', str(file_path)]
+            process = get_process_runner().run(cmd, timeout=self.ffprobe_timeout, on_line=on_line)
 
+            if process.ok:
                 for key in ['creation_time', 'date']:
                     if key in tags:
                         try:
@@ -1674,8 +2826,10 @@ def step9_expand_metadata(config_data: dict, logger, drive_manager: DriveManager
     """Step 9: Expand metadata with EXIF, FFprobe, and filename data."""
     logger.info("--- Step 9: Expand Metadata Started ---")
 
-    ffprobe_path = config_data.get('paths', {}).get('tools', {}).get('ffprobe')
-    extractor = MetadataExtractor(logger, ffprobe_path)
+    # A missing or broken ffprobe is skipped instead of failing once per video
+    ffprobe_profile = get_tool_profile(config_data.get('paths', {}).get('tools', {}).get('ffprobe'))
+    extractor = MetadataExtractor(logger, ffprobe_profile.path if ffprobe_profile else None,
+                                  get_settings_from_config(config_data)['process_ffprobe_timeout'])
 
     total_processed = 0
 
@@ -1684,7 +2838,7 @@ def step9_expand_metadata(config_data: dict, logger, drive_manager: DriveManager
         if not processed_path.exists():
             continue
 
-        all_files = [f for f in processed_path.rglob("*") if f.is_file()]
+        all_files = drive_manager.order_for_io([f for f in processed_path.rglob("*") if f.is_file()])
 
         if not all_files:
             continue
@@ -1703,15 +2857,15 @@ def step9_expand_metadata(config_data: dict, logger, drive_manager: DriveManager
 
                 exif_data = extractor.get_exif_data(file_path)
                 if exif_data["timestamp"] or exif_data["geotag"]:
-                    metadata[normalized_path]["exif"].append(exif_data)
+                    extend_list_field(metadata[normalized_path], "exif", [exif_data])
 
                 ffprobe_data = extractor.get_ffprobe_data(file_path)
                 if ffprobe_data["timestamp"] or ffprobe_data["geotag"]:
-                    metadata[normalized_path]["ffprobe"].append(ffprobe_data)
+                    extend_list_field(metadata[normalized_path], "ffprobe", [ffprobe_data])
 
                 filename_data = extractor.get_filename_data(file_path)
                 if filename_data["timestamp"]:
-                    metadata[normalized_path]["filename"].append(filename_data)
+                    extend_list_field(metadata[normalized_path], "filename", [filename_data])
 
                 add_processing_history(metadata[normalized_path], "expand_metadata", "success", "")
                 total_processed += 1
@@ -1787,9 +2941,27 @@ def get_video_length(video_path, logger):
             video.release()
 
 
+def lookup_library_hash(library_index: Optional[LibraryIndex], file_path: str,
+                        size: Optional[int]) -> Optional[Tuple[str, Optional[str]]]:
+    """(hash, partial_hash) of an unchanged file the library index already holds, else None."""
+    if library_index is None or size is None:
+        return None
+    try:
+        return library_index.cached_hash(file_path, size, os.stat(file_path).st_mtime_ns)
+    except OSError:
+        return None
+
+
 def step13_hash_and_group_videos(config_data: dict, logger, drive_manager: DriveManager,
-                                  metadata: Dict, results_dir: Path) -> bool:
-    """Step 13: Hash video files and group by name/size and hash."""
+                                  metadata: Dict, results_dir: Path,
+                                  library_index: Optional[LibraryIndex] = None,
+                                  groupings: Optional[Dict[str, MediaGrouping]] = None) -> bool:
+    """
+    Step 13: Hash video files and group by name/size and hash.
+
+    The grouping is saved to video_grouping_info.json and, when groupings
+    is given, also stored in groupings['video'] for step 17.
+    """
     logger.info("--- Step 13: Hash and Group Videos Started ---")
 
     progress_info = config_data.get('_progress', {})
@@ -1802,14 +2974,22 @@ def step13_hash_and_group_videos(config_data: dict, logger, drive_manager: Drive
     for drive in drive_manager.drives:
         for f in Path(drive).rglob('*.mp4'):
             video_paths.append(str(f))
+    video_paths = drive_manager.order_for_io(video_paths)
 
     total_videos = len(video_paths)
     logger.info(f"Found {total_videos} video files to process")
 
     if total_videos == 0:
+        if groupings is not None:
+            groupings['video'] = MediaGrouping({}, {})
         return True
 
     # Enrich metadata with hashes
+    hashed_files = 0
+    hashed_bytes = 0
+    reused_hashes = 0
+    hash_started = time.monotonic()
+    present = []
     for idx, video_path in enumerate(video_paths, 1):
         if idx % 50 == 0 or idx == total_videos:
             percent = int((idx / total_videos) * 100)
@@ -1823,6 +3003,7 @@ def step13_hash_and_group_videos(config_data: dict, logger, drive_manager: Drive
 
         if not os.path.exists(video_path):
             continue
+        present.append(video_path)
 
         if video_path not in metadata:
             metadata[video_path] = create_default_metadata_object(Path(video_path))
@@ -1834,42 +3015,45 @@ def step13_hash_and_group_videos(config_data: dict, logger, drive_manager: Drive
         if record.get('size') is None:
             record['size'] = os.path.getsize(video_path)
         if record.get('hash') is None:
-            record['hash'] = generate_file_hash(video_path)
+            cached = lookup_library_hash(library_index, video_path, record['size'])
+            if cached:
+                record['hash'] = cached[0]
+                if cached[1] and not record.get('partial_hash'):
+                    record['partial_hash'] = cached[1]
+                reused_hashes += 1
+            else:
+                record['hash'] = generate_file_hash(video_path)
+                hashed_files += 1
+                hashed_bytes += record['size'] or 0
         if record.get('duration') is None:
             record['duration'] = get_video_length(video_path, logger)
 
-    # Group by name and size
-    grouped_by_name_size = {}
-    grouped_by_hash = {}
-
-    for video_path in video_paths:
-        if not os.path.exists(video_path):
-            continue
-        record = metadata.get(video_path, {})
-        name = record.get("name")
-        size = record.get("size")
-        vid_hash = record.get("hash")
-
-        if name and size:
-            key = f"{name}_{size}"
-            if key not in grouped_by_name_size:
-                grouped_by_name_size[key] = []
-            grouped_by_name_size[key].append(video_path)
-
-        if vid_hash:
-            if vid_hash not in grouped_by_hash:
-                grouped_by_hash[vid_hash] = []
-            grouped_by_hash[vid_hash].append(video_path)
+    # Group by name and size, and by hash
+    grouping = group_media_files(present, metadata)
+    if groupings is not None:
+        groupings['video'] = grouping
 
     grouping_info = {
-        "grouped_by_name_and_size": grouped_by_name_size,
-        "grouped_by_hash": grouped_by_hash
+        "grouped_by_name_and_size": grouping.by_name_size,
+        "grouped_by_hash": grouping.by_hash,
+        "statistics": {
+            "files": total_videos,
+            "hashed_files": hashed_files,
+            "hashed_bytes": hashed_bytes,
+            "hash_seconds": round(time.monotonic() - hash_started, 2),
+            "library_hashes_reused": reused_hashes,
+            "io_cache_mode": get_cache_mode(),
+            "page_cache_hygiene": get_cache_mode() != CACHE_MODE_NORMAL
+        }
     }
 
     video_duplicates_file = results_dir / "video_grouping_info.json"
     save_metadata_atomic(grouping_info, video_duplicates_file, logger)
 
-    logger.info(f"Created {len(grouped_by_name_size)} name/size groups, {len(grouped_by_hash)} hash groups")
+    logger.info(f"Created {len(grouping.by_name_size)} name/size groups, {len(grouping.by_hash)} hash groups")
+    logger.info(f"Hashed {hashed_files} videos ({hashed_bytes:,} bytes), I/O cache mode: {get_cache_mode()}")
+    if reused_hashes:
+        logger.info(f"Reused {reused_hashes} hashes from the library index")
     logger.info("--- Step 13: Hash and Group Videos Completed ---")
     return True
 
@@ -1879,8 +3063,15 @@ def step13_hash_and_group_videos(config_data: dict, logger, drive_manager: Drive
 # =============================================================================
 
 def step15_hash_and_group_images(config_data: dict, logger, drive_manager: DriveManager,
-                                  metadata: Dict, results_dir: Path) -> bool:
-    """Step 15: Hash image files and group by name/size and hash."""
+                                  metadata: Dict, results_dir: Path,
+                                  library_index: Optional[LibraryIndex] = None,
+                                  groupings: Optional[Dict[str, MediaGrouping]] = None) -> bool:
+    """
+    Step 15: Hash image files and group by name/size and hash.
+
+    The grouping is saved to image_grouping_info.json and, when groupings
+    is given, also stored in groupings['image'] for step 19.
+    """
     logger.info("--- Step 15: Hash and Group Images Started ---")
 
     progress_info = config_data.get('_progress', {})
@@ -1893,14 +3084,22 @@ def step15_hash_and_group_images(config_data: dict, logger, drive_manager: Drive
     for drive in drive_manager.drives:
         for f in Path(drive).rglob('*.jpg'):
             image_paths.append(str(f))
+    image_paths = drive_manager.order_for_io(image_paths)
 
     total_images = len(image_paths)
     logger.info(f"Found {total_images} image files to process")
 
     if total_images == 0:
+        if groupings is not None:
+            groupings['image'] = MediaGrouping({}, {})
         return True
 
     # Enrich metadata with hashes
+    hashed_files = 0
+    hashed_bytes = 0
+    reused_hashes = 0
+    hash_started = time.monotonic()
+    present = []
     for idx, image_path in enumerate(image_paths, 1):
         if idx % 50 == 0 or idx == total_images:
             percent = int((idx / total_images) * 100)
@@ -1914,6 +3113,7 @@ def step15_hash_and_group_images(config_data: dict, logger, drive_manager: Drive
 
         if not os.path.exists(image_path):
             continue
+        present.append(image_path)
 
         if image_path not in metadata:
             metadata[image_path] = create_default_metadata_object(Path(image_path))
@@ -1925,40 +3125,43 @@ def step15_hash_and_group_images(config_data: dict, logger, drive_manager: Drive
         if record.get('size') is None:
             record['size'] = os.path.getsize(image_path)
         if record.get('hash') is None:
-            record['hash'] = generate_file_hash(image_path)
-
-    # Group by name and size
-    grouped_by_name_size = {}
-    grouped_by_hash = {}
+            cached = lookup_library_hash(library_index, image_path, record['size'])
+            if cached:
+                record['hash'] = cached[0]
+                if cached[1] and not record.get('partial_hash'):
+                    record['partial_hash'] = cached[1]
+                reused_hashes += 1
+            else:
+                record['hash'] = generate_file_hash(image_path)
+                hashed_files += 1
+                hashed_bytes += record['size'] or 0
 
-    for image_path in image_paths:
-        if not os.path.exists(image_path):
-            continue
-        record = metadata.get(image_path, {})
-        name = record.get("name")
-        size = record.get("size")
-        img_hash = record.get("hash")
-
-        if name and size:
-            key = f"{name}_{size}"
-            if key not in grouped_by_name_size:
-                grouped_by_name_size[key] = []
-            grouped_by_name_size[key].append(image_path)
-
-        if img_hash:
-            if img_hash not in grouped_by_hash:
-                grouped_by_hash[img_hash] = []
-            grouped_by_hash[img_hash].append(image_path)
+    # Group by name and size, and by hash
+    grouping = group_media_files(present, metadata)
+    if groupings is not None:
+        groupings['image'] = grouping
 
     grouping_info = {
-        "grouped_by_name_and_size": grouped_by_name_size,
-        "grouped_by_hash": grouped_by_hash
+        "grouped_by_name_and_size": grouping.by_name_size,
+        "grouped_by_hash": grouping.by_hash,
+        "statistics": {
+            "files": total_images,
+            "hashed_files": hashed_files,
+            "hashed_bytes": hashed_bytes,
+            "hash_seconds": round(time.monotonic() - hash_started, 2),
+            "library_hashes_reused": reused_hashes,
+            "io_cache_mode": get_cache_mode(),
+            "page_cache_hygiene": get_cache_mode() != CACHE_MODE_NORMAL
+        }
     }
 
     image_duplicates_file = results_dir / "image_grouping_info.json"
     save_metadata_atomic(grouping_info, image_duplicates_file, logger)
 
-    logger.info(f"Created {len(grouped_by_name_size)} name/size groups, {len(grouped_by_hash)} hash groups")
+    logger.info(f"Created {len(grouping.by_name_size)} name/size groups, {len(grouping.by_hash)} hash groups")
+    logger.info(f"Hashed {hashed_files} images ({hashed_bytes:,} bytes), I/O cache mode: {get_cache_mode()}")
+    if reused_hashes:
+        logger.info(f"Reused {reused_hashes} hashes from the library index")
     logger.info("--- Step 15: Hash and Group Images Completed ---")
     return True
 
@@ -1967,142 +3170,191 @@ def step15_hash_and_group_images(config_data: dict, logger, drive_manager: Drive
 # STEP 17: MARK VIDEO DUPLICATES FOR DELETION
 # =============================================================================
 
-def step17_mark_video_duplicates(config_data: dict, logger, metadata: Dict,
-                                  results_dir: Path, deletion_manifest: DeletionManifest) -> bool:
-    """Step 17: Mark exact video duplicates for deletion (does NOT delete)."""
-    logger.info("--- Step 17: Mark Video Duplicates Started ---")
+def mark_library_duplicates(metadata: Dict, hash_groups: Dict[str, List[str]],
+                            deletion_manifest: DeletionManifest, library_index: LibraryIndex,
+                            media_type: str) -> int:
+    """
+    Mark files whose content the library already holds under another path,
+    and register the rest as canonical copies for later imports.
 
-    video_grouping_file = results_dir / "video_grouping_info.json"
+    Args:
+        hash_groups: Hash groups from steps 13/15 (files known to exist); members
+            whose record no longer carries the group's hash are skipped
+        media_type: 'video' or 'image' (used in the deletion reason)
 
-    if not video_grouping_file.exists():
-        logger.info("No video grouping file found")
-        return True
+    Returns:
+        Number of files marked for deletion
+    """
+    marked = 0
+    for file_hash, paths in hash_groups.items():
+        for path in paths:
+            record = metadata.get(path)
+            if record is None or record.get('marked_for_deletion'):
+                continue
+            # The resolver clears hashes it proved stale; those files are not this hash
+            if record.get('hash') != file_hash:
+                continue
+            size = record.get('size')
+            if size is None:
+                continue
 
-    try:
-        with open(video_grouping_file, 'r') as f:
-            data = json.load(f)
-    except Exception as e:
-        logger.error(f"Failed to load video grouping: {e}")
-        return False
+            entry = library_index.lookup(size, file_hash, record.get('partial_hash'))
+            if entry is None or entry.path == canonical_path(path):
+                library_index.add(path, file_hash, size, record.get('file_id'),
+                                  record.get('partial_hash'), media_type)
+                continue
 
-    if "grouped_by_name_and_size" not in data:
-        logger.info("No groups found")
-        return True
+            # Merge metadata into the kept copy when it is part of this library's metadata
+            keeper = metadata.get(entry.path)
+            if keeper is not None:
+                for key in METADATA_LIST_KEYS:
+                    if key in record:
+                        extend_list_field(keeper, key, record[key])
 
-    groups = data["grouped_by_name_and_size"]
-    total_marked = 0
+            deletion_manifest.mark_for_deletion(
+                path,
+                reason=f"library_duplicate_{media_type}",
+                duplicate_of=entry.path,
+                file_hash=file_hash,
+                file_size=size,
+                metadata={"library_file_id": entry.file_id}
+            )
+            record['marked_for_deletion'] = True
+            record['deletion_reason'] = 'library_duplicate'
+            record['duplicate_of'] = entry.path
+            marked += 1
 
-    logger.info(f"Processing {len(groups)} groups")
+    library_index.commit()
+    return marked
 
-    for group_key, group_members in groups.items():
-        if not group_members:
-            continue
 
-        existing_files = [p for p in group_members if os.path.exists(p)]
-        if len(existing_files) < 2:
-            continue
+def load_media_grouping(grouping_file: Path) -> MediaGrouping:
+    """Read a step 13/15 grouping file (for steps 17/19 run on their own)."""
+    data = read_json(grouping_file)
+    return MediaGrouping(data.get("grouped_by_name_and_size", {}), data.get("grouped_by_hash", {}))
+
+
+def mark_exact_duplicates(config_data: dict, logger, metadata: Dict, grouping: MediaGrouping,
+                          deletion_manifest: DeletionManifest, library_index: Optional[LibraryIndex],
+                          media_type: str) -> int:
+    """
+    Mark every file whose hash group has a keeper (shared by steps 17/19).
+
+    Args:
+        grouping: Groups from step 13/15
+        media_type: 'video' or 'image' (used in the deletion reason)
+
+    Returns:
+        Number of files marked for deletion
+    """
+    settings = get_settings_from_config(config_data)
+    resolver = DuplicateResolver(metadata, settings['duplicate_keeper_policy'], library_index, logger)
+    total_marked = 0
 
-        keeper_path = existing_files[0]
-        duplicates = existing_files[1:]
+    logger.info(f"Processing {len(grouping.by_hash)} hash groups, keeper policy: {resolver.policy}")
 
-        # Merge metadata from duplicates into keeper
-        for dup_path in duplicates:
-            if dup_path in metadata and keeper_path in metadata:
-                for key in ['exif', 'filename', 'ffprobe', 'json']:
-                    if key in metadata[dup_path]:
-                        metadata[keeper_path][key].extend(metadata[dup_path][key])
+    for group in resolver.resolve(grouping.by_hash):
+        keeper_record = metadata[group.keeper]
+        for dup_path in group.duplicates:
+            record = metadata[dup_path]
+
+            # Merge metadata from duplicates into keeper
+            for key in METADATA_LIST_KEYS:
+                if key in record:
+                    extend_list_field(keeper_record, key, record[key])
 
             # Mark duplicate for deletion
             deletion_manifest.mark_for_deletion(
                 dup_path,
-                reason="exact_duplicate_video",
-                duplicate_of=keeper_path,
-                file_hash=metadata.get(dup_path, {}).get('hash'),
-                file_size=metadata.get(dup_path, {}).get('size')
+                reason=f"exact_duplicate_{media_type}",
+                duplicate_of=group.keeper,
+                file_hash=group.file_hash,
+                file_size=record.get('size')
             )
 
             # Update metadata
-            if dup_path in metadata:
-                metadata[dup_path]['marked_for_deletion'] = True
-                metadata[dup_path]['deletion_reason'] = 'exact_duplicate'
-                metadata[dup_path]['duplicate_of'] = keeper_path
-
+            record['marked_for_deletion'] = True
+            record['deletion_reason'] = 'exact_duplicate'
+            record['duplicate_of'] = group.keeper
             total_marked += 1
 
-        logger.info(f"Group {group_key}: Keeping {os.path.basename(keeper_path)}, marked {len(duplicates)} for deletion")
-
-    logger.info(f"Total videos marked for deletion: {total_marked}")
-    logger.info("--- Step 17: Mark Video Duplicates Completed (No files deleted) ---")
-    return True
-
+        if group.duplicates:
+            logger.info(f"Hash {group.file_hash[:12]}: Keeping {os.path.basename(group.keeper)}, "
+                        f"marked {len(group.duplicates)} for deletion")
 
-# =============================================================================
-# STEP 19: MARK IMAGE DUPLICATES FOR DELETION
-# =============================================================================
+    stats = resolver.stats
+    logger.info(f"{stats['groups']} duplicate groups, {stats['size_anomalies']} with mismatched sizes "
+                f"({stats['byte_compared']} byte-compared, {stats['mismatched']} not identical)")
 
-def step19_mark_image_duplicates(config_data: dict, logger, metadata: Dict,
-                                  results_dir: Path, deletion_manifest: DeletionManifest) -> bool:
-    """Step 19: Mark exact image duplicates for deletion (does NOT delete)."""
-    logger.info("--- Step 19: Mark Image Duplicates Started ---")
+    if library_index is not None:
+        library_marked = mark_library_duplicates(metadata, grouping.by_hash,
+                                                 deletion_manifest, library_index, media_type)
+        logger.info(f"{media_type.capitalize()}s already in the library: {library_marked} marked for deletion")
+        total_marked += library_marked
 
-    image_grouping_file = results_dir / "image_grouping_info.json"
+    return total_marked
 
-    if not image_grouping_file.exists():
-        logger.info("No image grouping file found")
-        return True
 
-    try:
-        with open(image_grouping_file, 'r') as f:
-            data = json.load(f)
-    except Exception as e:
-        logger.error(f"Failed to load image grouping: {e}")
-        return False
-
-    if "grouped_by_name_and_size" not in data:
-        logger.info("No groups found")
-        return True
+def step17_mark_video_duplicates(config_data: dict, logger, metadata: Dict,
+                                  results_dir: Path, deletion_manifest: DeletionManifest,
+                                  library_index: Optional[LibraryIndex] = None,
+                                  grouping: Optional[MediaGrouping] = None) -> bool:
+    """
+    Step 17: Mark exact video duplicates for deletion (does NOT delete).
 
-    groups = data["grouped_by_name_and_size"]
-    total_marked = 0
+    Uses the grouping step 13 handed over, or video_grouping_info.json
+    when run on its own.
+    """
+    logger.info("--- Step 17: Mark Video Duplicates Started ---")
 
-    logger.info(f"Processing {len(groups)} groups")
+    if grouping is None:
+        video_grouping_file = results_dir / "video_grouping_info.json"
+        if not video_grouping_file.exists():
+            logger.info("No video grouping file found")
+            return True
+        try:
+            grouping = load_media_grouping(video_grouping_file)
+        except Exception as e:
+            logger.error(f"Failed to load video grouping: {e}")
+            return False
 
-    for group_key, group_members in groups.items():
-        if not group_members:
-            continue
+    total_marked = mark_exact_duplicates(config_data, logger, metadata, grouping,
+                                         deletion_manifest, library_index, "video")
 
-        existing_files = [p for p in group_members if os.path.exists(p)]
-        if len(existing_files) < 2:
-            continue
+    logger.info(f"Total videos marked for deletion: {total_marked}")
+    logger.info("--- Step 17: Mark Video Duplicates Completed (No files deleted) ---")
+    return True
 
-        keeper_path = existing_files[0]
-        duplicates = existing_files[1:]
 
-        # Merge metadata from duplicates into keeper
-        for dup_path in duplicates:
-            if dup_path in metadata and keeper_path in metadata:
-                for key in ['exif', 'filename', 'ffprobe', 'json']:
-                    if key in metadata[dup_path]:
-                        metadata[keeper_path][key].extend(metadata[dup_path][key])
+# =============================================================================
+# STEP 19: MARK IMAGE DUPLICATES FOR DELETION
+# =============================================================================
 
-            # Mark duplicate for deletion
-            deletion_manifest.mark_for_deletion(
-                dup_path,
-                reason="exact_duplicate_image",
-                duplicate_of=keeper_path,
-                file_hash=metadata.get(dup_path, {}).get('hash'),
-                file_size=metadata.get(dup_path, {}).get('size')
-            )
+def step19_mark_image_duplicates(config_data: dict, logger, metadata: Dict,
+                                  results_dir: Path, deletion_manifest: DeletionManifest,
+                                  library_index: Optional[LibraryIndex] = None,
+                                  grouping: Optional[MediaGrouping] = None) -> bool:
+    """
+    Step 19: Mark exact image duplicates for deletion (does NOT delete).
 
-            # Update metadata
-            if dup_path in metadata:
-                metadata[dup_path]['marked_for_deletion'] = True
-                metadata[dup_path]['deletion_reason'] = 'exact_duplicate'
-                metadata[dup_path]['duplicate_of'] = keeper_path
+    Uses the grouping step 15 handed over, or image_grouping_info.json
+    when run on its own.
+    """
+    logger.info("--- Step 19: Mark Image Duplicates Started ---")
 
-            total_marked += 1
+    if grouping is None:
+        image_grouping_file = results_dir / "image_grouping_info.json"
+        if not image_grouping_file.exists():
+            logger.info("No image grouping file found")
+            return True
+        try:
+            grouping = load_media_grouping(image_grouping_file)
+        except Exception as e:
+            logger.error(f"Failed to load image grouping: {e}")
+            return False
 
-        logger.info(f"Group {group_key}: Keeping {os.path.basename(keeper_path)}, marked {len(duplicates)} for deletion")
+    total_marked = mark_exact_duplicates(config_data, logger, metadata, grouping,
+                                         deletion_manifest, library_index, "image")
 
     logger.info(f"Total images marked for deletion: {total_marked}")
     logger.info("--- Step 19: Mark Image Duplicates Completed (No files deleted) ---")
@@ -2180,6 +3432,8 @@ def step21_detect_corruption(config_data: dict, logger, drive_manager: DriveMana
                     all_videos.append(str(f))
                 elif ext in IMAGE_EXTENSIONS:
                     all_images.append(str(f))
+    all_videos = drive_manager.order_for_io(all_videos)
+    all_images = drive_manager.order_for_io(all_images)
 
     total_files = len(all_videos) + len(all_images)
     logger.info(f"Found {len(all_videos)} videos and {len(all_images)} images to check")
@@ -2251,14 +3505,15 @@ def step23_reconstruct_videos(config_data: dict, logger, metadata: Dict,
     tools = config_data.get('paths', {}).get('tools', {})
     ffmpeg_path = tools.get('ffmpeg', 'ffmpeg')
     ffprobe_path = tools.get('ffprobe', 'ffprobe')
+    ffmpeg_timeout = get_settings_from_config(config_data)['process_ffmpeg_timeout']
+    runner = get_process_runner()
 
     if not reconstruct_list_path.exists():
         logger.info("No videos to reconstruct")
         return True
 
     try:
-        with open(reconstruct_list_path, 'r') as f:
-            videos_to_reconstruct = json.load(f)
+        videos_to_reconstruct = read_json(reconstruct_list_path)
 
         if not videos_to_reconstruct:
             logger.info("Reconstruction list is empty")
@@ -2271,6 +3526,13 @@ def step23_reconstruct_videos(config_data: dict, logger, metadata: Dict,
         logger.error(f"Failed to read reconstruction list: {e}")
         return False
 
+    # Without a working ffmpeg nothing can be judged unrepairable
+    ffmpeg_profile = get_tool_profile(ffmpeg_path)
+    if ffmpeg_profile is None:
+        logger.warning(f"ffmpeg ({ffmpeg_path}) is not available, leaving videos for a later run")
+        return True
+    audio_args = ffmpeg_profile.audio_encode_args()
+
     success_count = 0
     fail_count = 0
 
@@ -2284,18 +3546,18 @@ def step23_reconstruct_videos(config_data: dict, logger, metadata: Dict,
         # Attempt 1: Stream copy
         try:
             cmd = [ffmpeg_path, '-i', video_path, '-c', 'copy', '-loglevel', 'error', '-y', temp_output_path]
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=300)
-            success = result.returncode == 0 and os.path.exists(temp_output_path)
+            result = runner.run(cmd, timeout=ffmpeg_timeout)
+            success = result.ok and os.path.exists(temp_output_path)
         except Exception:
             success = False
 
         # Attempt 2: Audio re-encode
-        if not success:
+        if not success and audio_args:
             try:
-                cmd = [ffmpeg_path, '-i', video_path, '-c:v', 'copy', '-c:a', 'aac', '-b:a', '128k',
+                cmd = [ffmpeg_path, '-i', video_path, '-c:v', 'copy', *audio_args,
                        '-loglevel', 'error', '-y', temp_output_path]
-                result = subprocess.run(cmd, capture_output=True, text=True, timeout=300)
-                success = result.returncode == 0 and os.path.exists(temp_output_path)
+                result = runner.run(cmd, timeout=ffmpeg_timeout)
+                success = result.ok and os.path.exists(temp_output_path)
             except Exception:
                 success = False
 
@@ -2365,8 +3627,7 @@ def step25_reconstruct_images(config_data: dict, logger, metadata: Dict,
         return True
 
     try:
-        with open(reconstruct_list_path, 'r') as f:
-            images_to_reconstruct = json.load(f)
+        images_to_reconstruct = read_json(reconstruct_list_path)
 
         if not images_to_reconstruct:
             logger.info("Reconstruction list is empty")
@@ -2450,20 +3711,109 @@ def step25_reconstruct_images(config_data: dict, logger, metadata: Dict,
 # STEP 27: CREATE THUMBNAILS
 # =============================================================================
 
+def _flatten_to_rgb(img):
+    """Composite transparent or palette images onto white for JPEG output."""
+    if img.mode in ('RGBA', 'LA', 'P'):
+        rgb_img = Image.new('RGB', img.size, (255, 255, 255))
+        if img.mode == 'P':
+            img = img.convert('RGBA')
+        rgb_img.paste(img, mask=img.split()[-1] if img.mode in ('RGBA', 'LA') else None)
+        img = rgb_img
+    return img
+
+
+def _save_thumbnail_pyramid(img, targets: List[Tuple[tuple, Any]], thumbnail_quality: int) -> None:
+    """
+    Save every thumbnail size from one decoded image.
+
+    Targets are processed largest first, so each level is downscaled from the
+    previous one instead of from the full-resolution source.
+
+    Args:
+        img: Decoded PIL image (already rotated)
+        targets: List of ((width, height), output) pairs; output is a path or buffer
+        thumbnail_quality: JPEG quality (1-100)
+    """
+    for box, output in sorted(targets, key=lambda t: max(t[0]), reverse=True):
+        img.thumbnail(box, Image.Resampling.LANCZOS)
+        img = _flatten_to_rgb(img)
+        img.save(output, 'JPEG', quality=thumbnail_quality)
+
+
+def _render_preview_strip(cap, frame_count: int, frames: int, frame_size: int):
+    """
+    Grab evenly spaced frames from an open capture into one strip image.
+
+    Each frame is letterboxed into a frame_size x frame_size cell so the
+    reader can split the strip without knowing the video's aspect ratio.
+    """
+    strip = Image.new('RGB', (frame_size * frames, frame_size), (0, 0, 0))
+    grabbed = 0
+    for i in range(frames):
+        cap.set(cv2.CAP_PROP_POS_FRAMES, int(frame_count * (i + 0.5) / frames))
+        ret, frame = cap.read()
+        if not ret or frame is None:
+            continue
+        img = Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+        img.thumbnail((frame_size, frame_size), Image.Resampling.BILINEAR)
+        strip.paste(img, (grabbed * frame_size + (frame_size - img.width) // 2,
+                          (frame_size - img.height) // 2))
+        grabbed += 1
+
+    if grabbed < 2:
+        return None
+    return strip.crop((0, 0, grabbed * frame_size, frame_size))
+
+
+def _ffmpeg_video_frame(ffmpeg_profile: Optional[ToolProfile], video_path, timeout: Optional[float]):
+    """
+    Grab one frame with ffmpeg as a PIL image (used when OpenCV is missing).
+
+    Tries one second in, then the first frame for very short videos.
+    """
+    if ffmpeg_profile is None or not ffmpeg_profile.has_encoder('mjpeg'):
+        return None
+    fd, frame_path = tempfile.mkstemp(suffix='.jpg')
+    os.close(fd)
+    try:
+        for seek in ('1', '0'):
+            cmd = [ffmpeg_profile.path, '-hide_banner', '-loglevel', 'error', '-ss', seek, '-i', str(video_path),
+                   '-frames:v', '1', '-q:v', '2', '-y', frame_path]
+            if get_process_runner().run(cmd, timeout=timeout).ok and os.path.getsize(frame_path) > 0:
+                with Image.open(frame_path) as img:
+                    return img.convert('RGB')
+        return None
+    finally:
+        os.remove(frame_path)
+
+
 def create_video_thumbnail(video_path, output_path, logger,
                            thumbnail_size: tuple = None,
-                           thumbnail_quality: int = None) -> bool:
+                           thumbnail_quality: int = None,
+                           pyramid_outputs: Dict[int, Any] = None,
+                           strip_output=None,
+                           strip_frames: int = 8,
+                           strip_frame_size: int = 384,
+                           ffmpeg_profile: Optional[ToolProfile] = None,
+                           ffmpeg_timeout: Optional[float] = None) -> bool:
     """
     Create a thumbnail for a video file.
 
     Args:
         video_path: Path to the video file
-        output_path: Path to save the thumbnail
+        output_path: Path or writable binary buffer to save the thumbnail
         logger: Logger instance
         thumbnail_size: Tuple of (width, height) from config settings
         thumbnail_quality: JPEG quality (1-100) from config settings
+        pyramid_outputs: Optional {level: output} for extra pyramid sizes
+        strip_output: Optional path or buffer for the animated preview strip
+        strip_frames: Number of evenly spaced frames in the preview strip
+        strip_frame_size: Cell size in pixels of each preview strip frame
+        ffmpeg_profile: Probed ffmpeg, used for the frame when OpenCV is not
+            installed (no preview strip then)
+        ffmpeg_timeout: Seconds before that ffmpeg call is killed
     """
-    if not OPENCV_AVAILABLE or not PILLOW_AVAILABLE:
+    if not PILLOW_AVAILABLE:
         return False
 
     # Use config-based settings or defaults from GUIStyle
@@ -2471,6 +3821,18 @@ def create_video_thumbnail(video_path, output_path, logger,
         thumbnail_size = DEFAULT_THUMBNAIL_SIZE
     if thumbnail_quality is None:
         thumbnail_quality = 85
+    targets = [(thumbnail_size, output_path)]
+    targets += [((level, level), out) for level, out in (pyramid_outputs or {}).items()]
+
+    if not OPENCV_AVAILABLE:
+        try:
+            img = _ffmpeg_video_frame(ffmpeg_profile, video_path, ffmpeg_timeout)
+            if img is None:
+                return False
+            _save_thumbnail_pyramid(img, targets, thumbnail_quality)
+            return True
+        except Exception:
+            return False
 
     try:
         cap = cv2.VideoCapture(str(video_path))
@@ -2482,33 +3844,78 @@ def create_video_thumbnail(video_path, output_path, logger,
             cap.set(cv2.CAP_PROP_POS_FRAMES, frame_count // 10)
 
         ret, frame = cap.read()
+
+        strip = None
+        if ret and strip_output is not None and frame_count > strip_frames:
+            try:
+                strip = _render_preview_strip(cap, frame_count, strip_frames, strip_frame_size)
+            except Exception as e:
+                logger.debug(f"Preview strip failed for {video_path}: {e}")
         cap.release()
 
         if not ret or frame is None:
             return False
 
+        if strip is not None:
+            strip.save(strip_output, 'JPEG', quality=thumbnail_quality)
+
         frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
         img = Image.fromarray(frame_rgb)
-        img.thumbnail(thumbnail_size, Image.Resampling.LANCZOS)
-        img.save(output_path, 'JPEG', quality=thumbnail_quality)
+        _save_thumbnail_pyramid(img, targets, thumbnail_quality)
         return True
 
     except Exception:
         return False
 
 
+def create_video_preview_strip(video_path, strip_output, logger,
+                               thumbnail_quality: int = 85,
+                               strip_frames: int = 8,
+                               strip_frame_size: int = 384) -> bool:
+    """
+    Create only the preview strip of a video whose thumbnails already exist.
+
+    Returns False for videos too short or unreadable for a strip.
+    """
+    if not OPENCV_AVAILABLE or not PILLOW_AVAILABLE:
+        return False
+
+    try:
+        cap = cv2.VideoCapture(str(video_path))
+        try:
+            if not cap.isOpened():
+                return False
+            frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+            if frame_count <= strip_frames:
+                return False
+            strip = _render_preview_strip(cap, frame_count, strip_frames, strip_frame_size)
+        finally:
+            cap.release()
+
+        if strip is None:
+            return False
+        strip.save(strip_output, 'JPEG', quality=thumbnail_quality)
+        return True
+
+    except Exception as e:
+        logger.debug(f"Preview strip failed for {video_path}: {e}")
+        return False
+
+
 def create_image_thumbnail(image_path, output_path, logger,
                            thumbnail_size: tuple = None,
-                           thumbnail_quality: int = None) -> bool:
+                           thumbnail_quality: int = None,
+                           pyramid_outputs: Dict[int, Any] = None) -> bool:
     """
     Create a thumbnail for an image file.
 
     Args:
         image_path: Path to the image file
-        output_path: Path to save the thumbnail
+        output_path: Path or writable binary buffer to save the thumbnail
         logger: Logger instance
         thumbnail_size: Tuple of (width, height) from config settings
         thumbnail_quality: JPEG quality (1-100) from config settings
+        pyramid_outputs: Optional {level: output} for extra pyramid sizes
     """
     if not PILLOW_AVAILABLE:
         return False
@@ -2522,21 +3929,22 @@ def create_image_thumbnail(image_path, output_path, logger,
     try:
         img = Image.open(image_path)
 
+        targets = [(thumbnail_size, output_path)]
+        targets += [((level, level), out) for level, out in (pyramid_outputs or {}).items()]
+
+        # Let the JPEG decoder skip detail no pyramid level needs
+        largest = max(max(box) for box, _ in targets)
         try:
-            img = ImageOps.exif_transpose(img)
+            img.draft('RGB', (largest, largest))
         except Exception:
             pass
 
-        img.thumbnail(thumbnail_size, Image.Resampling.LANCZOS)
-
-        if img.mode in ('RGBA', 'LA', 'P'):
-            rgb_img = Image.new('RGB', img.size, (255, 255, 255))
-            if img.mode == 'P':
-                img = img.convert('RGBA')
-            rgb_img.paste(img, mask=img.split()[-1] if img.mode in ('RGBA', 'LA') else None)
-            img = rgb_img
+        try:
+            img = ImageOps.exif_transpose(img)
+        except Exception:
+            pass
 
-        img.save(output_path, 'JPEG', quality=thumbnail_quality)
+        _save_thumbnail_pyramid(img, targets, thumbnail_quality)
         return True
 
     except Exception:
@@ -2557,11 +3965,29 @@ def step27_create_thumbnails(config_data: dict, logger, drive_manager: DriveMana
     thumbnail_size = settings['thumbnail_size']
     thumbnail_quality = settings['thumbnail_quality']
 
-    logger.info(f"Thumbnail settings: size={thumbnail_size}, quality={thumbnail_quality}")
+    thumbnail_packed = settings['thumbnail_packed']
+    pyramid_levels = settings['thumbnail_pyramid_levels']
+    preview_strips = settings['preview_strip_enabled']
+
+    logger.info(f"Thumbnail settings: size={thumbnail_size}, quality={thumbnail_quality}, "
+                f"packed={thumbnail_packed}, pyramid={pyramid_levels}, preview_strips={preview_strips}")
+
+    # Without OpenCV, video thumbnails fall back to single-frame ffmpeg grabs
+    ffmpeg_profile = None
+    if not OPENCV_AVAILABLE:
+        ffmpeg_profile = get_tool_profile(config_data.get('paths', {}).get('tools', {}).get('ffmpeg'))
+        logger.info("Video thumbnails: " + ("ffmpeg (OpenCV not installed)" if ffmpeg_profile
+                                            else "skipped (neither OpenCV nor ffmpeg available)"))
 
     thumbnails_dir = results_dir / ".thumbnails"
     thumbnails_dir.mkdir(exist_ok=True)
 
+    # Packed mode appends thumbnails to shard files instead of one JPEG per
+    # media file; thumbnail_map.json still lists the virtual .jpg paths.
+    pack_writer = None
+    if thumbnail_packed:
+        pack_writer = ThumbnailPackWriter(thumbnails_dir, settings['thumbnail_pack_shard_bytes'])
+
     media_files = []
     for drive in drive_manager.drives:
         for f in Path(drive).rglob('*'):
@@ -2569,77 +3995,409 @@ def step27_create_thumbnails(config_data: dict, logger, drive_manager: DriveMana
                 ext = f.suffix.lower()
                 if ext in VIDEO_EXTENSIONS or ext in IMAGE_EXTENSIONS:
                     media_files.append(str(f))
+    media_files = drive_manager.order_for_io(media_files)
 
     logger.info(f"Found {len(media_files)} media files to process")
 
     video_success = 0
     image_success = 0
+    strip_success = 0
     skipped = 0
     thumbnail_map = {}
 
     total_files = len(media_files)
 
-    for idx, media_path in enumerate(media_files, 1):
-        if idx % 50 == 0 or idx == total_files:
-            percent = int((idx / total_files) * 100)
-            update_pipeline_progress(
-                number_of_enabled_real_steps,
-                current_enabled_real_step,
-                "Create Thumbnails",
-                percent,
-                f"Processing: {idx}/{total_files}"
-            )
+    try:
+        for idx, media_path in enumerate(media_files, 1):
+            if idx % 50 == 0 or idx == total_files:
+                percent = int((idx / total_files) * 100)
+                update_pipeline_progress(
+                    number_of_enabled_real_steps,
+                    current_enabled_real_step,
+                    "Create Thumbnails",
+                    percent,
+                    f"Processing: {idx}/{total_files}"
+                )
 
-        path_hash = hashlib.md5(media_path.encode()).hexdigest()
-        thumbnail_filename = f"{path_hash}.jpg"
-        thumbnail_path = thumbnails_dir / thumbnail_filename
+            path_hash = hashlib.md5(media_path.encode()).hexdigest()
+            thumbnail_filename = f"{path_hash}.jpg"
+            thumbnail_path = thumbnails_dir / thumbnail_filename
 
-        if thumbnail_path.exists():
-            thumbnail_map[media_path] = str(thumbnail_path)
-            if media_path in metadata:
-                metadata[media_path]['thumbnail_path'] = str(thumbnail_path)
-            skipped += 1
-            continue
+            ext = os.path.splitext(media_path)[1].lower()
+            level_keys = {level: f"{path_hash}_{level}" for level in pyramid_levels}
+            strip_key = f"{path_hash}_strip"
+            if pack_writer is not None:
+                done = all(key in pack_writer for key in [path_hash, *level_keys.values()])
+                has_strip = strip_key in pack_writer
+            else:
+                done = all((thumbnails_dir / f"{key}.jpg").exists() for key in [path_hash, *level_keys.values()])
+                has_strip = (thumbnails_dir / f"{strip_key}.jpg").exists()
+            # Short or unreadable videos are flagged preview_strip: false and not retried
+            record = metadata.get(media_path)
+            strip_wanted = (preview_strips and OPENCV_AVAILABLE and ext in VIDEO_EXTENSIONS and not has_strip
+                            and (record is None or record.get('preview_strip') is not False))
+
+            if done:
+                thumbnail_map[media_path] = str(thumbnail_path)
+                if record is not None:
+                    record['thumbnail_path'] = str(thumbnail_path)
+                if strip_wanted:
+                    # Thumbnails from an earlier run: add just the strip
+                    strip_output = io.BytesIO() if pack_writer is not None else str(thumbnails_dir / f"{strip_key}.jpg")
+                    made = create_video_preview_strip(media_path, strip_output, logger,
+                                                      thumbnail_quality=thumbnail_quality,
+                                                      strip_frames=settings['preview_strip_frames'],
+                                                      strip_frame_size=settings['preview_strip_frame_size'])
+                    if made:
+                        if pack_writer is not None:
+                            pack_writer.add(strip_key, strip_output.getvalue())
+                        strip_success += 1
+                    if record is not None:
+                        record['preview_strip'] = made
+                skipped += 1
+                continue
 
-        ext = os.path.splitext(media_path)[1].lower()
+            if ext not in VIDEO_EXTENSIONS and ext not in IMAGE_EXTENSIONS:
+                continue
 
-        if ext in VIDEO_EXTENSIONS:
-            if create_video_thumbnail(media_path, str(thumbnail_path), logger,
-                                       thumbnail_size=thumbnail_size,
-                                       thumbnail_quality=thumbnail_quality):
-                video_success += 1
-                thumbnail_map[media_path] = str(thumbnail_path)
-                if media_path in metadata:
-                    metadata[media_path]['thumbnail_path'] = str(thumbnail_path)
+            if pack_writer is not None:
+                output = io.BytesIO()
+                pyramid_outputs = {level: io.BytesIO() for level in pyramid_levels}
+                strip_output = io.BytesIO()
             else:
-                thumbnail_map[media_path] = None
-
-        elif ext in IMAGE_EXTENSIONS:
-            if create_image_thumbnail(media_path, str(thumbnail_path), logger,
-                                       thumbnail_size=thumbnail_size,
-                                       thumbnail_quality=thumbnail_quality):
-                image_success += 1
+                output = str(thumbnail_path)
+                pyramid_outputs = {level: str(thumbnails_dir / f"{key}.jpg") for level, key in level_keys.items()}
+                strip_output = str(thumbnails_dir / f"{strip_key}.jpg")
+
+            if ext in VIDEO_EXTENSIONS:
+                created = create_video_thumbnail(media_path, output, logger,
+                                                 thumbnail_size=thumbnail_size,
+                                                 thumbnail_quality=thumbnail_quality,
+                                                 pyramid_outputs=pyramid_outputs,
+                                                 strip_output=strip_output if strip_wanted else None,
+                                                 strip_frames=settings['preview_strip_frames'],
+                                                 strip_frame_size=settings['preview_strip_frame_size'],
+                                                 ffmpeg_profile=ffmpeg_profile,
+                                                 ffmpeg_timeout=settings['process_ffmpeg_timeout'])
+            else:
+                created = create_image_thumbnail(media_path, output, logger,
+                                                 thumbnail_size=thumbnail_size,
+                                                 thumbnail_quality=thumbnail_quality,
+                                                 pyramid_outputs=pyramid_outputs)
+
+            if created:
+                if pack_writer is not None:
+                    pack_writer.add(path_hash, output.getvalue())
+                    for level, buffer in pyramid_outputs.items():
+                        pack_writer.add(level_keys[level], buffer.getvalue())
+                if strip_wanted:
+                    if pack_writer is not None:
+                        made = strip_output.getbuffer().nbytes > 0
+                        if made:
+                            pack_writer.add(strip_key, strip_output.getvalue())
+                    else:
+                        made = os.path.exists(strip_output)
+                    if made:
+                        strip_success += 1
+                    if record is not None:
+                        record['preview_strip'] = made
+                if ext in VIDEO_EXTENSIONS:
+                    video_success += 1
+                else:
+                    image_success += 1
                 thumbnail_map[media_path] = str(thumbnail_path)
                 if media_path in metadata:
                     metadata[media_path]['thumbnail_path'] = str(thumbnail_path)
             else:
                 thumbnail_map[media_path] = None
+    finally:
+        if pack_writer is not None:
+            pack_writer.close()
 
     save_metadata_atomic(thumbnail_map, results_dir / "thumbnail_map.json", logger)
 
     logger.info(f"Videos: {video_success} successful, Images: {image_success} successful, Skipped: {skipped}")
+    if preview_strips:
+        logger.info(f"Preview strips: {strip_success} created")
     logger.info("--- Step 27: Create Thumbnails Completed ---")
     return True
 
 
 # =============================================================================
-# PIPELINE RUNNER
+# STEP 29: FIND NEAR-DUPLICATE IMAGES
 # =============================================================================
 
-def run_preparation(settings: dict, progress_info: dict, logger, config_data: dict) -> bool:
-    """Run all preparation steps 1-27 in sequence with multi-drive support and no deletion."""
+def step29_find_near_duplicate_images(config_data: dict, logger, metadata: Dict, results_dir: Path) -> bool:
+    """
+    Step 29: Group visually near-identical images (does NOT mark anything).
+
+    dHash/pHash are computed from the step 27 thumbnails and cached in the
+    metadata. Groups are written to near_duplicate_images.json in the
+    relationship-set format, so the event review GUI can show them with
+    --sets-file near_duplicate_images.json.
+    """
+    logger.info("--- Step 29: Find Near-Duplicate Images Started ---")
+
+    settings = get_settings_from_config(config_data)
+    if not settings['near_duplicates_enabled']:
+        logger.info("Near-duplicate detection disabled")
+        return True
+    if not NUMPY_AVAILABLE or not PILLOW_AVAILABLE:
+        logger.warning("Near-duplicate detection needs numpy and Pillow, skipping")
+        return True
+
+    progress_info = config_data.get('_progress', {})
+    current_enabled_real_step = progress_info.get('current_enabled_real_step', 1)
+    number_of_enabled_real_steps = progress_info.get('number_of_enabled_real_steps', 1)
+
+    images = [(path, record) for path, record in metadata.items()
+              if os.path.splitext(path)[1].lower() in IMAGE_EXTENSIONS
+              and record.get('thumbnail_path') and record.get('file_id') is not None
+              and not record.get('marked_for_deletion')]
+    pending = [(path, record) for path, record in images if not record.get('phash')]
+    logger.info(f"Found {len(images)} images with thumbnails, {len(pending)} need perceptual hashes")
+
+    store = ThumbnailStore(results_dir / ".thumbnails", levels=settings['thumbnail_pyramid_levels'],
+                           base_size=max(settings['thumbnail_size']))
+    batch_size = max(1, settings['near_duplicates_batch_size'])
+    failed = 0
+    hash_started = time.monotonic()
+    try:
+        for start in range(0, len(pending), batch_size):
+            update_pipeline_progress(
+                number_of_enabled_real_steps,
+                current_enabled_real_step,
+                "Perceptual Hashes",
+                int(start / len(pending) * 100),
+                f"Hashing: {start}/{len(pending)}"
+            )
+            batch, loaded = [], []
+            for path, record in pending[start:start + batch_size]:
+                try:
+                    # Smallest pyramid level that still covers the 32x32 DCT input
+                    img = store.open_image(record['thumbnail_path'], size=PHASH_SIZE)
+                    img.load()
+                    batch.append(record)
+                    loaded.append(img)
+                except Exception as e:
+                    logger.debug(f"Could not read thumbnail of {path}: {e}")
+                    failed += 1
+            for record, (dhash, phash) in zip(batch, compute_hashes(loaded)):
+                record['dhash'] = hash_to_hex(dhash)
+                record['phash'] = hash_to_hex(phash)
+    finally:
+        store.close()
+    hash_seconds = time.monotonic() - hash_started
+
+    hashes = {}
+    paths = {}
+    for path, record in images:
+        if record.get('phash') and record.get('dhash'):
+            hashes[record['file_id']] = (hex_to_hash(record['dhash']), hex_to_hash(record['phash']))
+            paths[record['file_id']] = path
+
+    search_started = time.monotonic()
+    groups, pairs = find_near_duplicates(hashes, settings['near_duplicates_phash_radius'],
+                                         settings['near_duplicates_dhash_radius'])
+    search_seconds = time.monotonic() - search_started
+
+    grouped_keys = sorted({key for group in groups for key in group})
+    result = {
+        "file_index": {str(key): paths[key] for key in grouped_keys},
+        "E_prime": groups,
+        "pairs": [list(pair) for pair in pairs],
+        "thresholds": {
+            "phash_radius": settings['near_duplicates_phash_radius'],
+            "dhash_radius": settings['near_duplicates_dhash_radius']
+        },
+        "statistics": {
+            "images": len(hashes),
+            "hashed_images": len(pending) - failed,
+            "unreadable_thumbnails": failed,
+            "groups": len(groups),
+            "grouped_images": len(grouped_keys),
+            "hash_seconds": round(hash_seconds, 2),
+            "search_seconds": round(search_seconds, 2)
+        },
+        "extracted_at": datetime.now().isoformat()
+    }
+    save_metadata_atomic(result, results_dir / "near_duplicate_images.json", logger)
+
+    logger.info(f"Hashed {len(pending) - failed} thumbnails in {hash_seconds:.1f}s ({failed} unreadable)")
+    logger.info(f"Found {len(groups)} near-duplicate groups covering {len(grouped_keys)} images "
+                f"in {search_seconds:.1f}s")
+    logger.info("--- Step 29: Find Near-Duplicate Images Completed ---")
+    return True
+
+
+# =============================================================================
+# STEP 31: FIND NEAR-DUPLICATE VIDEOS
+# =============================================================================
+
+def _video_fingerprint(store: ThumbnailStore, video_path: str, thumbnail_path: Optional[str],
+                       frames: int, frame_size: int) -> Tuple[Optional[List[int]], Optional[str]]:
+    """
+    pHashes of evenly spaced frames of a video, and where the frames came from.
+
+    Uses the step 27 preview strip when there is one, so the video is not
+    decoded again. Otherwise grabs the frames with OpenCV the same way
+    step 27 builds a strip. Returns (None, None) if fewer than two frames
+    could be read.
+    """
+    strip, source = None, None
+    if thumbnail_path and store.exists(strip_path(thumbnail_path)):
+        strip, source = store.open_image(strip_path(thumbnail_path)).convert('RGB'), "strip"
+    elif OPENCV_AVAILABLE:
+        cap = cv2.VideoCapture(str(video_path))
+        try:
+            frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) if cap.isOpened() else 0
+            if frame_count > frames:
+                strip, source = _render_preview_strip(cap, frame_count, frames, frame_size), "decoded"
+        finally:
+            cap.release()
+    if strip is None:
+        return None, None
+
+    cells = split_preview_strip(strip)
+    if len(cells) < 2:
+        return None, None
+    return [phash for _, phash in compute_hashes(cells)], source
+
+
+def step31_find_near_duplicate_videos(config_data: dict, logger, metadata: Dict, results_dir: Path) -> bool:
+    """
+    Step 31: Group re-encoded or trimmed copies of the same video (does NOT mark anything).
+
+    A video's fingerprint is its duration plus the pHashes of K evenly
+    spaced frames, taken from the step 27 preview strip (decoded with
+    OpenCV only when there is no strip). Fingerprints are computed in a
+    thread pool and cached in the metadata. Groups are written to
+    near_duplicate_videos.json in the relationship-set format.
+    """
+    logger.info("--- Step 31: Find Near-Duplicate Videos Started ---")
+
+    settings = get_settings_from_config(config_data)
+    if not settings['near_duplicates_enabled'] or not settings['near_duplicates_videos']:
+        logger.info("Near-duplicate video detection disabled")
+        return True
+    if not NUMPY_AVAILABLE or not PILLOW_AVAILABLE:
+        logger.warning("Near-duplicate video detection needs numpy and Pillow, skipping")
+        return True
+
+    progress_info = config_data.get('_progress', {})
+    current_enabled_real_step = progress_info.get('current_enabled_real_step', 1)
+    number_of_enabled_real_steps = progress_info.get('number_of_enabled_real_steps', 1)
+
+    videos = [(path, record) for path, record in metadata.items()
+              if os.path.splitext(path)[1].lower() in VIDEO_EXTENSIONS
+              and record.get('file_id') is not None
+              and not record.get('marked_for_deletion')]
+    pending = [(path, record) for path, record in videos
+               if not record.get('video_fingerprint') or record.get('duration') is None]
+    logger.info(f"Found {len(videos)} videos, {len(pending)} need fingerprints")
+
+    store = ThumbnailStore(results_dir / ".thumbnails", levels=settings['thumbnail_pyramid_levels'],
+                           base_size=max(settings['thumbnail_size']))
+    frames = settings['preview_strip_frames']
+    frame_size = PHASH_SIZE * 4
+
+    def fingerprint(path, record):
+        duration = record.get('duration')
+        if duration is None:
+            duration = get_video_length(path, logger)
+        hashes, source = None, "cached"
+        if not record.get('video_fingerprint'):
+            hashes, source = _video_fingerprint(store, path, record.get('thumbnail_path'), frames, frame_size)
+        return duration, hashes, source
+
+    sources = {"strip": 0, "decoded": 0, "cached": 0}
+    failed = 0
+    fingerprint_started = time.monotonic()
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, settings['near_duplicates_workers'])) as pool:
+            futures = {pool.submit(fingerprint, path, record): (path, record) for path, record in pending}
+            for done, future in enumerate(concurrent.futures.as_completed(futures), 1):
+                path, record = futures[future]
+                if done % 50 == 0 or done == len(futures):
+                    update_pipeline_progress(
+                        number_of_enabled_real_steps,
+                        current_enabled_real_step,
+                        "Video Fingerprints",
+                        int(done / len(futures) * 100),
+                        f"Fingerprinting: {done}/{len(futures)}"
+                    )
+                try:
+                    duration, hashes, source = future.result()
+                except Exception as e:
+                    logger.debug(f"Could not fingerprint {path}: {e}")
+                    failed += 1
+                    continue
+                record['duration'] = duration
+                if source is None:
+                    failed += 1
+                    continue
+                sources[source] += 1
+                if hashes:
+                    record['video_fingerprint'] = [hash_to_hex(h) for h in hashes]
+    finally:
+        store.close()
+    fingerprint_seconds = time.monotonic() - fingerprint_started
+
+    fingerprints = {}
+    paths = {}
+    for path, record in videos:
+        if record.get('video_fingerprint') and record.get('duration'):
+            fingerprints[record['file_id']] = (record['duration'],
+                                               [hex_to_hash(h) for h in record['video_fingerprint']])
+            paths[record['file_id']] = path
+
+    search_started = time.monotonic()
+    groups, pairs = find_similar_videos(fingerprints,
+                                        settings['near_duplicates_frame_radius'],
+                                        settings['near_duplicates_min_score'],
+                                        settings['near_duplicates_duration_tolerance'],
+                                        settings['near_duplicates_duration_ratio'])
+    search_seconds = time.monotonic() - search_started
+
+    grouped_keys = sorted({key for group in groups for key in group})
+    result = {
+        "file_index": {str(key): paths[key] for key in grouped_keys},
+        "E_prime": groups,
+        "pairs": [list(pair) for pair in pairs],
+        "thresholds": {
+            "frame_radius": settings['near_duplicates_frame_radius'],
+            "min_score": settings['near_duplicates_min_score'],
+            "duration_tolerance": settings['near_duplicates_duration_tolerance'],
+            "duration_ratio": settings['near_duplicates_duration_ratio']
+        },
+        "statistics": {
+            "videos": len(fingerprints),
+            "fingerprints_from_strips": sources["strip"],
+            "fingerprints_decoded": sources["decoded"],
+            "unreadable_videos": failed,
+            "groups": len(groups),
+            "grouped_videos": len(grouped_keys),
+            "fingerprint_seconds": round(fingerprint_seconds, 2),
+            "search_seconds": round(search_seconds, 2)
+        },
+        "extracted_at": datetime.now().isoformat()
+    }
+    save_metadata_atomic(result, results_dir / "near_duplicate_videos.json", logger)
+
+    logger.info(f"Fingerprinted {sources['strip'] + sources['decoded']} videos in {fingerprint_seconds:.1f}s "
+                f"({sources['strip']} from preview strips, {sources['decoded']} decoded, {failed} unreadable)")
+    logger.info(f"Found {len(groups)} near-duplicate video groups covering {len(grouped_keys)} videos "
+                f"in {search_seconds:.1f}s")
+    logger.info("--- Step 31: Find Near-Duplicate Videos Completed ---")
+    return True
+
+
+# =============================================================================
+# PIPELINE RUNNER
+# =============================================================================
 
-    # Get all settings from config (uses GUIStyle/defaults if not in config)
+def create_drive_manager(config_data: dict, logger) -> Optional[DriveManager]:
+    """Build the DriveManager from config. Returns None if no drive is usable."""
     config_settings = get_settings_from_config(config_data)
     min_free_space_bytes = config_settings['min_free_space_bytes']
 
@@ -2654,11 +4412,82 @@ def run_preparation(settings: dict, progress_info: dict, logger, config_data: di
     logger.info(f"Configured output drives: {output_drives}")
 
     try:
-        drive_manager = DriveManager(output_drives, logger, min_free_space=min_free_space_bytes)
+        return DriveManager(output_drives, logger, min_free_space=min_free_space_bytes,
+                            refresh_interval=config_settings['space_refresh_seconds'],
+                            placement=config_settings['drive_placement'],
+                            io_order=config_settings['drive_io_order'])
     except ValueError as e:
         logger.critical(f"Failed to initialize drive manager: {e}")
+        return None
+
+
+def benchmark_io_order(config_data: dict, logger, drive_manager: DriveManager,
+                       sample_size: int = 200) -> Dict[str, Any]:
+    """
+    Compare files/sec for each work-list order on every output drive.
+
+    Hashes the same sample of media files in walk order, inode order and
+    extent order. Each file is evicted from the page cache before every
+    pass (where posix_fadvise exists), so each pass reads from disk.
+    Results are written to io_order_benchmark.json in the results directory.
+    """
+    results = {"sample_size": sample_size, "drives": {}, "created_at": datetime.now().isoformat()}
+
+    for drive in drive_manager.drives:
+        sample = []
+        for f in drive.rglob('*'):
+            if f.is_file() and f.suffix.lower() in VIDEO_EXTENSIONS | IMAGE_EXTENSIONS:
+                sample.append(str(f))
+                if len(sample) >= sample_size:
+                    break
+        if not sample:
+            logger.info(f"Benchmark: no media files on {drive}")
+            continue
+
+        drive_results = {"files": len(sample), "configured": drive_manager.io_order[drive],
+                         "cache_evicted": True}
+        for mode in IO_ORDERS:
+            for path in sample:
+                drive_results["cache_evicted"] &= evict_from_cache(path)
+            # The sort is timed too: steps pay for the stat/FIEMAP calls
+            started = time.monotonic()
+            ordered = sort_for_io(sample, mode)
+            for path in ordered:
+                generate_file_hash(path)
+            elapsed = time.monotonic() - started
+            drive_results[mode] = round(len(ordered) / elapsed, 1) if elapsed > 0 else None
+            logger.info(f"Benchmark {drive} [{mode}]: {drive_results[mode]} files/sec")
+
+        results["drives"][str(drive)] = drive_results
+
+    results_dir = Path(config_data['paths']['resultsDirectory'])
+    results_dir.mkdir(parents=True, exist_ok=True)
+    save_metadata_atomic(results, results_dir / "io_order_benchmark.json", logger)
+    return results
+
+
+def run_preparation(settings: dict, progress_info: dict, logger, config_data: dict) -> bool:
+    """Run all preparation steps 1-31 (as a dependency graph) with multi-drive support and no deletion."""
+
+    drive_manager = create_drive_manager(config_data, logger)
+    if drive_manager is None:
         return False
 
+    # Page-cache behaviour of bulk hashing/copying
+    requested_cache_mode = get_settings_from_config(config_data)['io_cache_mode']
+    if requested_cache_mode not in CACHE_MODES:
+        logger.warning(f"Unknown io.cacheMode '{requested_cache_mode}', using '{CACHE_MODE_NORMAL}'")
+        requested_cache_mode = CACHE_MODE_NORMAL
+    cache_mode = set_cache_mode(requested_cache_mode)
+    logger.info(f"I/O cache mode: {cache_mode}" +
+                (f" (requested {requested_cache_mode}, not supported here)"
+                 if cache_mode != requested_cache_mode else ""))
+    logger.info(f"Result JSON compression: {configure_json_output(config_data, logger)}")
+
+    # ffmpeg/ffprobe/7-Zip share one concurrency limit across all steps
+    runner = configure_process_runner(get_settings_from_config(config_data)['process_max_concurrent'], logger)
+    logger.info(f"External tools: up to {runner.max_concurrent} processes at once")
+
     # Log drive status
     for status in drive_manager.get_drive_status():
         logger.info(f"  {status['path']}: {status['free_space_gb']:.2f} GB free" +
@@ -2669,6 +4498,14 @@ def run_preparation(settings: dict, progress_info: dict, logger, config_data: di
     results_dir = Path(config_data['paths']['resultsDirectory'])
     results_dir.mkdir(parents=True, exist_ok=True)
 
+    # Probe ffmpeg/ffprobe/7-Zip once per binary; later runs reuse tool_capabilities.json
+    configure_tool_probe(results_dir, logger)
+    tools = config_data.get('paths', {}).get('tools', {})
+    for name, executable in (('ffmpeg', tools.get('ffmpeg')), ('ffprobe', tools.get('ffprobe')),
+                             ('7-Zip', find_seven_zip(config_data))):
+        profile = get_tool_profile(executable)
+        logger.info(f"  {name}: " + (f"{profile.version} ({profile.path})" if profile else "not available"))
+
     # Initialize deletion manifest
     deletion_manifest = DeletionManifest(results_dir / "deletion_manifest.json", logger)
 
@@ -2676,137 +4513,182 @@ def run_preparation(settings: dict, progress_info: dict, logger, config_data: di
     metadata_path = results_dir / "Consolidate_Meta_Results.json"
     metadata = load_metadata(metadata_path, logger)
 
-    # Track source file mappings
-    source_mapping = {}
+    # Stable file IDs; records carry theirs in 'file_id' so renames move the ID along
+    file_registry = FileRegistry.open(results_dir, logger)
+    file_registry.sync_metadata(metadata)
 
-    total_steps = 14
+    # Per-file processing history lives out of line, keyed by file ID
+    event_log = EventLog.open(results_dir, logger)
+    set_active_event_log(event_log)
+    migrated = event_log.absorb(metadata)
+    if migrated:
+        logger.info(f"Moved {migrated} processing_history entries into {event_log.log_path.name}")
 
-    # Step 1: Extract ZIP Files
-    logger.info(f"\n{'='*60}")
-    logger.info(f"Running Step 1: Extract ZIP Files (1/{total_steps})")
-    logger.info('='*60)
-    config_data['_progress'] = {'number_of_enabled_real_steps': total_steps, 'current_enabled_real_step': 1}
-    success, source_mapping = step1_extract_zip_files(config_data, logger, drive_manager)
-    if not success:
-        return False
-
-    # Update metadata with source mappings
-    for output_path, source_path in source_mapping.items():
-        if output_path not in metadata:
-            metadata[output_path] = create_default_metadata_object(
-                Path(output_path),
-                original_source_path=source_path,
-                output_drive=str(drive_manager.get_current_drive())
-            )
-        else:
-            metadata[output_path]['original_source_path'] = source_path
-
-    # Step 3: Sanitize Names
-    logger.info(f"\n{'='*60}")
-    logger.info(f"Running Step 3: Sanitize Names (2/{total_steps})")
-    logger.info('='*60)
-    config_data['_progress']['current_enabled_real_step'] = 2
-    if not step3_sanitize_names(config_data, logger, drive_manager, metadata):
-        return False
-
-    # Step 5: Map Google JSON
-    logger.info(f"\n{'='*60}")
-    logger.info(f"Running Step 5: Map Google JSON (3/{total_steps})")
-    logger.info('='*60)
-    config_data['_progress']['current_enabled_real_step'] = 3
-    if not step5_map_google_json(config_data, logger, drive_manager, metadata, deletion_manifest):
-        return False
+    # Content index of everything earlier imports kept, for library-wide deduplication
+    library_index = None
+    if get_settings_from_config(config_data)['library_index_enabled']:
+        try:
+            library_index = LibraryIndex.open(results_dir, logger, file_registry, config_data)
+            logger.info(f"Library index: {len(library_index)} files ({library_index.db_path})")
+        except Exception as e:
+            logger.warning(f"Library index unavailable, deduplicating within this run only: {e}")
 
-    # Step 7: Convert Media
-    logger.info(f"\n{'='*60}")
-    logger.info(f"Running Step 7: Convert Media (4/{total_steps})")
-    logger.info('='*60)
-    config_data['_progress']['current_enabled_real_step'] = 4
-    if not step7_convert_media(config_data, logger, drive_manager, metadata, deletion_manifest):
-        return False
+    try:
+        return _run_preparation_steps(config_data, logger, drive_manager, results_dir,
+                                      deletion_manifest, metadata_path, metadata,
+                                      file_registry, event_log, library_index)
+    finally:
+        set_active_event_log(None)
+        event_log.close()
+        if library_index is not None:
+            library_index.close()
 
-    # Step 9: Expand Metadata
-    logger.info(f"\n{'='*60}")
-    logger.info(f"Running Step 9: Expand Metadata (5/{total_steps})")
-    logger.info('='*60)
-    config_data['_progress']['current_enabled_real_step'] = 5
-    if not step9_expand_metadata(config_data, logger, drive_manager, metadata):
-        return False
 
-    # Step 11: Remove Recycle Bin
-    logger.info(f"\n{'='*60}")
-    logger.info(f"Running Step 11: Remove Recycle Bin (6/{total_steps})")
-    logger.info('='*60)
-    config_data['_progress']['current_enabled_real_step'] = 6
-    if not step11_remove_recycle_bin(config_data, logger, drive_manager, deletion_manifest):
-        return False
+def _run_preparation_steps(config_data: dict, logger, drive_manager: DriveManager, results_dir: Path,
+                           deletion_manifest: DeletionManifest, metadata_path: Path, metadata: Dict,
+                           file_registry: FileRegistry, event_log: EventLog,
+                           library_index: Optional[LibraryIndex] = None) -> bool:
+    """
+    Steps 1-31 of run_preparation(), with the registry, event log and library index already open.
 
-    # Step 13: Hash and Group Videos
-    logger.info(f"\n{'='*60}")
-    logger.info(f"Running Step 13: Hash and Group Videos (7/{total_steps})")
-    logger.info('='*60)
-    config_data['_progress']['current_enabled_real_step'] = 7
-    if not step13_hash_and_group_videos(config_data, logger, drive_manager, metadata, results_dir):
-        return False
+    The steps are declared as a dependency graph. Steps 1-11 form a chain
+    (they rename and convert files); after that, the video and image halves
+    of each stage are independent and run concurrently unless
+    settings.pipeline.execution is "sequential".
+    """
+    settings = get_settings_from_config(config_data)
 
-    # Step 15: Hash and Group Images
-    logger.info(f"\n{'='*60}")
-    logger.info(f"Running Step 15: Hash and Group Images (8/{total_steps})")
-    logger.info('='*60)
-    config_data['_progress']['current_enabled_real_step'] = 8
-    if not step15_hash_and_group_images(config_data, logger, drive_manager, metadata, results_dir):
-        return False
+    # Steps 13/15 hand their groupings to steps 17/19 in memory
+    groupings: Dict[str, MediaGrouping] = {}
 
-    # Step 17: Mark Video Duplicates
-    logger.info(f"\n{'='*60}")
-    logger.info(f"Running Step 17: Mark Video Duplicates (9/{total_steps})")
-    logger.info('='*60)
-    config_data['_progress']['current_enabled_real_step'] = 9
-    if not step17_mark_video_duplicates(config_data, logger, metadata, results_dir, deletion_manifest):
-        return False
+    def run_step1(step_config):
+        success, source_mapping, file_digests, import_modes = step1_extract_zip_files(
+            step_config, logger, drive_manager)
+        if not success:
+            return False
 
-    # Step 19: Mark Image Duplicates
-    logger.info(f"\n{'='*60}")
-    logger.info(f"Running Step 19: Mark Image Duplicates (10/{total_steps})")
-    logger.info('='*60)
-    config_data['_progress']['current_enabled_real_step'] = 10
-    if not step19_mark_image_duplicates(config_data, logger, metadata, results_dir, deletion_manifest):
-        return False
+        # Update metadata with source mappings
+        for output_path, source_path in source_mapping.items():
+            if output_path not in metadata:
+                metadata[output_path] = create_default_metadata_object(
+                    Path(output_path),
+                    original_source_path=source_path,
+                    output_drive=str(drive_manager.drive_of(Path(output_path)))
+                )
+            else:
+                metadata[output_path]['original_source_path'] = source_path
+            metadata[output_path]['import_mode'] = import_modes.get(output_path)
+
+            # Digests computed while writing spare steps 13/15 from re-reading these files
+            digests = file_digests.get(output_path)
+            if digests:
+                metadata[output_path]['hash'] = digests['hash']
+                if digests.get('partial_hash'):
+                    metadata[output_path]['partial_hash'] = digests['partial_hash']
+        file_registry.sync_metadata(metadata)
+        event_log.absorb(metadata)
+        return True
 
-    # Step 21: Detect Corruption
-    logger.info(f"\n{'='*60}")
-    logger.info(f"Running Step 21: Detect Corruption (11/{total_steps})")
-    logger.info('='*60)
-    config_data['_progress']['current_enabled_real_step'] = 11
-    if not step21_detect_corruption(config_data, logger, drive_manager, metadata, results_dir):
-        return False
+    def run_step7(step_config):
+        if not step7_convert_media(step_config, logger, drive_manager, metadata, deletion_manifest):
+            return False
+        file_registry.sync_metadata(metadata)
+        event_log.absorb(metadata)
+        return True
 
-    # Step 23: Reconstruct Videos
-    logger.info(f"\n{'='*60}")
-    logger.info(f"Running Step 23: Reconstruct Videos (12/{total_steps})")
-    logger.info('='*60)
-    config_data['_progress']['current_enabled_real_step'] = 12
-    if not step23_reconstruct_videos(config_data, logger, metadata, results_dir, deletion_manifest):
-        return False
+    def run_step9(step_config):
+        if not step9_expand_metadata(step_config, logger, drive_manager, metadata):
+            return False
+        file_registry.sync_metadata(metadata)
+        event_log.absorb(metadata)
+        file_registry.save()
+        event_log.flush()
+        return True
 
-    # Step 25: Reconstruct Images
-    logger.info(f"\n{'='*60}")
-    logger.info(f"Running Step 25: Reconstruct Images (13/{total_steps})")
-    logger.info('='*60)
-    config_data['_progress']['current_enabled_real_step'] = 13
-    if not step25_reconstruct_images(config_data, logger, metadata, results_dir, deletion_manifest):
-        return False
+    steps = [
+        PipelineStep("step1", "Step 1: Extract ZIP Files", run_step1, io_bound=True),
+        PipelineStep("step3", "Step 3: Sanitize Names",
+                     lambda c: step3_sanitize_names(c, logger, drive_manager, metadata, file_registry),
+                     after=("step1",)),
+        PipelineStep("step5", "Step 5: Map Google JSON",
+                     lambda c: step5_map_google_json(c, logger, drive_manager, metadata, deletion_manifest),
+                     after=("step3",)),
+        PipelineStep("step7", "Step 7: Convert Media", run_step7, after=("step5",), io_bound=True),
+        PipelineStep("step9", "Step 9: Expand Metadata", run_step9, after=("step7",)),
+        PipelineStep("step11", "Step 11: Remove Recycle Bin",
+                     lambda c: step11_remove_recycle_bin(c, logger, drive_manager, deletion_manifest),
+                     after=("step9",)),
+        PipelineStep("step13", "Step 13: Hash and Group Videos",
+                     lambda c: step13_hash_and_group_videos(c, logger, drive_manager, metadata, results_dir,
+                                                            library_index, groupings),
+                     after=("step11",), io_bound=True),
+        PipelineStep("step15", "Step 15: Hash and Group Images",
+                     lambda c: step15_hash_and_group_images(c, logger, drive_manager, metadata, results_dir,
+                                                            library_index, groupings),
+                     after=("step11",), io_bound=True),
+        PipelineStep("step17", "Step 17: Mark Video Duplicates",
+                     lambda c: step17_mark_video_duplicates(c, logger, metadata, results_dir, deletion_manifest,
+                                                            library_index, groupings.get('video')),
+                     after=("step13",), pool=POOL_CPU),
+        PipelineStep("step19", "Step 19: Mark Image Duplicates",
+                     lambda c: step19_mark_image_duplicates(c, logger, metadata, results_dir, deletion_manifest,
+                                                            library_index, groupings.get('image')),
+                     after=("step15",), pool=POOL_CPU),
+        PipelineStep("step21", "Step 21: Detect Corruption",
+                     lambda c: step21_detect_corruption(c, logger, drive_manager, metadata, results_dir),
+                     after=("step17", "step19"), io_bound=True),
+        PipelineStep("step23", "Step 23: Reconstruct Videos",
+                     lambda c: step23_reconstruct_videos(c, logger, metadata, results_dir, deletion_manifest),
+                     after=("step21",)),
+        PipelineStep("step25", "Step 25: Reconstruct Images",
+                     lambda c: step25_reconstruct_images(c, logger, metadata, results_dir, deletion_manifest),
+                     after=("step21",), pool=POOL_CPU),
+        PipelineStep("step27", "Step 27: Create Thumbnails",
+                     lambda c: step27_create_thumbnails(c, logger, drive_manager, metadata, results_dir),
+                     after=("step23", "step25"), io_bound=True),
+        PipelineStep("step29", "Step 29: Find Near-Duplicate Images",
+                     lambda c: step29_find_near_duplicate_images(c, logger, metadata, results_dir),
+                     after=("step27",), pool=POOL_CPU),
+        PipelineStep("step31", "Step 31: Find Near-Duplicate Videos",
+                     lambda c: step31_find_near_duplicate_videos(c, logger, metadata, results_dir),
+                     after=("step27",)),
+    ]
 
-    # Step 27: Create Thumbnails
-    logger.info(f"\n{'='*60}")
-    logger.info(f"Running Step 27: Create Thumbnails (14/{total_steps})")
-    logger.info('='*60)
-    config_data['_progress']['current_enabled_real_step'] = 14
-    if not step27_create_thumbnails(config_data, logger, drive_manager, metadata, results_dir):
+    # Spinning disks (any I/O order but none) take one streaming step at a time
+    drive_budgets = {drive: 1 if drive_manager.io_order.get(drive, IO_ORDER_NONE) != IO_ORDER_NONE
+                     else settings['pipeline_io_steps_per_drive'] for drive in drive_manager.drives}
+    graph = StepGraph(steps, config_data, logger, settings['pipeline_execution'],
+                      {POOL_IO: settings['pipeline_io_workers'], POOL_CPU: settings['pipeline_cpu_workers']},
+                      drive_budgets)
+    logger.info(f"Pipeline execution: {graph.mode}")
+    success = graph.run()
+
+    timing = graph.timings()
+    timing["processes"] = get_process_runner().stats()
+    timing["recorded_at"] = datetime.now().isoformat()
+    save_metadata_atomic(timing, results_dir / "pipeline_timing.json", logger)
+    logger.info(f"Step time {timing['step_seconds']:.1f}s in {timing['wall_seconds']:.1f}s wall, "
+                f"critical path {timing['critical_path_seconds']:.1f}s: {' -> '.join(timing['critical_path'])}")
+    for tool, stats in timing["processes"].items():
+        logger.info(f"  {tool}: {stats['runs']} runs, {stats['wall_seconds']:.1f}s wall, "
+                    f"{stats['cpu_seconds']:.1f}s CPU, {stats['failed']} failed, {stats['timed_out']} timed out")
+    if not success:
         return False
 
     # Save final metadata
-    save_metadata_atomic(metadata, metadata_path, logger)
+    file_registry.sync_metadata(metadata)
+    event_log.absorb(metadata)
+    file_registry.save()
+    event_log.flush()
+    logger.info(f"File registry: {len(file_registry)} files, {event_log.events_written} processing events logged")
+    if library_index is not None:
+        stats = library_index.summary()
+        logger.info(f"Library index: {stats['files']} files, {stats['added']} added, "
+                    f"{stats['hits']} found in the library, {stats['bloom_negatives']}/{stats['lookups']} "
+                    f"lookups answered by the Bloom filter, {stats['hashes_reused']} hashes reused")
+    if save_metadata_atomic(metadata, metadata_path, logger):
+        # Binary snapshot so the review stages open the metadata without a full parse
+        write_snapshot(metadata, snapshot_path(metadata_path), metadata_path, logger)
 
     # Save drive status
     drive_status = {
@@ -2837,10 +4719,14 @@ def run_preparation(settings: dict, progress_info: dict, logger, config_data: di
 
 def main():
     """Main entry point."""
-    parser = argparse.ArgumentParser(description="Combined Media Organizer Pipeline - Steps 1 to 27")
+    parser = argparse.ArgumentParser(description="Combined Media Organizer Pipeline - Steps 1 to 31")
     parser.add_argument('--config-file', required=True, help='Path to configuration JSON file')
-    parser.add_argument('--step', type=int, help='Run specific step only (1, 3, 5, 7, 9, 11, 13, 15, 17, 19, 21, 23, 25, 27)')
+    parser.add_argument('--step', type=int, help='Run specific step only (1, 3, 5, 7, 9, 11, 13, 15, 17, 19, 21, 23, 25, 27, 29, 31)')
     parser.add_argument('--execute-deletions', action='store_true', help='Actually delete files marked in manifest')
+    parser.add_argument('--benchmark-io-order', type=int, nargs='?', const=200, metavar='FILES',
+                        help='Compare files/sec for none/inode/extent work-list order on each drive and exit')
+    parser.add_argument('--benchmark-memory', type=int, nargs='?', const=100000, metavar='RECORDS',
+                        help='Compare memory of dict vs compact metadata records and exit')
 
     args = parser.parse_args()
 
@@ -2852,6 +4738,7 @@ def main():
         return 1
 
     logger = get_script_logger_with_config(config_data, 'combined_steps')
+    configure_json_output(config_data, logger)
 
     if args.execute_deletions:
         results_dir = Path(config_data['paths']['resultsDirectory'])
@@ -2864,6 +4751,25 @@ def main():
         logger.info(f"Deleted: {result['deleted']}, Failed: {result['failed']}")
         return 0 if result['failed'] == 0 else 1
 
+    if args.benchmark_io_order:
+        drive_manager = create_drive_manager(config_data, logger)
+        if drive_manager is None:
+            return 1
+        benchmark_io_order(config_data, logger, drive_manager, args.benchmark_io_order)
+        return 0
+
+    if args.benchmark_memory:
+        results = benchmark_memory(args.benchmark_memory)
+        results["created_at"] = datetime.now().isoformat()
+        logger.info(f"Memory benchmark ({results['records']} records): "
+                    f"dict {results['dict_bytes_per_record']} B/record, "
+                    f"MediaRecord {results['record_bytes_per_record']} B/record "
+                    f"({results['reduction_percent']}% less), lossless: {results['lossless']}")
+        results_dir = Path(config_data['paths']['resultsDirectory'])
+        results_dir.mkdir(parents=True, exist_ok=True)
+        save_metadata_atomic(results, results_dir / "memory_benchmark.json", logger)
+        return 0 if results['lossless'] else 1
+
     settings = config_data.get('settings', {})
     progress_info = {'current_step': 1, 'total_steps': 1}  # Standalone execution
     success = run_preparation(settings=settings, progress_info=progress_info, logger=logger, config_data=config_data)
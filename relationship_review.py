@@ -67,6 +67,10 @@ if str(script_dir) not in sys.path:
     sys.path.insert(0, str(script_dir))
 
 from Utils.utils import get_script_logger_with_config, update_pipeline_progress
+from Utils.thumbnail_store import ThumbnailStore, fit_image
+from Utils.file_registry import FileRegistry, canonical_path
+from Utils.jsonio import read_json, stream_json_atomic, configure_json_output
+from Utils.snapshot import load_json_or_snapshot
 
 try:
     import customtkinter as ctk
@@ -95,12 +99,15 @@ class RelationshipReviewGUI:
         self.results_dir = results_dir
         self.relationship_file = results_dir / 'relationship_sets.json'
         self.thumbnail_map_file = results_dir / 'thumbnail_map.json'
+        self.thumbnail_store = ThumbnailStore(results_dir / '.thumbnails')
         self.metadata_file = results_dir / 'Consolidate_Meta_Results.json'
         self.output_file = results_dir / 'relationship_review_results.json'
 
         # Store input/processed directories for path translation
-        self.raw_dir = os.path.normpath(os.path.abspath(config_data['paths'].get('rawDirectory', '')))
-        self.processed_dir = os.path.normpath(os.path.abspath(config_data['paths'].get('processedDirectory', '')))
+        self.raw_dir = canonical_path(config_data['paths'].get('rawDirectory', ''))
+        self.processed_dir = canonical_path(config_data['paths'].get('processedDirectory', ''))
+        self.file_registry = FileRegistry.open(results_dir, logger)
+        configure_json_output(config_data, logger)
 
         # Load data
         self.relationship_data = self._load_relationships()
@@ -167,8 +174,7 @@ class RelationshipReviewGUI:
             self.logger.error(f"Relationship file not found: {self.relationship_file}")
             return {'file_index': {}, 'T_prime': [], 'L_prime': [], 'E_prime': []}
         try:
-            with open(self.relationship_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
+            return load_json_or_snapshot(self.relationship_file, self.logger)
         except Exception as e:
             self.logger.error(f"Error loading relationships: {e}")
             return {'file_index': {}, 'T_prime': [], 'L_prime': [], 'E_prime': []}
@@ -177,9 +183,8 @@ class RelationshipReviewGUI:
         if not self.thumbnail_map_file.exists():
             return {}
         try:
-            with open(self.thumbnail_map_file, 'r', encoding='utf-8') as f:
-                raw = json.load(f)
-            return {os.path.normpath(os.path.abspath(k)): v for k, v in raw.items()}
+            raw = read_json(self.thumbnail_map_file)
+            return self.file_registry.index(raw)
         except Exception as e:
             self.logger.error(f"Error loading thumbnail map: {e}")
             return {}
@@ -188,8 +193,7 @@ class RelationshipReviewGUI:
         if not self.metadata_file.exists():
             return {}
         try:
-            with open(self.metadata_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
+            return load_json_or_snapshot(self.metadata_file, self.logger)
         except Exception as e:
             self.logger.error(f"Error loading metadata: {e}")
             return {}
@@ -200,34 +204,27 @@ class RelationshipReviewGUI:
 
         Handles cases where file_index points to input/ but thumbnail_map uses Processed/ paths.
         """
-        norm_path = os.path.normpath(os.path.abspath(file_path))
-
-        # Try direct lookup first
-        thumb_path = self.thumbnail_map.get(norm_path)
-        if thumb_path and os.path.exists(thumb_path):
+        # Direct lookup by stable file ID (follows renames recorded in the registry)
+        thumb_path = self.thumbnail_map.get(self.file_registry.id_of(file_path))
+        if thumb_path and self.thumbnail_store.exists(thumb_path):
             return thumb_path
 
+        norm_path = canonical_path(file_path)
+
         # Try translating input path to processed path
         if self.raw_dir and self.processed_dir and norm_path.startswith(self.raw_dir):
             translated = norm_path.replace(self.raw_dir, self.processed_dir, 1)
-            thumb_path = self.thumbnail_map.get(translated)
-            if thumb_path and os.path.exists(thumb_path):
+            thumb_path = self.thumbnail_map.get(self.file_registry.id_of(translated))
+            if thumb_path and self.thumbnail_store.exists(thumb_path):
                 return thumb_path
 
         # Try translating processed path to input path
         if self.raw_dir and self.processed_dir and norm_path.startswith(self.processed_dir):
             translated = norm_path.replace(self.processed_dir, self.raw_dir, 1)
-            thumb_path = self.thumbnail_map.get(translated)
-            if thumb_path and os.path.exists(thumb_path):
+            thumb_path = self.thumbnail_map.get(self.file_registry.id_of(translated))
+            if thumb_path and self.thumbnail_store.exists(thumb_path):
                 return thumb_path
 
-        # Try finding by filename only (last resort)
-        filename = os.path.basename(norm_path)
-        for map_path, thumb in self.thumbnail_map.items():
-            if os.path.basename(map_path) == filename:
-                if os.path.exists(thumb):
-                    return thumb
-
         return None
 
     def _get_e_prime_keys(self) -> Set[frozenset]:
@@ -1116,12 +1113,7 @@ class RelationshipReviewGUI:
 
         if thumb_path:
             try:
-                img = Image.open(thumb_path)
-                orig_w, orig_h = img.size
-                scale = min(size / orig_w, size / orig_h)
-                new_w = int(orig_w * scale)
-                new_h = int(orig_h * scale)
-                img = img.resize((new_w, new_h), Image.Resampling.LANCZOS)
+                img = fit_image(self.thumbnail_store.open_image(thumb_path, size), size)
 
                 photo = ImageTk.PhotoImage(img)
                 self.image_cache[cache_key] = photo
@@ -1158,11 +1150,14 @@ class RelationshipReviewGUI:
             popup.overrideredirect(True)
             popup.attributes('-topmost', True)
 
+            max_size = int(max(self.master.winfo_screenwidth(),
+                             self.master.winfo_screenheight()) * self.popup_max_screen_fraction)
+
             # Use path translation for thumbnail lookup
             thumb_path = self._get_thumbnail_path(file_path)
 
             if thumb_path:
-                img = Image.open(thumb_path)
+                img = self.thumbnail_store.open_image(thumb_path, max_size)
             elif os.path.exists(file_path):
                 img = Image.open(file_path)
             else:
@@ -1170,9 +1165,6 @@ class RelationshipReviewGUI:
                 self.hover_popup = None
                 return
 
-            max_size = int(max(self.master.winfo_screenwidth(),
-                             self.master.winfo_screenheight()) * self.popup_max_screen_fraction)
-
             orig_w, orig_h = img.size
             scale = max_size / max(orig_w, orig_h)
             new_w = int(orig_w * scale)
@@ -1407,8 +1399,7 @@ class RelationshipReviewGUI:
         }
 
         try:
-            with open(self.output_file, 'w', encoding='utf-8') as f:
-                json.dump(results, f, indent=2, ensure_ascii=False)
+            stream_json_atomic(results, self.output_file, raise_errors=True)
             self.logger.info(f"Saved relationship review results to {self.output_file}")
         except Exception as e:
             self.logger.error(f"Error saving results: {e}")
@@ -1416,8 +1407,7 @@ class RelationshipReviewGUI:
         # Apply metadata updates
         if self.metadata_updates and self.metadata_file.exists():
             try:
-                with open(self.metadata_file, 'r', encoding='utf-8') as f:
-                    metadata = json.load(f)
+                metadata = read_json(self.metadata_file)
 
                 for file_path, updates in self.metadata_updates.items():
                     if file_path in metadata:
@@ -1430,8 +1420,7 @@ class RelationshipReviewGUI:
                         if 'timestamp' in updates:
                             metadata[file_path]['propagated'][0]['timestamp'] = updates['timestamp']
 
-                with open(self.metadata_file, 'w', encoding='utf-8') as f:
-                    json.dump(metadata, f, indent=2, ensure_ascii=False)
+                stream_json_atomic(metadata, self.metadata_file, raise_errors=True)
 
                 self.logger.info(f"Applied {len(self.metadata_updates)} metadata updates")
             except Exception as e: